@@ -0,0 +1,233 @@
+"""End-to-end and micro benchmarks of scopuscite on synthetic data.
+
+Usage::
+
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 \\
+        --output bench.json --compare baseline.json
+
+The default sizes are 10k and 100k publications. The benchmarks in
+``SLOW_BENCHMARKS`` decode one entry at a time and are skipped for datasets
+larger than ``--slow-max-size``.
+
+Results are written as json, one record per benchmark and dataset size, so
+that runs of different versions can be compared with ``--compare``, which
+exits with a non-zero status if a benchmark slowed down by more than
+``--threshold``. The output file is rewritten after each benchmark; a
+benchmark that raises is recorded with its error and the run continues.
+Use ``--benchmarks`` to run only some of the benchmarks.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import numpy as np
+import pandas as pd
+
+from scopuscite.scopus import Scopus, AuthorColumns
+from scopuscite.cache import make_entry, pack, project
+from scopuscite.aggregate import aggregate_author_info, pubs_by_author, \
+    author_metrics_by_year, author_window_metrics, \
+    aggregate_author_info_chunked
+from scopuscite.download_data import write_author_to_csv
+from scopuscite.export import write_table
+
+from synthetic import generate_pubs, generate_authors, cite_info_entries, \
+    author_info_entries, YEAR_RANGE
+
+BENCHMARKS = ['decode_cite_info', 'decode_author_info',
+              'get_publication_info_warm', 'cache_save',
+              'cache_load', 'pubs_by_author', 'aggregate_author_info',
+              'author_metrics_by_year', 'author_window_metrics',
+              'aggregate_author_info_chunked',
+              'write_author_to_csv', 'write_table']
+
+# Benchmarks which loop over the entries in python.
+SLOW_BENCHMARKS = ['decode_cite_info', 'get_publication_info_warm']
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def timeit(func, repeat, setup=None):
+    '''Runs func repeat times and returns the run times in seconds.'''
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        # The library reports progress with print, which we do not time
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def decode_author_info(entries):
+    '''Decodes author retrieval entries into a dataframe.'''
+    columns = AuthorColumns()
+    columns.extend(entries)
+    return columns.frame()
+
+def write_output(filename, results):
+    '''Writes the results with a description of the environment as json.'''
+    output = {'revision' : git_revision(),
+              'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python' : platform.python_version(),
+              'numpy' : np.__version__,
+              'pandas' : pd.__version__,
+              'platform' : platform.platform(),
+              'results' : results}
+    with open(filename, 'w') as fp:
+        json.dump(output, fp, indent=2)
+
+def run_size(num_pubs, benchmarks, repeat, work_dir, results, output):
+    '''Runs the selected benchmarks on a dataset with num_pubs publications,
+    appending to results and writing them to output after each benchmark.'''
+    if not benchmarks:
+        return
+
+    print('Generating dataset with {} publications.'.format(num_pubs))
+    pubs = generate_pubs(num_pubs)
+    authors = generate_authors(pubs)
+    entries = cite_info_entries(pubs)
+    author_entries = author_info_entries(authors)
+
+    cache_dir = os.path.join(work_dir, 'cache_{}'.format(num_pubs))
+    scopus = Scopus('benchmark', cache_name='bench', cache_dir=cache_dir)
+    scopus.load_pub_info_cache()
+    for entry in entries:
+        cache_key = (entry['dc:identifier'][10:], YEAR_RANGE, 'all')
+        scopus.cache_pub_info[cache_key] = make_entry(pack(
+            project(entry, scopus.cite_info_fields), scopus.codec))
+    with contextlib.redirect_stdout(io.StringIO()):
+        scopus.save_pub_info_cache()
+    scopus_ids = list(pubs.index)
+
+    funcs = {
+        'decode_cite_info' : (lambda : [scopus.decode_cite_info(
+            e, YEAR_RANGE[0], 'all') for e in entries], None),
+        'decode_author_info' : (lambda : decode_author_info(
+            author_entries), None),
+        'get_publication_info_warm' : (lambda : scopus.get_publication_info(
+            scopus_ids, YEAR_RANGE), None),
+        'cache_save' : (scopus.save_pub_info_cache, None),
+        'cache_load' : (scopus.load_pub_info_cache, None),
+        'pubs_by_author' : (lambda : pubs_by_author(pubs), None),
+        'aggregate_author_info' : (lambda : aggregate_author_info(
+            authors, pubs), None),
+        'author_metrics_by_year' : (lambda : author_metrics_by_year(
+            authors, pubs), None),
+        'author_window_metrics' : (lambda : author_window_metrics(
+            authors, pubs), None),
+        'aggregate_author_info_chunked' : (lambda :
+            aggregate_author_info_chunked(authors,
+                (pubs.iloc[start:start+100000] \
+                    for start in range(0, len(pubs), 100000)),
+                range(*YEAR_RANGE)), None),
+        'write_author_to_csv' : (lambda : write_author_to_csv(
+            os.path.join(work_dir, 'export.csv'), authors), None),
+        'write_table' : (lambda : write_table(pubs,
+            os.path.join(work_dir, 'pubs.parquet'), year_range=YEAR_RANGE),
+            None),
+    }
+
+    for name in benchmarks:
+        func, setup = funcs[name]
+        record = {'benchmark' : name, 'num_pubs' : num_pubs,
+                  'num_authors' : len(authors), 'repeat' : repeat}
+        try:
+            times = timeit(func, repeat, setup)
+        except Exception as e:
+            record['error'] = '{}: {}'.format(type(e).__name__, e)
+            print('{:30s} {:>9d} failed, {}'.format(name, num_pubs,
+                                                   record['error']))
+        else:
+            record.update({'min' : min(times),
+                           'mean' : float(np.mean(times))})
+            print('{:30s} {:>9d} {:10.4f} s'.format(name, num_pubs,
+                                                   min(times)))
+        results.append(record)
+        write_output(output, results)
+
+def compare(results, baseline_file, threshold):
+    '''Prints the ratio of run times to a baseline and flags regressions.'''
+    with open(baseline_file, 'r') as fp:
+        baseline = json.load(fp)
+    old = {(r['benchmark'], r['num_pubs']) : r['min'] \
+            for r in baseline['results'] if 'min' in r}
+
+    print('')
+    print('Comparison with {}'.format(baseline_file))
+    num_regressions = 0
+    for r in results:
+        key = (r['benchmark'], r['num_pubs'])
+        if key not in old or 'min' not in r:
+            continue
+        ratio = r['min'] / old[key]
+        flag = ''
+        if ratio > threshold:
+            flag = 'REGRESSION'
+            num_regressions += 1
+        print('{:30s} {:>9d} {:8.2f}x {}'.format(key[0], key[1], ratio, flag))
+    return num_regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of scopuscite.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000],
+                        help='Number of publications of the datasets.')
+    parser.add_argument('--benchmarks', nargs='+', default=BENCHMARKS,
+                        choices=BENCHMARKS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--slow-max-size', type=int, default=100000,
+                        help='Largest dataset for the slow benchmarks.')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', default=None,
+                        help='Earlier output file to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Slowdown ratio reported as a regression.')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='scopuscite_bench_')
+    results = []
+    try:
+        for num_pubs in args.sizes:
+            benchmarks = [b for b in args.benchmarks
+                          if num_pubs <= args.slow_max_size
+                          or b not in SLOW_BENCHMARKS]
+            skipped = [b for b in args.benchmarks if b not in benchmarks]
+            if skipped:
+                print('Skipping {} for {} publications.'.format(
+                    ', '.join(skipped), num_pubs))
+            run_size(num_pubs, benchmarks, args.repeat, work_dir, results,
+                     args.output)
+    finally:
+        shutil.rmtree(work_dir)
+    print('Results written to {}.'.format(args.output))
+
+    failed = [r for r in results if 'error' in r]
+    if failed:
+        print('{} benchmarks failed.'.format(len(failed)))
+    num_regressions = 0
+    if args.compare is not None:
+        num_regressions = compare(results, args.compare, args.threshold)
+    if failed or num_regressions > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
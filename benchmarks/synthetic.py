@@ -0,0 +1,162 @@
+"""Generator of synthetic author and publication datasets.
+
+The datasets have the same layout as the dataframes returned by
+``Scopus.get_publication_info`` and ``Scopus.get_author_info`` and a skew
+similar to real data: the number of papers per author and of authors per
+paper follow power laws, recent years have more publications and citations
+decay over the years after publication.
+"""
+
+import numpy as np
+import pandas as pd
+
+YEAR_RANGE = (1960, 2020)
+
+def generate_pubs(num_pubs, num_authors=None, year_range=YEAR_RANGE, seed=0,
+                  chunk_size=100000):
+    '''Generates a synthetic publication dataframe.
+
+    Parameters
+    ----------
+    num_pubs : int
+        Number of publications.
+    num_authors : int, optional
+        Number of authors, by default ``num_pubs // 2``.
+    year_range : tuple
+        Citation data is generated for the years ``start, ..., end-1``.
+    seed : int
+        Seed of the random number generator.
+    chunk_size : int
+        Number of citation vectors generated at once.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Dataframe indexed by scopus_id with the same columns as returned by
+        ``Scopus.get_publication_info``.
+    '''
+
+    rng = np.random.RandomState(seed)
+    if num_authors is None:
+        num_authors = max(num_pubs // 2, 1)
+    start_year, end_year = year_range
+    num_years = end_year - start_year
+
+    # Authors per paper follow a power law, capped at 50
+    authors_per_pub = np.minimum(rng.zipf(2.5, size=num_pubs), 50)
+
+    # Papers per author follow a power law via the author popularity
+    popularity = rng.pareto(1.5, size=num_authors) + 1.
+    popularity /= popularity.sum()
+    slots = rng.choice(num_authors, size=authors_per_pub.sum(), p=popularity)
+    author_ids = np.array([str(7000000000 + i) for i in range(num_authors)],
+                          dtype=object)
+    offsets = np.concatenate([[0], np.cumsum(authors_per_pub)])
+    authors = [list(author_ids[np.unique(slots[offsets[i]:offsets[i+1]])]) \
+                for i in range(num_pubs)]
+
+    # More publications in recent years
+    years = end_year - 1 - np.minimum(rng.exponential(15., size=num_pubs),
+                                      num_years - 1).astype(np.int64)
+
+    # Citations per year decay exponentially after publication
+    impact = rng.lognormal(0., 1.2, size=num_pubs)
+    offsets_years = np.arange(num_years)[np.newaxis, :]
+    cites_by_year = []
+    for i in range(0, num_pubs, chunk_size):
+        age = start_year + offsets_years - years[i:i+chunk_size, np.newaxis]
+        rate = np.where(age >= 0, impact[i:i+chunk_size, np.newaxis] * \
+                        np.exp(-age / 8.), 0.)
+        cites_by_year.extend(rng.poisson(rate).astype(np.int64))
+
+    lcc = rng.poisson(impact * 0.5)
+    ncites = np.array([c.sum() for c in cites_by_year]) + lcc
+
+    scopus_ids = [str(84000000000 + i) for i in range(num_pubs)]
+    pubs = pd.DataFrame({
+        'scopus_id' : scopus_ids,
+        'title' : ['Synthetic publication {}'.format(i) \
+                    for i in range(num_pubs)],
+        'journal' : rng.choice(['Annals of Mathematics', 'Nature Physics',
+            'PLoS Biology', 'Inventiones Mathematicae'], size=num_pubs),
+        'year' : years,
+        'authors' : authors,
+        'cites_by_year' : cites_by_year,
+        'pcc' : np.zeros(num_pubs, dtype=np.int64),
+        'lcc' : lcc,
+        'cites_start_year' : start_year,
+        'ncites' : ncites,
+    })
+    return pubs.set_index('scopus_id')
+
+def generate_authors(pubs):
+    '''Generates an author dataframe for the authors in a publication
+    dataframe, with the columns returned by ``Scopus.get_author_info``.'''
+
+    author_ids = sorted({a for authors in pubs['authors'] for a in authors})
+    num_authors = len(author_ids)
+    rng = np.random.RandomState(len(author_ids))
+    authors = pd.DataFrame({
+        'author_id' : author_ids,
+        'name' : ['Author{} A.'.format(i) for i in range(num_authors)],
+        'first_name' : 'A.',
+        'last_name' : ['Author{}'.format(i) for i in range(num_authors)],
+        'affiliation' : rng.choice(['University of Cambridge', 'ETH Zurich',
+            'Brunel University London'], size=num_authors),
+        'first_pub' : rng.randint(1960, 2000, size=num_authors),
+        'last_pub' : rng.randint(2000, 2020, size=num_authors),
+        'npubs' : rng.randint(1, 200, size=num_authors),
+        'ncites' : rng.randint(0, 10000, size=num_authors),
+        'ncited_by' : rng.randint(0, 10000, size=num_authors),
+        'ncoauthors' : rng.randint(0, 300, size=num_authors),
+        'hindex' : rng.randint(0, 60, size=num_authors),
+    })
+    return authors.set_index('author_id')
+
+def cite_info_entries(pubs):
+    '''Converts a publication dataframe into the json entries returned by the
+    citation overview API.'''
+
+    entries = []
+    for scopus_id, row in pubs.iterrows():
+        entries.append({
+            'dc:identifier' : 'SCOPUS_ID:' + scopus_id,
+            'dc:title' : row['title'],
+            'prism:publicationName' : row['journal'],
+            'sort-year' : str(row['year']),
+            'author' : [{'authid' : a, '@seq' : str(k+1)} \
+                            for k, a in enumerate(row['authors'])],
+            'pcc' : str(row['pcc']),
+            'cc' : [{'$' : str(c)} for c in row['cites_by_year']],
+            'lcc' : str(row['lcc']),
+            'rangeCount' : str(row['cites_by_year'].sum()),
+            'rowTotal' : str(row['ncites']),
+        })
+    return entries
+
+def author_info_entries(authors):
+    '''Converts an author dataframe into the json entries returned by the
+    author retrieval API.'''
+
+    entries = []
+    for author_id, row in authors.iterrows():
+        entries.append({
+            'coredata' : {
+                'dc:identifier' : 'AUTHOR_ID:' + author_id,
+                'document-count' : str(row['npubs']),
+                'citation-count' : str(row['ncites']),
+                'cited-by-count' : str(row['ncited_by']),
+            },
+            'author-profile' : {
+                'preferred-name' : {'indexed-name' : row['name'],
+                                    'given-name' : row['first_name'],
+                                    'surname' : row['last_name']},
+                'publication-range' : {'@start' : str(row['first_pub']),
+                                       '@end' : str(row['last_pub'])},
+                'affiliation-current' : {'affiliation' : {
+                    'ip-doc' : {'afdispname' : row['affiliation']}}},
+            },
+            'coauthor-count' : str(row['ncoauthors']),
+            'h-index' : str(row['hindex']),
+        })
+    return entries
@@ -0,0 +1,5 @@
+import sys
+
+from scopuscite.cli import main
+
+sys.exit(main())
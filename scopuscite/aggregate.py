@@ -3,6 +3,8 @@ import pandas as pd
 
 from scopuscite.utils import set_union
 from scopuscite import utils
+from scopuscite.export import array_block
+from scopuscite.dataset import Dataset
 
 def pubs_by_author(pubs):
     '''
@@ -22,7 +24,7 @@ def pubs_by_author(pubs):
     
     author_pub = {}
 
-    for scopus_id, authors in pubs['authors'].iteritems():
+    for scopus_id, authors in pubs['authors'].items():
         for author in authors:
             if author in author_pub:
                 author_pub[author].add(scopus_id)
@@ -31,11 +33,15 @@ def pubs_by_author(pubs):
 
     return author_pub
 
-def aggregate_author_info(authors, pubs, year_range=None):
+def aggregate_author_info(authors, pubs, year_range=None,
+                          time_resolved=False):
     '''
     Function aggregates author level citation information from data about
     individual publications.
 
+    The columns are computed with ``ChunkedAggregator``, passing all
+    publications as one chunk.
+
     Parameters
     ----------
     authors : pandas.DataFrame
@@ -43,6 +49,10 @@ def aggregate_author_info(authors, pubs, year_range=None):
         create the index of the return.
     pubs : pandas.DataFrame
         Dataframe with publication information
+    time_resolved : bool
+        If ``True`` the columns ``ncites_acc``, ``npubs_acc`` and
+        ``hindex_acc`` are added, with the values as of the end of each year,
+        see ``author_metrics_by_year``.
 
     Returns
     -------
@@ -53,50 +63,18 @@ def aggregate_author_info(authors, pubs, year_range=None):
     if year_range is None:
         # Extract citation range from publication dataframe
         # We assume that all rows have same range
-        start_year = pubs['cites_start_year'].iloc[0]
-        end_year = start_year + len(pubs['cites_by_year'].iloc[0])
-        year_range = range(start_year, end_year)
-
-    # Organise publications by author
-    author_pubs = {k : {} for k in authors.index}
-    author_pubs.update({k : v for k, v in pubs_by_author(pubs).items() \
-                            if k in author_pubs})
-
-
-    res = pd.DataFrame(index=authors.index)
-
-    # We will recompute these statistics
-    authors = authors.drop(['npubs', 'first_pub', 'last_pub',
-        'ncites', 'ncoauthors', 'hindex'], axis=1)
-
-    # Recomupute scopus statistics using publication list
-    # We don't have data to recompute ncited_by
-    res['npubs'] = npubs(authors, author_pubs)
-    res['first_pub'] = first_pub(authors, author_pubs, pubs)
-    res['last_pub'] = last_pub(authors, author_pubs, pubs)
-    res['ncites'] = ncites(authors, author_pubs, pubs)
-    res['ncoauthors'] = ncoauthors(authors, author_pubs, pubs)
-    res['hindex'] = hindex(authors, author_pubs, pubs)
-
-    # Citations per year
-    sum_cols = ['pcc', 'cites_by_year', 'lcc']
-    for col in sum_cols:
-        res[col] = authors.index.map( \
-            lambda a : pubs[col].loc[author_pubs[a]].sum())
+        year_range = _cites_year_range(pubs)
 
-    
-    res['pubs_by_year'] = pubs_by_year(authors, author_pubs, pubs, year_range)
-    res['ncoauthors_mean'] = ncoauthors_mean(authors, author_pubs, pubs)
-    res['ncoauthors_acc'] = ncoauthors_acc( \
-        authors, author_pubs, pubs, year_range)
-
-    # TODO: Accumulated citations per paper
-    
-    # print(res.columns)
+    # All columns are computed by the chunked aggregation, with the whole
+    # publication table as one chunk
+    aggregator = ChunkedAggregator(authors, year_range)
+    aggregator.update(pubs)
+    res = aggregator.result()
 
-    # Add results to authors dataframe
-    res = authors.join(res)
-    # res = authors
+    if time_resolved:
+        metrics = author_metrics_by_year(authors, pubs, year_range)
+        for col in ['ncites', 'npubs', 'hindex']:
+            res[col + '_acc'] = list(metrics[col])
 
     return res
 
@@ -310,16 +288,566 @@ def pubs_by_year(authors, author_pubs, pubs, year_range):
         Series indexed like authors
     '''
 
-    return authors.index.map( \
-        lambda a : _pubs_by_year(pubs.loc[author_pubs[a]], year_range))
+    counts = AuthorPubIndex(authors, pubs, year_range).pubs_by_year()
+    return pd.Series(list(counts), index=authors.index)
 
-def _pubs_by_year(pubs, year_range):
-    num_years = len(year_range)
-    res = np.zeros((num_years,), dtype='int')
+def cumulative_citations(pubs, year_range=None):
+    '''Number of citations of each publication up to the end of each year.
+
+    Parameters
+    ----------
+    pubs : pandas.DataFrame
+        Dataframe with publication information.
+    year_range : range, optional
+        Years of the result, by default the years of ``cites_by_year``.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (n_pubs, n_years). Citations before the first year of
+        ``cites_by_year`` (``pcc``) are included in all years, citations
+        after its last year (``lcc``) in none.
+    '''
+
+    start_year = pubs['cites_start_year'].iloc[0] if len(pubs) > 0 else 0
+    num_years = max([len(c) for c in pubs['cites_by_year'][:1] \
+                        if isinstance(c, np.ndarray)] + [0])
+    if year_range is None:
+        year_range = range(start_year, start_year + num_years)
+
+    pcc = pubs['pcc'].values.astype(np.int64)[:, np.newaxis]
+    if num_years == 0:
+        return np.repeat(pcc, len(year_range), axis=1)
+
+    cum = pcc + np.cumsum(array_block(pubs['cites_by_year'].values,
+                                      num_years), axis=1)
+
+    # Years before the citation data only have the previous citations
+    cols = np.asarray(year_range) - start_year
+    res = cum[:, np.clip(cols, 0, num_years-1)]
+    res[:, cols < 0] = pcc
+    return res
+
+def _author_pub_pairs(authors, pubs):
+    '''Arrays of author and publication positions for all authorships.'''
+
+    lengths = pubs['authors'].map(len).values
+    pub_idx = np.repeat(np.arange(len(pubs)), lengths)
+    flat = [a for pub_authors in pubs['authors'] for a in pub_authors]
+    author_idx = pd.Index(authors.index).get_indexer(flat)
+
+    found = author_idx >= 0
+    author_idx, pub_idx = author_idx[found], pub_idx[found]
+
+    # An author listed twice on a paper counts once
+    keys = np.unique(author_idx.astype(np.int64) * len(pubs) + pub_idx)
+    return keys // max(len(pubs), 1), keys % max(len(pubs), 1)
+
+def _cites_year_range(pubs):
+    '''Years of the cites_by_year arrays, assumed equal for all rows.'''
+    start_year = pubs['cites_start_year'].iloc[0]
+    return range(start_year, start_year + len(pubs['cites_by_year'].iloc[0]))
+
+def _count_pairs(rows, cols, shape):
+    '''Counts the (row, col) pairs in a matrix of the given shape.'''
+    return np.bincount(rows * shape[1] + cols,
+                       minlength=shape[0] * shape[1]).reshape(shape)
+
+class AuthorPubIndex(object):
+    """Precomputed authorships of a set of publications.
+
+    The per-year and windowed metrics of authors are all computed from the
+    same sorted arrays of (author, publication) pairs, the publication year
+    of each pair and the citation matrix of the publications, which are
+    built once. Counts are computed with ``np.bincount`` over (author,
+    year) codes and sums over the publications of each author with
+    ``np.add.reduceat``.
+
+    Parameters
+    ----------
+    authors : pandas.DataFrame
+        Dataframe with author information. Only the index is used.
+    pubs : pandas.DataFrame
+        Dataframe with publication information.
+    year_range : range, optional
+        Consecutive years of the per-year results, by default the years of
+        ``cites_by_year``.
+    chunk_size : int
+        Number of authorships processed at once in sums over citation rows.
+    """
+
+    def __init__(self, authors, pubs, year_range=None, chunk_size=1000000):
+        if year_range is None:
+            year_range = _cites_year_range(pubs)
+        self.authors = authors
+        self.pubs = pubs
+        self.year_range = year_range
+        self.years = np.asarray(year_range, dtype=np.int64)
+        self.num_authors = len(authors)
+        self.num_years = len(self.years)
+        self.chunk_size = chunk_size
+
+        # Pairs are sorted by author
+        self.author_idx, self.pub_idx = _author_pub_pairs(authors, pubs)
+        self.uniq, self.group_start = np.unique(self.author_idx,
+                                                return_index=True)
+        self.pub_years = pubs['year'].values.astype(np.int64)[self.pub_idx]
+
+        # Citation matrix of the publications, by year of citation
+        self.cites_start = pubs['cites_start_year'].iloc[0] \
+                            if len(pubs) > 0 else 0
+        self.num_cite_years = max([len(c) for c in pubs['cites_by_year'][:1] \
+                                    if isinstance(c, np.ndarray)] + [0])
+        self._cites = None
+        self._cumulative = None
+        self._received = None
+
+    @property
+    def cites(self):
+        '''Citations of each publication in each year of cites_by_year.'''
+        if self._cites is None:
+            self._cites = array_block(self.pubs['cites_by_year'].values,
+                                      self.num_cite_years)
+        return self._cites
+
+    def _sum_rows(self, values):
+        '''Sums rows of a per-publication matrix over the publications of
+        each author.'''
+        res = np.zeros((self.num_authors,) + values.shape[1:], dtype=np.int64)
+        for start in range(0, len(self.pub_idx), self.chunk_size):
+            end = start + self.chunk_size
+            chunk_uniq, chunk_start = np.unique(self.author_idx[start:end],
+                                                return_index=True)
+            res[chunk_uniq] += np.add.reduceat(
+                values[self.pub_idx[start:end]], chunk_start, axis=0)
+        return res
+
+    def _year_counts(self, first_year, num_years):
+        '''Publications of each author in each of num_years years from
+        first_year on.'''
+        cols = self.pub_years - first_year
+        inside = (cols >= 0) & (cols < num_years)
+        return _count_pairs(self.author_idx[inside], cols[inside],
+                            (self.num_authors, num_years))
+
+    def _received_in(self, first_year, num_years):
+        '''Citations received by the publications of each author in each of
+        num_years years from first_year on, 0 outside cites_by_year.'''
+        if self._received is None:
+            self._received = self._sum_rows(self.cites)
+        cols = np.arange(first_year, first_year + num_years) - self.cites_start
+        valid = (cols >= 0) & (cols < self.num_cite_years)
+        res = np.zeros((self.num_authors, num_years), dtype=np.int64)
+        res[:, valid] = self._received[:, cols[valid]]
+        return res
+
+    @staticmethod
+    def _rolling(values, window):
+        '''Sums over the last window columns, values has window - 1 extra
+        leading columns.'''
+        cum = np.cumsum(values, axis=1)
+        cum = np.concatenate([np.zeros((len(values), 1), dtype=np.int64),
+                              cum], axis=1)
+        return cum[:, window:] - cum[:, :-window]
+
+    def pubs_by_year(self):
+        '''Publications of each author in each year, shape (n_authors,
+        n_years).'''
+        return self._year_counts(self.years[0], self.num_years)
+
+    def npubs_acc(self):
+        '''Publications of each author up to the end of each year.'''
+        before = np.bincount(self.author_idx[self.pub_years < self.years[0]],
+                             minlength=self.num_authors)
+        return before[:, np.newaxis] + np.cumsum(self.pubs_by_year(), axis=1)
+
+    def citations_by_year(self):
+        '''Citations received in each year by the publications of each
+        author.'''
+        return self._received_in(self.years[0], self.num_years)
+
+    def pub_cumulative_citations(self):
+        '''Citations of each publication up to the end of each year, see
+        ``cumulative_citations``.'''
+        if self._cumulative is None:
+            self._cumulative = cumulative_citations(self.pubs,
+                                                    self.year_range)
+        return self._cumulative
+
+    def ncites_acc(self):
+        '''Citations of the publications of each author up to the end of
+        each year, including publications of later years.'''
+        return self._sum_rows(self.pub_cumulative_citations())
+
+    def citations_within(self, k):
+        '''
+        Citations of the publications of each author received within k years
+        of publication, i.e. in the year of publication and the k - 1 years
+        after it.
+
+        Only citations in the years of ``cites_by_year`` are counted, so
+        the values of publications close to its start or end are lower
+        bounds.
+
+        Parameters
+        ----------
+        k : int
+            Length of the window in years.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (n_authors,).
+        '''
+
+        num_pubs = len(self.pubs)
+        cum = np.zeros((num_pubs, self.num_cite_years + 1), dtype=np.int64)
+        np.cumsum(self.cites, axis=1, out=cum[:, 1:])
+        start = np.clip(self.pubs['year'].values.astype(np.int64) - \
+                        self.cites_start, 0, self.num_cite_years)
+        end = np.clip(start + k, 0, self.num_cite_years)
+        rows = np.arange(num_pubs)
+        pub_cites = cum[rows, end] - cum[rows, start]
+        return self._sum_rows(pub_cites)
+
+    def rolling_pubs(self, window):
+        '''Publications of each author in the window years up to and
+        including each year, shape (n_authors, n_years).'''
+        counts = self._year_counts(self.years[0] - window + 1,
+                                   self.num_years + window - 1)
+        return self._rolling(counts, window)
+
+    def rolling_citations(self, window):
+        '''Citations received by the publications of each author in the
+        window years up to and including each year.'''
+        received = self._received_in(self.years[0] - window + 1,
+                                     self.num_years + window - 1)
+        return self._rolling(received, window)
+
+    def hindex_acc(self):
+        '''h-index of each author as of the end of each year.'''
+
+        # The h-index is the maximum of min(c_i, i) over the citation counts
+        # c_i of an author sorted in decreasing order and ranked from 1.
+        # Papers not yet published are ranked last.
+        hindex = np.zeros((self.num_authors, self.num_years), dtype=np.int64)
+        num_pairs = len(self.pub_idx)
+        if num_pairs == 0:
+            return hindex
+        cites = self.pub_cumulative_citations()
+        ranks = np.arange(num_pairs) - np.repeat(self.group_start,
+            np.diff(np.append(self.group_start, num_pairs))) + 1
+        for col in range(self.num_years):
+            counts = np.where(self.pub_years <= self.years[col],
+                              cites[self.pub_idx, col], -1)
+            order = np.lexsort((-counts, self.author_idx))
+            values = np.maximum(np.minimum(counts[order], ranks), 0)
+            hindex[self.uniq, col] = np.maximum.reduceat(values,
+                                                         self.group_start)
+        return hindex
+
+def author_metrics_by_year(authors, pubs, year_range=None,
+                           chunk_size=1000000, index=None):
+    '''Citations, publications and h-index of each author as of each year.
+
+    The values for all years are computed at once from the cumulative
+    citation matrix of the publications, so that no aggregation has to be
+    run per cutoff year.
+
+    Parameters
+    ----------
+    authors : pandas.DataFrame
+        Dataframe with author information. Only the index is used.
+    pubs : pandas.DataFrame
+        Dataframe with publication information.
+    year_range : range, optional
+        Years of the result, by default the years of ``cites_by_year``.
+    chunk_size : int
+        Number of authorships processed at once.
+    index : AuthorPubIndex, optional
+        Precomputed index of authors and pubs, built if not given.
+
+    Returns
+    -------
+    dict
+        Arrays of shape (n_authors, n_years) with keys ``'ncites'``,
+        ``'npubs'`` and ``'hindex'``, with rows ordered like authors. The
+        values for a year include all publications up to the end of that
+        year.
+    '''
+
+    if index is None:
+        index = AuthorPubIndex(authors, pubs, year_range, chunk_size)
+    return {'ncites' : index.ncites_acc(), 'npubs' : index.npubs_acc(),
+            'hindex' : index.hindex_acc()}
+
+def author_window_metrics(authors, pubs, year_range=None, within=(2, 5),
+                          window=5, index=None):
+    '''
+    Citation window and rolling window metrics of each author.
+
+    Parameters
+    ----------
+    authors : pandas.DataFrame
+        Dataframe with author information. Only the index is used.
+    pubs : pandas.DataFrame
+        Dataframe with publication information.
+    year_range : range, optional
+        Years of the rolling windows, by default the years of
+        ``cites_by_year``.
+    within : iterable of int
+        For each k the column ``ncites_<k>y`` counts the citations received
+        within k years of publication, see
+        ``AuthorPubIndex.citations_within``.
+    window : int
+        Length of the rolling windows in years.
+    index : AuthorPubIndex, optional
+        Precomputed index of authors and pubs, built if not given.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Dataframe indexed like authors with the ``ncites_<k>y`` columns and
+        the per-year array columns ``npubs_rolling`` and ``ncites_rolling``,
+        the publications and citations received in the window years up to
+        each year.
+    '''
+
+    if index is None:
+        index = AuthorPubIndex(authors, pubs, year_range)
+    res = pd.DataFrame(index=authors.index)
+    for k in within:
+        res['ncites_{}y'.format(k)] = index.citations_within(k)
+    res['npubs_rolling'] = list(index.rolling_pubs(window))
+    res['ncites_rolling'] = list(index.rolling_citations(window))
+    return res
 
-    for _, year in pubs['year'].iteritems():
-        if not year in year_range:
-            continue
-        res[year_range.index(year)] += 1
+# Columns read from publication chunks by the out-of-core aggregation
+CHUNKED_COLUMNS = ['year', 'authors', 'ncites', 'pcc', 'lcc', 'cites_by_year']
+
+def _group_reduce(ufunc, values, group_start):
+    '''Reduces values over consecutive groups starting at group_start.'''
+    return ufunc.reduceat(values, group_start, axis=0)
+
+class ChunkedAggregator(object):
+    """Out-of-core version of ``aggregate_author_info``.
+
+    Publications are passed in chunks to ``update`` and added to running
+    per-author accumulators, so that the publication table never has to be
+    in memory at once. Next to sums and minima/maxima, the accumulators are
+
+    * the per-year citation and publication counts of each author,
+    * a histogram of the citation counts of the papers of each author, from
+      which counts below the current h-index are dropped since they can no
+      longer raise it,
+    * the year in which each coauthor of an author first appears.
+
+    Memory is thus proportional to the number of authors and their coauthors
+    rather than to the number of publications. Every publication has to be
+    passed exactly once. ``aggregate_author_info`` passes all publications as
+    a single chunk.
+
+    Parameters
+    ----------
+    authors : pandas.DataFrame
+        Dataframe with author information.
+    year_range : range or tuple
+        Years of the per-year columns.
+    """
+
+    def __init__(self, authors, year_range):
+        self.authors = authors
+        self.year_range = range(*year_range) \
+                            if isinstance(year_range, tuple) else year_range
+        num_authors, num_years = len(authors), len(self.year_range)
+
+        self.npubs = np.zeros(num_authors, dtype=np.int64)
+        self.first_pub = np.full(num_authors, np.iinfo(np.int64).max)
+        self.last_pub = np.full(num_authors, np.iinfo(np.int64).min)
+        self.ncites = np.zeros(num_authors, dtype=np.int64)
+        self.pcc = np.zeros(num_authors, dtype=np.int64)
+        self.lcc = np.zeros(num_authors, dtype=np.int64)
+        self.ncoauthors_sum = np.zeros(num_authors, dtype=np.int64)
+        self.cites_by_year = np.zeros((num_authors, num_years),
+                                      dtype=np.int64)
+        self.pubs_by_year = np.zeros((num_authors, num_years),
+                                     dtype=np.int64)
+
+        # Citation histogram as sorted (author, citations) keys with counts
+        self._hist_keys = np.zeros(0, dtype=np.int64)
+        self._hist_counts = np.zeros(0, dtype=np.int64)
+        self.hindex = np.zeros(num_authors, dtype=np.int64)
+
+        # Sorted (author, coauthor) keys with the year they first appear.
+        # Authors keep their position as coauthor code.
+        self._coauthor_codes = {a : idx for idx, a in enumerate(authors.index)}
+        self._coauthor_keys = np.zeros(0, dtype=np.int64)
+        self._coauthor_years = np.zeros(0, dtype=np.int64)
+
+    def update(self, pubs):
+        '''Adds a chunk of publications to the accumulators.'''
+        if len(pubs) == 0:
+            return
+
+        # Pairs are sorted by author
+        author_idx, pub_idx = _author_pub_pairs(self.authors, pubs)
+        if len(author_idx) == 0:
+            return
+        uniq, group_start = np.unique(author_idx, return_index=True)
+        years = pubs['year'].values.astype(np.int64)[pub_idx]
+        lengths = pubs['authors'].map(len).values.astype(np.int64)
+
+        self.npubs[uniq] += np.diff(np.append(group_start, len(author_idx)))
+        self.first_pub[uniq] = np.minimum(self.first_pub[uniq],
+            _group_reduce(np.minimum, years, group_start))
+        self.last_pub[uniq] = np.maximum(self.last_pub[uniq],
+            _group_reduce(np.maximum, years, group_start))
+        for name in ['ncites', 'pcc', 'lcc']:
+            values = pubs[name].values.astype(np.int64)[pub_idx]
+            getattr(self, name)[uniq] += \
+                _group_reduce(np.add, values, group_start)
+        self.ncoauthors_sum[uniq] += \
+            _group_reduce(np.add, lengths[pub_idx] - 1, group_start)
+
+        num_years = len(self.year_range)
+        block = array_block(pubs['cites_by_year'].values, num_years)
+        self.cites_by_year[uniq] += \
+            _group_reduce(np.add, block[pub_idx], group_start)
+        cols = years - self.year_range.start
+        inside = (cols >= 0) & (cols < num_years)
+        self.pubs_by_year += _count_pairs(author_idx[inside], cols[inside],
+                                          self.pubs_by_year.shape)
+
+        self._update_hindex(author_idx,
+                            pubs['ncites'].values.astype(np.int64)[pub_idx])
+        self._update_coauthors(pubs, author_idx, pub_idx, years, lengths)
+
+    def _update_hindex(self, author_idx, cites):
+        '''Merges citation counts into the histograms and updates the
+        h-index.'''
+        keys = np.concatenate([self._hist_keys,
+                               (author_idx << 32) | np.maximum(cites, 0)])
+        counts = np.concatenate([self._hist_counts,
+                                 np.ones(len(cites), dtype=np.int64)])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        authors, cites = keys >> 32, keys & 0xffffffff
+
+        # Number of papers with at least as many citations, counted from the
+        # end of each author's group of increasing citation counts
+        uniq, group_start = np.unique(authors, return_index=True)
+        group_end = np.append(group_start[1:], len(keys))
+        total = np.cumsum(counts)
+        group_total = np.repeat(total[group_end - 1], group_end - group_start)
+        at_least = group_total - total + counts
+        self.hindex[uniq] = np.maximum(self.hindex[uniq],
+            np.maximum.reduceat(np.minimum(cites, at_least), group_start))
+
+        keep = cites >= self.hindex[authors]
+        self._hist_keys, self._hist_counts = keys[keep], counts[keep]
+
+    def _update_coauthors(self, pubs, author_idx, pub_idx, years, lengths):
+        '''Records the first year of each new coauthor.'''
+        codes = self._coauthor_codes
+        flat = np.array([codes.setdefault(a, len(codes)) \
+                            for pub_authors in pubs['authors'] \
+                            for a in pub_authors], dtype=np.int64)
+        offsets = np.cumsum(lengths) - lengths
+
+        # All authors of the paper of each authorship, including the author
+        rep = lengths[pub_idx]
+        pos = np.repeat(offsets[pub_idx] - np.cumsum(rep) + rep, rep) + \
+                np.arange(rep.sum())
+        keys = np.concatenate([self._coauthor_keys,
+                               (np.repeat(author_idx, rep) << 32) | flat[pos]])
+        years = np.concatenate([self._coauthor_years, np.repeat(years, rep)])
+
+        order = np.argsort(keys)
+        keys = keys[order]
+        first = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+        self._coauthor_keys = keys[first]
+        self._coauthor_years = np.minimum.reduceat(years[order], first)
+
+    def result(self):
+        '''
+        Aggregated author information of all chunks passed so far.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe with same index as authors with computed columns.
+        '''
+
+        num_authors, num_years = len(self.authors), len(self.year_range)
+        has_pubs = self.npubs > 0
+        res = pd.DataFrame(index=self.authors.index)
+
+        res['npubs'] = self.npubs
+        for name in ['first_pub', 'last_pub']:
+            values = getattr(self, name)
+            res[name] = values if has_pubs.all() else \
+                            np.where(has_pubs, values, np.nan)
+        res['ncites'] = self.ncites
+        coauthor_authors = self._coauthor_keys >> 32
+        res['ncoauthors'] = np.bincount(coauthor_authors,
+                                        minlength=num_authors) - 1
+        res['hindex'] = self.hindex
+        res['pcc'] = self.pcc
+        res['cites_by_year'] = [row if has else 0 for row, has \
+                                in zip(self.cites_by_year, has_pubs)]
+        res['lcc'] = self.lcc
+        res['pubs_by_year'] = list(self.pubs_by_year)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            res['ncoauthors_mean'] = self.ncoauthors_sum / self.npubs
+
+        # Coauthors are counted from the year they first appear, those of
+        # earlier years in the first year
+        cols = np.maximum(self._coauthor_years - self.year_range.start, 0)
+        inside = cols < num_years
+        acc = np.bincount(coauthor_authors[inside] * num_years + cols[inside],
+                          minlength=num_authors * num_years)
+        res['ncoauthors_acc'] = list(
+            np.cumsum(acc.reshape(num_authors, num_years), axis=1))
+
+        authors = self.authors.drop(['npubs', 'first_pub', 'last_pub',
+            'ncites', 'ncoauthors', 'hindex'], axis=1)
+        return authors.join(res)
+
+def aggregate_author_info_chunked(authors, pub_chunks, year_range=None,
+                                  chunk_size=100000):
+    '''
+    Aggregates author information from publications read in chunks.
+
+    Parameters
+    ----------
+    authors : pandas.DataFrame
+        Dataframe with author information.
+    pub_chunks : str or iterable
+        Path of a publication dataset (see ``scopuscite.dataset``), which is
+        read in chunks, or an iterable of publication dataframes, e.g. read
+        one by one from disk. Every publication has to appear exactly once.
+    year_range : range or tuple, optional
+        Years of the per-year columns. Required unless pub_chunks is a
+        dataset with a year range.
+    chunk_size : int
+        Number of publications read at once from a dataset.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Same as ``aggregate_author_info``, with memory proportional to the
+        number of authors and coauthors rather than publications.
+    '''
+
+    if isinstance(pub_chunks, str):
+        dataset = Dataset(pub_chunks)
+        if year_range is None:
+            year_range = dataset.year_range
+        pub_chunks = dataset.iter_chunks(chunk_size, columns=CHUNKED_COLUMNS)
+    if year_range is None:
+        raise ValueError('year_range is required for publication chunks.')
 
-    return res
\ No newline at end of file
+    aggregator = ChunkedAggregator(authors, year_range)
+    for pubs in pub_chunks:
+        aggregator.update(pubs)
+    return aggregator.result()
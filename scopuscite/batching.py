@@ -0,0 +1,191 @@
+"""Adaptive batch sizes and coalescing of id lookups.
+
+The number of ids per call and results per page are adapted to the observed
+latency and errors of the calls: after a fast successful call the size grows
+by a fixed step, after a slow or failed call it is halved (additive
+increase, multiplicative decrease). Sizes never exceed the limits of the
+Scopus API.
+
+Lookups of the same endpoint from several threads are coalesced: pending
+ids of all callers are merged into full batches, ids that are already being
+fetched are not requested again, and every caller receives the results for
+its own ids.
+
+Example
+-------
+>>> size = AdaptiveSize(25, maximum=MAX_CITATION_BATCH)
+>>> coalescer = RequestCoalescer(fetch_citations, size)
+>>> results = coalescer.get(scopus_ids)
+"""
+
+import concurrent.futures
+import threading
+import time
+
+# Results per call accepted by the Scopus API
+MAX_SEARCH_PAGE = 200
+MAX_AUTHOR_BATCH = 25
+MAX_CITATION_BATCH = 25
+
+class FetchError(Exception):
+    """Raised when a batch could not be fetched."""
+
+class AdaptiveSize(object):
+    """Batch or page size adapted to the latency and errors of the calls.
+
+    Parameters
+    ----------
+    initial : int
+        Size of the first call.
+    maximum : int
+        Largest size, e.g. the limit of the API.
+    minimum : int
+        Smallest size.
+    target_latency : float
+        Calls slower than this, in seconds, shrink the size.
+    step : int, optional
+        Increase after a fast call, by default a tenth of ``maximum``.
+    backoff : float
+        Factor applied after a slow or failed call.
+    """
+
+    def __init__(self, initial, maximum, minimum=1, target_latency=5.,
+                 step=None, backoff=0.5):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.target_latency = target_latency
+        self.step = step if step is not None else max(maximum // 10, 1)
+        self.backoff = backoff
+        self._size = float(min(max(initial, minimum), maximum))
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        '''Current size.'''
+        return int(self._size)
+
+    def success(self, latency):
+        '''Adapts the size after a successful call taking latency seconds.'''
+        with self._lock:
+            if latency > self.target_latency:
+                self._size = max(self._size * self.backoff, self.minimum)
+            else:
+                self._size = min(self._size + self.step, self.maximum)
+
+    def failure(self):
+        '''Shrinks the size after a failed call.'''
+        with self._lock:
+            self._size = max(self._size * self.backoff, self.minimum)
+
+    def __repr__(self):
+        return 'AdaptiveSize({}, maximum={})'.format(self.value, self.maximum)
+
+class RequestCoalescer(object):
+    """Merges id lookups of concurrent callers into batches.
+
+    Parameters
+    ----------
+    fetch : callable
+        Function mapping a list of ids to a dict with the result of each id.
+        Ids missing from the dict have no result. Raises ``FetchError`` if
+        the batch could not be fetched.
+    size : AdaptiveSize or int
+        Number of ids per batch.
+    max_wait : float
+        Seconds a caller with an incomplete batch waits for other callers
+        to fill it.
+    """
+
+    def __init__(self, fetch, size, max_wait=0.05):
+        self.fetch = fetch
+        self.size = size
+        self.max_wait = max_wait
+        self.num_batches = 0
+        self.num_deduplicated = 0
+        self._pending = []
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def batch_size(self):
+        '''Current number of ids per batch.'''
+        return self.size if isinstance(self.size, int) else self.size.value
+
+    def _take(self, full_only):
+        '''Removes the next batch from the pending ids, if there is one.'''
+        with self._lock:
+            size = self.batch_size()
+            if not self._pending or \
+                (full_only and len(self._pending) < size):
+                return None
+            batch = self._pending[:size]
+            del self._pending[:size]
+            self.num_batches += 1
+            return batch
+
+    def _run(self, batch):
+        '''Fetches a batch and hands the results to the waiting callers.'''
+        results, error = {}, None
+        try:
+            results = self.fetch(batch)
+        except BaseException as e:
+            error = e
+        with self._lock:
+            futures = [self._futures.pop(i) for i in batch]
+        for i, future in zip(batch, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(i))
+        # Unexpected errors are also raised in the fetching thread
+        if error is not None and not isinstance(error, FetchError):
+            raise error
+
+    def get(self, ids):
+        '''
+        Looks up ids, together with the lookups of other callers.
+
+        Parameters
+        ----------
+        ids : list
+            Ids to look up.
+
+        Returns
+        -------
+        dict
+            Result for each id, ``None`` if there is none.
+
+        Raises
+        ------
+        FetchError
+            If a batch containing one of the ids could not be fetched.
+        '''
+
+        futures = {}
+        with self._lock:
+            for i in ids:
+                if i in futures:
+                    continue
+                if i in self._futures:
+                    self.num_deduplicated += 1
+                else:
+                    self._futures[i] = concurrent.futures.Future()
+                    self._pending.append(i)
+                futures[i] = self._futures[i]
+
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            undone = [f for f in futures.values() if not f.done()]
+            if not undone:
+                break
+            remaining = deadline - time.monotonic()
+            batch = self._take(full_only=remaining > 0)
+            if batch is not None:
+                self._run(batch)
+            elif remaining > 0:
+                # Give other callers a chance to fill the batch
+                concurrent.futures.wait(undone, timeout=remaining)
+            else:
+                # The remaining ids are being fetched by other callers
+                concurrent.futures.wait(undone)
+
+        return {i : future.result() for i, future in futures.items()}
@@ -0,0 +1,338 @@
+"""Helpers for the local caches of the Scopus object.
+
+Every cache entry is stored as a pair ``(timestamp, value)`` where timestamp
+is the time (seconds since the epoch) at which the value was fetched from
+Scopus. Entries written by older versions of the library contain only the
+value; they are treated as having been fetched at time 0, i.e. they are the
+stalest entries in the cache.
+
+The raw json responses of the publication and author caches can be reduced to
+the fields read by the decoders with ``project`` and stored as compressed
+bytes with ``pack``. Packed entries are only decoded when they are read, with
+the fastest json backend available (see ``scopuscite.jsonlib``).
+
+Cache files can be shared between processes, also on different hosts using
+the same filesystem. ``save_cache`` takes an exclusive lock on the file,
+merges the entries written by other processes since the last load, keeping
+the most recently fetched version of each entry, and atomically replaces the
+file.
+"""
+
+import contextlib
+import lzma
+import os
+import pickle
+import socket
+import threading
+import time
+import zlib
+
+from scopuscite import jsonlib
+
+try:
+    import fcntl
+except ImportError:
+    # File locking is not available on this platform
+    fcntl = None
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def make_entry(value, timestamp=None):
+    '''Wraps a value together with its fetch timestamp.'''
+    if timestamp is None:
+        timestamp = time.time()
+    return (float(timestamp), value)
+
+def is_entry(entry):
+    '''Tests if entry is a timestamped cache entry.'''
+    return isinstance(entry, tuple) and len(entry) == 2 \
+            and isinstance(entry[0], float)
+
+def entry_value(entry):
+    '''Returns the value stored in a cache entry.'''
+    return entry[1] if is_entry(entry) else entry
+
+def entry_time(entry):
+    '''Returns the fetch timestamp of a cache entry, 0 for legacy entries.'''
+    return entry[0] if is_entry(entry) else 0.
+
+def entry_age(entry, now=None):
+    '''Returns the age of a cache entry in days.'''
+    if now is None:
+        now = time.time()
+    return (now - entry_time(entry)) / SECONDS_PER_DAY
+
+def stale_keys(cache, keys, ttl, budget=None, score=None, now=None):
+    '''Selects cached keys whose entries are older than a given TTL.
+
+    Parameters
+    ----------
+    cache : dict
+        Cache with timestamped entries.
+    keys : iterable
+        Keys to consider. Keys not in the cache are ignored.
+    ttl : float or None
+        Maximum age of an entry in days. If ``None``, entries never expire.
+    budget : int, optional
+        Maximum number of keys to return.
+    score : callable, optional
+        Function mapping a cache value to a priority. Entries with higher
+        scores are returned first, ties are broken by age. If ``None``, the
+        stalest entries are returned first.
+    now : float, optional
+        Reference time, defaults to the current time.
+
+    Returns
+    -------
+    list
+        Stale keys, ordered by priority.
+    '''
+
+    if ttl is None:
+        return []
+    if now is None:
+        now = time.time()
+
+    stale = [key for key in keys if key in cache and \
+                entry_age(cache[key], now) > ttl]
+
+    if score is None:
+        sort_key = lambda k : entry_time(cache[k])
+    else:
+        sort_key = lambda k : (-score(entry_value(cache[k])),
+                               entry_time(cache[k]))
+    stale.sort(key=sort_key)
+
+    if budget is not None:
+        stale = stale[:budget]
+    return stale
+
+# Fields of the json responses read by Scopus.decode_cite_info and
+# Scopus.decode_author_response. A value of True keeps the whole subtree, a
+# dict keeps only the listed fields. Lists are projected element-wise.
+CITE_INFO_FIELDS = {
+    'dc:identifier' : True,
+    'dc:title' : True,
+    'prism:publicationName' : True,
+    'prism:issn' : True,
+    'sort-year' : True,
+    'author' : {'authid' : True},
+    'cc' : {'$' : True},
+    'pcc' : True,
+    'lcc' : True,
+}
+
+AUTHOR_INFO_FIELDS = {
+    'coredata' : {
+        'dc:identifier' : True,
+        'document-count' : True,
+        'citation-count' : True,
+        'cited-by-count' : True,
+    },
+    'author-profile' : {
+        'alias' : True,
+        'preferred-name' : {
+            'indexed-name' : True,
+            'given-name' : True,
+            'surname' : True,
+        },
+        'publication-range' : True,
+        'affiliation-current' : {
+            'affiliation' : {'ip-doc' : {'afdispname' : True}},
+        },
+    },
+    'coauthor-count' : True,
+    'h-index' : True,
+}
+
+def extend_fields(fields, allowlist):
+    '''Adds fields to a projection specification.
+
+    Parameters
+    ----------
+    fields : dict
+        Projection specification, e.g. ``CITE_INFO_FIELDS``.
+    allowlist : iterable of str
+        Additional fields to keep. Nested fields are given as paths separated
+        by dots, e.g. ``'author-profile.subject-areas'``.
+
+    Returns
+    -------
+    dict
+        New projection specification.
+    '''
+
+    def _copy(spec):
+        if spec is True:
+            return True
+        return {k : _copy(v) for k, v in spec.items()}
+
+    res = _copy(fields)
+    for path in allowlist:
+        spec = res
+        names = path.split('.')
+        for name in names[:-1]:
+            if spec.get(name) is True:
+                break
+            spec = spec.setdefault(name, {})
+        else:
+            spec[names[-1]] = True
+    return res
+
+def project(obj, fields):
+    '''Keeps only the fields in the projection specification of a json object.
+
+    Parameters
+    ----------
+    obj : dict, list or scalar
+        Parsed json object.
+    fields : dict or True
+        Projection specification, see ``CITE_INFO_FIELDS``.
+
+    Returns
+    -------
+    Projected json object.
+    '''
+
+    if fields is True:
+        return obj
+    if isinstance(obj, list):
+        return [project(x, fields) for x in obj]
+    if not isinstance(obj, dict):
+        return obj
+    return {k : project(obj[k], v) for k, v in fields.items() if k in obj}
+
+# Codecs to store json objects in the caches. The first byte of a packed value
+# identifies the codec.
+CODECS = {
+    'zlib' : b'z',
+    'lzma' : b'x',
+    None : b'j',
+}
+
+def pack(obj, codec='zlib'):
+    '''Serializes a json object into compact, optionally compressed, bytes.
+
+    Parameters
+    ----------
+    obj : dict
+        Parsed json object.
+    codec : str or None
+        One of ``'zlib'``, ``'lzma'`` or ``None`` for no compression.
+
+    Returns
+    -------
+    bytes
+    '''
+
+    data = jsonlib.dumps(obj)
+    if codec == 'zlib':
+        data = zlib.compress(data)
+    elif codec == 'lzma':
+        data = lzma.compress(data)
+    elif codec is not None:
+        raise ValueError('Unknown codec {}.'.format(codec))
+    return CODECS[codec] + data
+
+def unpack(value):
+    '''Inverse of ``pack``. Values that are not bytes are returned unchanged.'''
+
+    if not isinstance(value, bytes):
+        return value
+    tag, data = value[:1], value[1:]
+    if tag == CODECS['zlib']:
+        data = zlib.decompress(data)
+    elif tag == CODECS['lzma']:
+        data = lzma.decompress(data)
+    return jsonlib.loads(data)
+
+# File locks are held per process, so threads are serialized separately
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+@contextlib.contextmanager
+def file_lock(filename):
+    '''Holds an exclusive lock on ``filename + '.lock'``.'''
+    with _thread_locks_lock:
+        thread_lock = _thread_locks.setdefault(filename, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(filename + '.lock', 'a') as fp:
+            fcntl.lockf(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(fp, fcntl.LOCK_UN)
+
+def file_stamp(filename):
+    '''Modification time and size of a file, None if it does not exist.'''
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def merge_entries(cache, other):
+    '''Adds the entries of ``other`` to ``cache`` that are missing or more
+    recently fetched than those in ``cache``.'''
+    for key, entry in other.items():
+        if key not in cache or entry_time(entry) > entry_time(cache[key]):
+            cache[key] = entry
+    return cache
+
+def load_cache(filename):
+    '''Loads a pickled cache.
+
+    Returns
+    -------
+    cache : dict
+        Loaded cache, empty if the file does not exist.
+    stamp : tuple
+        Stamp of the file as loaded, to be passed to ``save_cache``.
+    '''
+
+    # Files are replaced atomically, so no lock is needed for reading.
+    stamp = file_stamp(filename)
+    if stamp is None:
+        return {}, None
+    with open(filename, 'rb') as fp:
+        cache = pickle.load(fp)
+    return cache, stamp
+
+def save_cache(filename, cache, stamp=None, protocol=pickle.HIGHEST_PROTOCOL):
+    '''Saves a cache to file, merging entries written by other processes.
+
+    Parameters
+    ----------
+    filename : str
+        Cache file.
+    cache : dict
+        Cache to be saved. Entries saved by other processes since the cache
+        was loaded are merged into it.
+    stamp : tuple, optional
+        Stamp returned by the last ``load_cache`` or ``save_cache``. The file
+        is only re-read if it has changed since.
+    protocol : int, optional
+        Pickle protocol.
+
+    Returns
+    -------
+    tuple
+        Stamp of the saved file.
+    '''
+
+    with file_lock(filename):
+        current = file_stamp(filename)
+        if current is not None and current != stamp:
+            with open(filename, 'rb') as fp:
+                merge_entries(cache, pickle.load(fp))
+
+        tmp_filename = '{}.{}.{}.tmp'.format(filename, socket.gethostname(),
+                                             os.getpid())
+        with open(tmp_filename, 'wb') as fp:
+            # Other threads may add entries while the cache is written
+            pickle.dump(dict(cache), fp, protocol)
+        os.replace(tmp_filename, filename)
+        return file_stamp(filename)
@@ -0,0 +1,352 @@
+"""Command line interface.
+
+Jobs are described by a json config file with the download params, the
+output directory and a list of journal-year jobs, e.g.
+
+    {"output_dir" : "data/output",
+     "params" : {"operation_name" : "math_2016", "year_range" : [1960, 2019],
+                 "cite_type" : "all", "condition" : "first_pub <= 1998",
+                 "cache_dir" : "data/local_cache", "cache_name" : "math_2016",
+                 "max_workers" : 4},
+     "jobs" : [["Annals of Mathematics", "0003486X", 2016, "annals_2016"],
+               ["Duke Mathematical Journal", "00127094", 2016, "duke_2016"]]}
+
+Usage
+-----
+    python -m scopuscite run config.json
+    python -m scopuscite plan config.json
+    python -m scopuscite warm config.json
+    python -m scopuscite cache-stats --config config.json
+    python -m scopuscite quota --cache-dir data/local_cache
+    python -m scopuscite index --config config.json
+    python -m scopuscite export data/output/math_2016_pubs pubs.parquet
+    python -m scopuscite prefetch data/spool --config config.json --share 0.3
+    python -m scopuscite submit data/spool pubs --file scopus_ids.txt \
+        --year-range 1960 2019
+    python -m scopuscite prefetch-status data/spool
+
+Modules depending on numpy and pandas are only imported by the commands that
+need them, so that ``cache-stats`` and ``quota`` start quickly.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+# Kinds of caches, loaded with Scopus.load_<kind>_cache
+CACHE_KINDS = ['search_query', 'author_info', 'author_pub', 'pub_info']
+
+def load_config(filename):
+    '''
+    Reads a job config file.
+
+    Parameters
+    ----------
+    filename : str
+        Json file with the keys ``params``, ``jobs`` and ``output_dir``.
+
+    Returns
+    -------
+    dict
+        The config, with ``year_range`` as a tuple, as used in cache keys,
+        and jobs as tuples.
+    '''
+
+    with open(filename, 'r') as fp:
+        config = json.load(fp)
+    params = config.setdefault('params', {})
+    if 'year_range' in params:
+        params['year_range'] = tuple(params['year_range'])
+    params.setdefault('cite_type', 'all')
+    config['jobs'] = [tuple(job) for job in config.get('jobs', [])]
+    config.setdefault('output_dir', 'data/output')
+    return config
+
+def _params(args):
+    '''Download params from the config and the command line options.'''
+    params = load_config(args.config)['params'] \
+                if getattr(args, 'config', None) else {}
+    for name in ['cache_dir', 'cache_name', 'store_dir']:
+        if getattr(args, name, None) is not None:
+            params[name] = getattr(args, name)
+    if getattr(args, 'trace', False):
+        params['trace'] = True
+    if getattr(args, 'metrics', None) is not None:
+        from scopuscite.metrics import Metrics, JsonlSink
+        params['metrics'] = Metrics(sinks=[JsonlSink(args.metrics)])
+    return params
+
+def _open_scopus(params):
+    '''Scopus object for inspecting the caches, without an API key.'''
+    from scopuscite.scopus import Scopus
+    store = None
+    if 'store_dir' in params:
+        from scopuscite.store import SharedStore
+        store = SharedStore(params['store_dir'])
+    return Scopus(None, cache_name=params.get('cache_name'),
+                  cache_dir=params.get('cache_dir'),
+                  ttl=params.get('ttl'), store=store)
+
+def cmd_run(args):
+    config = load_config(args.config)
+    params = _params(args)
+    if args.dry_run:
+        params['dry_run'] = True
+
+    from scopuscite.download_data import download_journal_year_data, \
+        download_batch
+    jobs = config['jobs']
+    if len(jobs) == 1 and 'operation_name' in params:
+        journal, issn, year = jobs[0][:3]
+        download_journal_year_data(year, journal, issn, config['output_dir'],
+                                   params)
+    else:
+        download_batch(jobs, config['output_dir'], params)
+    return 0
+
+def cmd_plan(args):
+    args.dry_run = True
+    return cmd_run(args)
+
+def cmd_warm(args):
+    config = load_config(args.config)
+    from scopuscite.download_data import warm_cache
+    num_authors, num_pubs = warm_cache(config['jobs'], _params(args))
+    print('Cache warm for {} authors and {} publications.' \
+            .format(num_authors, num_pubs))
+    return 0
+
+def cmd_cache_stats(args):
+    from scopuscite.cache import entry_time, stale_keys
+    params = _params(args)
+    scopus = _open_scopus(params)
+    now = time.time()
+
+    print('{:15s} {:>10s} {:>12s} {:>12s} {:>12s} {:>10s}'.format(
+        'cache', 'entries', 'size', 'oldest', 'newest', 'stale'))
+    for kind in CACHE_KINDS:
+        getattr(scopus, 'load_{}_cache'.format(kind))()
+        cache = getattr(scopus, 'cache_' + kind)
+        times = [entry_time(cache[key]) for key in cache.keys()]
+        stale = stale_keys(cache, cache.keys(), scopus.ttl.get(kind), now=now)
+        ages = ['{:.1f} d'.format((now - t) / 86400.) if t > 0 else '-' \
+                    for t in ([min(times), max(times)] if times else [0, 0])]
+        print('{:15s} {:>10d} {:>12s} {:>12s} {:>12s} {:>10d}'.format(
+            kind, len(times), _cache_size(scopus, kind), ages[0], ages[1],
+            len(stale)))
+    return 0
+
+def _cache_size(scopus, kind):
+    '''Size of the pickle file of a cache.'''
+    if scopus.store is not None:
+        return '-'
+    if kind == 'search_query':
+        name = scopus.CACHE_SEARCH_QUERY_NAME
+    else:
+        suffix = {'author_info' : scopus.CACHE_AUTHOR_INFO_SUFFIX,
+                  'author_pub' : scopus.CACHE_AUTHOR_PUB_SUFFIX,
+                  'pub_info' : scopus.CACHE_PUB_INFO_SUFFIX}[kind]
+        name = scopus.cache_name + suffix
+    filename = os.path.join(scopus.cache_dir, name)
+    if not os.path.exists(filename):
+        return '-'
+    return '{:.1f} MB'.format(os.path.getsize(filename) / 2**20)
+
+def cmd_quota(args):
+    scopus = _open_scopus(_params(args))
+    if not scopus.quotas:
+        print('No quota recorded yet.')
+        return 0
+    print('{:10s} {:>10s} {:>10s}  {}'.format('endpoint', 'remaining',
+                                              'limit', 'reset'))
+    for endpoint, quota in sorted(scopus.quotas.items()):
+        reset = time.strftime('%Y-%m-%d %H:%M',
+                              time.localtime(float(quota['reset']))) \
+                    if quota.get('reset') is not None else '-'
+        print('{:10s} {:>10} {:>10}  {}'.format(endpoint, quota['remaining'],
+                                                quota['limit'], reset))
+    return 0
+
+def cmd_index(args):
+    from scopuscite.query import build_index, QueryIndex
+    filename = build_index(_open_scopus(_params(args)))
+    counts = QueryIndex(filename).counts()
+    print('Index {}: {}.'.format(filename, ', '.join(
+        '{} {}'.format(num, table) for table, num in counts.items())))
+    return 0
+
+def cmd_export(args):
+    import pandas as pd
+    from scopuscite.dataset import Dataset
+    from scopuscite.export import write_table
+
+    year_range = tuple(args.year_range) if args.year_range else None
+    if os.path.isdir(args.source):
+        dataset = Dataset(args.source)
+        df = dataset.to_frame()
+        if year_range is None:
+            year_range = dataset.year_range
+    else:
+        df = pd.read_pickle(args.source)
+    try:
+        filename = write_table(df, args.output, format=args.format,
+                               year_range=year_range)
+    except ValueError as e:
+        print('{} Pass it with --year-range.'.format(e))
+        return 1
+    print('Exported {} rows to {}.'.format(len(df), filename))
+    return 0
+
+def cmd_prefetch(args):
+    from scopuscite.download_data import create_scopus
+    from scopuscite.prefetch import PrefetchService
+    service = PrefetchService(create_scopus(_params(args)), args.spool_dir,
+        share=args.share, idle_hours=args.idle_hours,
+        idle_share=args.idle_share, socket_path=args.socket)
+
+    # Progress of the fetches goes to the log, the status to status.json
+    with contextlib.ExitStack() as stack:
+        if args.log is not None:
+            stack.enter_context(contextlib.redirect_stdout(
+                stack.enter_context(open(args.log, 'a'))))
+        if args.once:
+            num_jobs = service.run_once()
+        else:
+            try:
+                service.run()
+            except KeyboardInterrupt:
+                service.stop()
+    if args.once:
+        print('Jobs run: {}'.format(num_jobs))
+    return 0
+
+def cmd_submit(args):
+    from scopuscite.prefetch import submit
+    items = list(args.items)
+    if args.file is not None:
+        with open(args.file, 'r') as fp:
+            items += [line.strip() for line in fp if line.strip()]
+    if args.kind == 'journal_year':
+        # Items are given as YEAR:ISSN
+        items = [(int(item.split(':')[0]), None, item.split(':')[1]) \
+                    for item in items]
+    filename = submit(args.spool_dir, args.kind, items,
+                      year_range=args.year_range, cite_type=args.cite_type)
+    print('Submitted {} items as {}.'.format(len(items), filename))
+    return 0
+
+def cmd_prefetch_status(args):
+    from scopuscite.prefetch import read_status
+    status = read_status(args.spool_dir)
+    if status is None:
+        print('No prefetch status in {}.'.format(args.spool_dir))
+        return 1
+    for key in ['state', 'job', 'kind', 'items_done', 'items_total',
+                'queued', 'jobs_done', 'jobs_failed', 'items_fetched',
+                'share', 'last_error']:
+        print('{:15s} {}'.format(key, status.get(key)))
+    print('{:15s} {:.0f} s ago'.format('updated',
+                                       time.time() - status['updated']))
+    for endpoint, quota in sorted(status.get('quotas', {}).items()):
+        print('{:15s} {} / {}'.format('quota ' + endpoint,
+                                      quota['remaining'], quota['limit']))
+    return 0
+
+def build_parser():
+    '''Argument parser of the command line interface.'''
+    parser = argparse.ArgumentParser(prog='python -m scopuscite',
+        description='Download and inspect Scopus citation data.')
+    commands = parser.add_subparsers(dest='command')
+
+    def add_job_command(name, func, help):
+        cmd = commands.add_parser(name, help=help)
+        cmd.add_argument('config', help='Json job config.')
+        cmd.add_argument('--trace', action='store_true',
+                         help='Print the time and memory of each stage.')
+        cmd.add_argument('--metrics', default=None,
+                         help='Append metrics to this jsonl file.')
+        cmd.set_defaults(func=func, dry_run=False)
+        return cmd
+
+    run = add_job_command('run', cmd_run, 'Run the jobs of a config.')
+    run.add_argument('--dry-run', action='store_true',
+                     help='Only plan the calls, same as plan.')
+    add_job_command('plan', cmd_plan,
+                    'Plan the calls of a config against the quota.')
+    add_job_command('warm', cmd_warm,
+                    'Fetch the data of a config into the cache only.')
+
+    for name, func, help in [
+            ('cache-stats', cmd_cache_stats, 'Show cache statistics.'),
+            ('quota', cmd_quota, 'Show the last known quota.'),
+            ('index', cmd_index, 'Build the query index of the caches.')]:
+        cmd = commands.add_parser(name, help=help)
+        cmd.add_argument('--config', default=None,
+                         help='Json job config with the cache options.')
+        cmd.add_argument('--cache-dir', default=None)
+        cmd.add_argument('--cache-name', default=None)
+        cmd.add_argument('--store-dir', default=None)
+        cmd.set_defaults(func=func)
+
+    export = commands.add_parser('export',
+        help='Export a dataset or pickled dataframe as a table.')
+    export.add_argument('source', help='Dataset directory or pickle file.')
+    export.add_argument('output', help='Output file.')
+    export.add_argument('--format', default=None,
+                        choices=['parquet', 'feather', 'csv'])
+    export.add_argument('--year-range', type=int, nargs=2, default=None)
+    export.set_defaults(func=cmd_export)
+
+    prefetch = commands.add_parser('prefetch',
+        help='Prefetch spooled jobs into the cache.')
+    prefetch.add_argument('spool_dir')
+    prefetch.add_argument('--config', default=None,
+                          help='Json job config with the cache options.')
+    prefetch.add_argument('--cache-dir', default=None)
+    prefetch.add_argument('--cache-name', default=None)
+    prefetch.add_argument('--store-dir', default=None)
+    prefetch.add_argument('--share', type=float, default=0.5,
+                          help='Share of the rate limit and quota to use.')
+    prefetch.add_argument('--idle-hours', type=int, nargs=2, default=None,
+                          help='Local hours START END of idle time.')
+    prefetch.add_argument('--idle-share', type=float, default=1.)
+    prefetch.add_argument('--socket', default=None,
+                          help='Unix socket accepting jobs as json lines.')
+    prefetch.add_argument('--once', action='store_true',
+                          help='Run the pending jobs and exit.')
+    prefetch.add_argument('--log', default=None,
+                          help='Append the progress output to this file.')
+    prefetch.set_defaults(func=cmd_prefetch)
+
+    submit = commands.add_parser('submit', help='Add a prefetch job.')
+    submit.add_argument('spool_dir')
+    submit.add_argument('kind',
+        choices=['authors', 'author_pubs', 'pubs', 'journal_year'])
+    submit.add_argument('items', nargs='*',
+        help='Author or scopus ids, or YEAR:ISSN for journal_year.')
+    submit.add_argument('--file', default=None,
+                        help='File with one item per line.')
+    submit.add_argument('--year-range', type=int, nargs=2, default=None)
+    submit.add_argument('--cite-type', default='all')
+    submit.set_defaults(func=cmd_submit)
+
+    status = commands.add_parser('prefetch-status',
+        help='Show the progress of a prefetch service.')
+    status.add_argument('spool_dir')
+    status.set_defaults(func=cmd_prefetch_status)
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'func', None) is None:
+        parser.print_help()
+        return 1
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
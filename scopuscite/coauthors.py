@@ -0,0 +1,249 @@
+"""Co-authorship graph of the authors of a set of publications.
+
+The graph is stored as a symmetric sparse matrix whose entry ``(i, j)`` is
+the number of publications authors ``i`` and ``j`` have written together.
+Author pairs are generated vectorized: publications are grouped by their
+number of authors ``k`` and the pairs of each group are read off with the
+upper triangle indices of a ``k x k`` matrix. Requires ``scipy``.
+
+Example
+-------
+>>> graph = build_coauthor_graph(pubs)
+>>> graph.neighbours('7004212771')
+>>> graph.k_hop('7004212771', 2)
+>>> graph.edge_list('coauthors.csv')
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+def coauthor_pairs(pubs, max_authors=None):
+    '''
+    All pairs of authors of each publication.
+
+    Parameters
+    ----------
+    pubs : pandas.DataFrame
+        Dataframe with publication information.
+    max_authors : int, optional
+        Publications with more authors are skipped, e.g. to exclude large
+        collaborations with thousands of authors.
+
+    Returns
+    -------
+    author_ids : numpy.ndarray
+        Ids of all authors, the nodes of the graph.
+    left, right : numpy.ndarray
+        Positions in author_ids of the two authors of each pair, with
+        ``left < right``. Each pair appears once per publication.
+    pub_idx : numpy.ndarray
+        Position in pubs of the publication of each pair.
+    '''
+
+    lengths = pubs['authors'].map(len).values.astype(np.int64)
+    flat = [a for pub_authors in pubs['authors'] for a in pub_authors]
+    codes, author_ids = pd.factorize(pd.Series(flat, dtype=object))
+    author_ids = np.asarray(author_ids, dtype=object)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+
+    left, right, pub_idx = [], [], []
+    for k in np.unique(lengths):
+        if k < 2 or (max_authors is not None and k > max_authors):
+            continue
+        group = np.flatnonzero(lengths == k)
+        group_codes = codes[offsets[group, np.newaxis] + np.arange(k)]
+        iu, ju = np.triu_indices(k, 1)
+        left.append(group_codes[:, iu].ravel())
+        right.append(group_codes[:, ju].ravel())
+        pub_idx.append(np.repeat(group, len(iu)))
+
+    if not left:
+        empty = np.zeros(0, dtype=np.int64)
+        return author_ids, empty, empty, empty
+
+    left = np.concatenate(left)
+    right = np.concatenate(right)
+    pub_idx = np.concatenate(pub_idx)
+
+    # Authors listed twice on a paper are not their own coauthors, and are
+    # paired with each coauthor once
+    keep = left != right
+    left, right = np.minimum(left, right), np.maximum(left, right)
+    if not keep.all():
+        pub_idx, left, right = np.unique(np.stack(
+            [pub_idx[keep], left[keep], right[keep]]), axis=1)
+    return author_ids, left, right, pub_idx
+
+class CoauthorGraph(object):
+    """Weighted co-authorship graph.
+
+    Parameters
+    ----------
+    adjacency : scipy.sparse.csr_matrix
+        Symmetric matrix with the number of joint publications.
+    author_ids : array
+        Author id of each row of the matrix.
+    """
+
+    def __init__(self, adjacency, author_ids):
+        self.adjacency = scipy.sparse.csr_matrix(adjacency)
+        self.author_ids = np.asarray(author_ids, dtype=object)
+        self._index = pd.Index(self.author_ids)
+
+    @classmethod
+    def from_pairs(cls, author_ids, left, right, weights=None):
+        '''Builds the graph from author pairs, one per joint paper.'''
+        n = len(author_ids)
+        if weights is None:
+            weights = np.ones(len(left), dtype=np.int64)
+        upper = scipy.sparse.coo_matrix((weights, (left, right)),
+                                        shape=(n, n)).tocsr()
+        upper.sum_duplicates()
+        return cls(upper + upper.T, author_ids)
+
+    def __len__(self):
+        return len(self.author_ids)
+
+    def _position(self, author_id):
+        pos = self._index.get_indexer([author_id])[0]
+        if pos < 0:
+            raise KeyError(author_id)
+        return pos
+
+    def neighbours(self, author_id):
+        '''Coauthors of an author with the number of joint publications, most
+        frequent first.'''
+        pos = self._position(author_id)
+        start, end = self.adjacency.indptr[pos:pos+2]
+        res = pd.Series(self.adjacency.data[start:end],
+            index=self.author_ids[self.adjacency.indices[start:end]])
+        return res.sort_values(ascending=False)
+
+    def degree(self, weighted=False):
+        '''Number of coauthors of each author, or with weighted=True the
+        number of coauthorships summed over all publications.'''
+        if weighted:
+            values = np.asarray(self.adjacency.sum(axis=1)).ravel()
+        else:
+            values = np.diff(self.adjacency.indptr)
+        return pd.Series(values, index=self.author_ids)
+
+    def k_hop(self, author_id, k):
+        '''Authors at distance at most k from an author, excluding the author
+        itself.'''
+        reached = np.zeros(len(self), dtype=bool)
+        reached[self._position(author_id)] = True
+        frontier = reached.copy()
+        for _ in range(k):
+            frontier = (self.adjacency.T @ frontier.astype(np.int64)) > 0
+            frontier &= ~reached
+            if not frontier.any():
+                break
+            reached |= frontier
+        reached[self._position(author_id)] = False
+        return list(self.author_ids[reached])
+
+    def subgraph(self, author_ids):
+        '''Graph restricted to the given authors, e.g. a selection.'''
+        pos = self._index.get_indexer(list(author_ids))
+        pos = pos[pos >= 0]
+        return CoauthorGraph(self.adjacency[pos][:, pos], self.author_ids[pos])
+
+    def edge_list(self, filename=None, sep=';'):
+        '''
+        Edges of the graph, each listed once.
+
+        Parameters
+        ----------
+        filename : str, optional
+            If given, the edges are also written to this csv file.
+        sep : str
+            Separator of the csv file.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Columns ``author_1``, ``author_2`` and ``weight``.
+        '''
+        upper = scipy.sparse.triu(self.adjacency, k=1).tocoo()
+        edges = pd.DataFrame({'author_1' : self.author_ids[upper.row],
+                              'author_2' : self.author_ids[upper.col],
+                              'weight' : upper.data})
+        if filename is not None:
+            edges.to_csv(filename, sep=sep, index=False)
+        return edges
+
+    def save(self, filename):
+        '''Saves the sparse adjacency matrix and author ids as npz.'''
+        np.savez(filename, data=self.adjacency.data,
+                 indices=self.adjacency.indices,
+                 indptr=self.adjacency.indptr,
+                 author_ids=self.author_ids.astype(str))
+
+    @classmethod
+    def load(cls, filename):
+        '''Loads a graph saved with save.'''
+        with np.load(filename) as npz:
+            n = len(npz['author_ids'])
+            adjacency = scipy.sparse.csr_matrix(
+                (npz['data'], npz['indices'], npz['indptr']), shape=(n, n))
+            return cls(adjacency, npz['author_ids'].astype(object))
+
+def build_coauthor_graph(pubs, years=None, max_authors=None):
+    '''
+    Builds the co-authorship graph of the authors of a set of publications.
+
+    Parameters
+    ----------
+    pubs : pandas.DataFrame
+        Dataframe with publication information.
+    years : collection, optional
+        If given, only publications of these years are used.
+    max_authors : int, optional
+        Publications with more authors are skipped.
+
+    Returns
+    -------
+    CoauthorGraph
+        The graph, with weights counting joint publications.
+    '''
+
+    if years is not None:
+        pubs = pubs[pubs['year'].isin(list(years))]
+    author_ids, left, right, _ = coauthor_pairs(pubs, max_authors)
+    return CoauthorGraph.from_pairs(author_ids, left, right)
+
+def coauthor_graphs_by_year(pubs, year_range=None, max_authors=None):
+    '''
+    Builds one co-authorship graph per publication year.
+
+    All graphs share the same nodes, so that rows of the matrices can be
+    compared and summed across years.
+
+    Parameters
+    ----------
+    pubs : pandas.DataFrame
+        Dataframe with publication information.
+    year_range : range, optional
+        Years of the graphs, by default all publication years.
+    max_authors : int, optional
+        Publications with more authors are skipped.
+
+    Returns
+    -------
+    dict
+        CoauthorGraph for each year.
+    '''
+
+    author_ids, left, right, pub_idx = coauthor_pairs(pubs, max_authors)
+    pair_years = pubs['year'].values[pub_idx]
+    if year_range is None:
+        year_range = np.unique(pubs['year'].values)
+
+    graphs = {}
+    for year in year_range:
+        mask = pair_years == year
+        graphs[year] = CoauthorGraph.from_pairs(author_ids, left[mask],
+                                                right[mask])
+    return graphs
@@ -0,0 +1,500 @@
+"""Memory-mapped on-disk datasets of publications and authors.
+
+A dataset is a directory with one flat binary file per column and a file
+``meta.json`` describing the columns:
+
+* numeric columns are stored as one value per row,
+* per-year array columns such as ``cites_by_year`` as a 2D block with one
+  row per row of the dataset,
+* lists of ids such as ``authors`` and strings in CSR layout, i.e. the
+  concatenated values and the offsets of each row.
+
+The ids of the rows (scopus ids or author ids) are stored as integers
+together with a sorted copy, the id dictionary, so that rows can be located
+by id with a binary search. All files are opened with ``np.memmap``, so only
+the parts of a dataset that are used are read from disk. Rows are appended
+at the end of the files, which makes appending and merging datasets cheap.
+
+Example
+-------
+>>> write_dataset('data/annals_2016_pubs', pubs)
+>>> dataset = Dataset('data/annals_2016_pubs')
+>>> dataset.loc(['84963533430'], columns=['title', 'cites_by_year'])
+"""
+
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from scopuscite.export import array_block
+
+META_NAME = 'meta.json'
+VERSION = 1
+
+def _scalar_dtype(dtype):
+    '''Numpy dtype a scalar column is stored with, None for other columns.
+    Nullable numeric extension dtypes are stored as float64, with NaN for
+    missing values.'''
+    if isinstance(dtype, np.dtype):
+        return dtype if dtype != object else None
+    numpy_dtype = getattr(dtype, 'numpy_dtype', None)
+    if numpy_dtype is not None and np.dtype(numpy_dtype).kind in 'biuf':
+        return np.dtype(np.float64)
+    return None
+
+def _column_type(values):
+    '''Storage type of a dataframe column.'''
+    if isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        return 'str'
+    if _scalar_dtype(values.dtype) is not None:
+        return 'scalar'
+    for value in values:
+        if isinstance(value, np.ndarray):
+            return 'block'
+        if isinstance(value, (list, set, tuple)):
+            return 'ids'
+        if isinstance(value, str):
+            return 'str'
+    return 'str'
+
+def _to_ids(values):
+    '''Converts numeric id strings to an int64 array.'''
+    return np.asarray(pd.to_numeric(np.asarray(values, dtype=object)),
+                      dtype=np.int64)
+
+def _from_ids(values):
+    '''Converts an int64 array to id strings.'''
+    return [str(value) for value in values]
+
+class Dataset(object):
+    """Memory-mapped dataset stored in a directory.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the dataset, created with ``write_dataset`` or
+        ``Dataset.create``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_NAME), 'r') as fp:
+            self.meta = json.load(fp)
+        self._maps = {}
+
+    @classmethod
+    def create(cls, path, df, year_range=None):
+        '''
+        Creates an empty dataset with the columns of a dataframe.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the dataset. It must not exist yet.
+        df : pandas.DataFrame
+            Dataframe indexed by scopus id or author id.
+        year_range : tuple, optional
+            Years of the per-year array columns, stored in the metadata.
+
+        Returns
+        -------
+        Dataset
+            The empty dataset.
+        '''
+
+        columns = []
+        for name in df.columns:
+            kind = _column_type(df[name].values)
+            column = {'name' : name, 'type' : kind}
+            if kind == 'scalar':
+                column['dtype'] = _scalar_dtype(df[name].dtype).str
+            elif kind == 'block':
+                column['dtype'] = np.dtype(np.int64).str
+                column['width'] = max(len(value) for value in df[name] \
+                    if isinstance(value, np.ndarray))
+            columns.append(column)
+        return cls._create(path, columns, df.index.name, year_range)
+
+    @classmethod
+    def _create(cls, path, columns, index_name, year_range):
+        '''Creates an empty dataset with the given column descriptions.'''
+        os.makedirs(path)
+        columns = [dict(column) for column in columns]
+        for column in columns:
+            if column['type'] in {'ids', 'str'}:
+                column['size'] = 0
+
+        meta = {'version' : VERSION, 'num_rows' : 0,
+                'index_name' : index_name, 'columns' : columns,
+                'year_range' : list(year_range) \
+                    if year_range is not None else None}
+        dataset = cls.__new__(cls)
+        dataset.path = path
+        dataset.meta = meta
+        dataset._maps = {}
+        for filename in dataset._files():
+            open(os.path.join(path, filename), 'wb').close()
+        for column in columns:
+            if column['type'] in {'ids', 'str'}:
+                np.zeros(1, dtype=np.int64).tofile(
+                    os.path.join(path, column['name'] + '.indptr'))
+        dataset._save_meta()
+        return dataset
+
+    def _files(self):
+        '''Names of all data files.'''
+        files = ['ids', 'ids.sorted', 'ids.order']
+        for column in self.meta['columns']:
+            if column['type'] in {'scalar', 'block'}:
+                files.append(column['name'])
+            else:
+                files.extend([column['name'] + '.indptr',
+                              column['name'] + '.data'])
+        return files
+
+    def _save_meta(self):
+        filename = os.path.join(self.path, META_NAME)
+        with open(filename + '.tmp', 'w') as fp:
+            json.dump(self.meta, fp, indent=2)
+        os.replace(filename + '.tmp', filename)
+
+    def _map(self, name, dtype, shape):
+        '''Memory-maps a data file, read-only.'''
+        key = (name, shape)
+        if key not in self._maps:
+            if shape[0] == 0:
+                self._maps[key] = np.zeros(shape, dtype=dtype)
+            else:
+                self._maps[key] = np.memmap(os.path.join(self.path, name),
+                                            dtype=dtype, mode='r',
+                                            shape=shape)
+        return self._maps[key]
+
+    def __len__(self):
+        return self.meta['num_rows']
+
+    @property
+    def columns(self):
+        return [column['name'] for column in self.meta['columns']]
+
+    @property
+    def year_range(self):
+        year_range = self.meta['year_range']
+        return tuple(year_range) if year_range is not None else None
+
+    def _column(self, name):
+        for column in self.meta['columns']:
+            if column['name'] == name:
+                return column
+        raise KeyError(name)
+
+    @property
+    def ids(self):
+        '''Ids of all rows as int64 array.'''
+        return self._map('ids', np.int64, (len(self),))
+
+    def column(self, name):
+        '''
+        Memory-mapped data of a column.
+
+        For numeric columns this is an array with one value per row, for
+        per-year columns a 2D array. For id lists and strings it is a tuple
+        ``(indptr, data)``, where the values of row ``i`` are
+        ``data[indptr[i]:indptr[i+1]]``, with strings stored as utf-8 bytes.
+        '''
+        column = self._column(name)
+        if column['type'] == 'scalar':
+            return self._map(name, column['dtype'], (len(self),))
+        if column['type'] == 'block':
+            return self._map(name, column['dtype'],
+                             (len(self), column['width']))
+        indptr = self._map(name + '.indptr', np.int64, (len(self) + 1,))
+        dtype = np.int64 if column['type'] == 'ids' else np.uint8
+        data = self._map(name + '.data', dtype, (column['size'],))
+        return indptr, data
+
+    def locate(self, ids):
+        '''
+        Rows of the given ids, using the id dictionary.
+
+        Parameters
+        ----------
+        ids : list
+            Scopus ids or author ids.
+
+        Returns
+        -------
+        numpy.ndarray
+            Row of each id, -1 for ids not in the dataset.
+        '''
+        ids = _to_ids(list(ids))
+        sorted_ids = self._map('ids.sorted', np.int64, (len(self),))
+        order = self._map('ids.order', np.int64, (len(self),))
+        if len(self) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), len(self) - 1)
+        return np.where(sorted_ids[pos] == ids, order[pos], -1)
+
+    def take(self, rows, columns=None):
+        '''
+        Reads the given rows into a dataframe.
+
+        Parameters
+        ----------
+        rows : array or slice
+            Row numbers.
+        columns : list, optional
+            Columns to read, by default all.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe indexed by the ids of the rows, with the same layout as
+            the dataframe the dataset was written from.
+        '''
+        if isinstance(rows, slice):
+            rows = np.arange(len(self))[rows]
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = self.columns if columns is None else columns
+
+        data = {}
+        for name in columns:
+            column = self._column(name)
+            if column['type'] == 'scalar':
+                data[name] = np.asarray(self.column(name)[rows])
+            elif column['type'] == 'block':
+                data[name] = list(np.asarray(self.column(name)[rows]))
+            else:
+                indptr, values = self.column(name)
+                starts, ends = indptr[rows], indptr[rows + 1]
+                if column['type'] == 'ids':
+                    data[name] = [_from_ids(values[s:e]) \
+                                    for s, e in zip(starts, ends)]
+                else:
+                    data[name] = [bytes(values[s:e]).decode('utf-8') \
+                                    for s, e in zip(starts, ends)]
+
+        index = pd.Index(_from_ids(self.ids[rows]),
+                         name=self.meta['index_name'])
+        return pd.DataFrame(data, index=index, columns=columns)
+
+    def __getitem__(self, rows):
+        return self.take(rows)
+
+    def loc(self, ids, columns=None):
+        '''Reads the rows of the given ids; missing ids are skipped.'''
+        rows = self.locate(ids)
+        return self.take(rows[rows >= 0], columns)
+
+    def to_frame(self, columns=None):
+        '''Reads the whole dataset into a dataframe.'''
+        return self.take(slice(None), columns)
+
+    def iter_chunks(self, chunk_size=100000, columns=None):
+        '''Yields the dataset as dataframes of chunk_size rows.'''
+        for start in range(0, len(self), chunk_size):
+            yield self.take(slice(start, start + chunk_size), columns)
+
+    def rows_containing(self, name, ids, chunk_size=10000000):
+        '''
+        Rows whose id list in column name contains one of the given ids, e.g.
+        the publications of some authors.
+
+        Parameters
+        ----------
+        name : str
+            Column with lists of ids, e.g. ``'authors'``.
+        ids : list
+            Ids to look for.
+        chunk_size : int
+            Number of values scanned at once.
+
+        Returns
+        -------
+        numpy.ndarray
+            Sorted row numbers.
+        '''
+        ids = _to_ids(list(ids))
+        indptr, values = self.column(name)
+        rows = []
+        for start in range(0, len(values), chunk_size):
+            pos = np.flatnonzero(np.isin(values[start:start+chunk_size], ids))
+            rows.append(np.searchsorted(indptr, pos + start, side='right') - 1)
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(rows))
+
+    def join(self, other, rows=None, columns=None, other_columns=None,
+             rsuffix='_other'):
+        '''
+        Inner join of rows of this dataset with the rows of another dataset
+        with the same ids, e.g. author information with aggregated author
+        statistics.
+
+        Parameters
+        ----------
+        other : Dataset
+            Dataset to join.
+        rows : array, optional
+            Rows of this dataset, by default all.
+        columns, other_columns : list, optional
+            Columns read from each dataset, by default all.
+        rsuffix : str
+            Suffix of columns of other that also exist in this dataset.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The joined rows.
+        '''
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        other_rows = other.locate(_from_ids(self.ids[rows]))
+        found = other_rows >= 0
+        left = self.take(rows[found], columns)
+        right = other.take(other_rows[found], other_columns)
+        return left.join(right, rsuffix=rsuffix)
+
+    def append(self, df, reindex=True):
+        '''
+        Appends the rows of a dataframe with the same columns.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Rows to append, indexed by id.
+        reindex : bool
+            If ``False`` the id dictionary is not updated, which saves time
+            when appending many chunks. Call ``reindex`` afterwards.
+        '''
+        if set(df.columns) != set(self.columns):
+            raise ValueError('Columns of dataframe do not match dataset.')
+
+        num_rows = len(self)
+        self._maps = {}
+        # Cut off anything written by an append that did not complete
+        self._write('ids', _to_ids(df.index), num_rows * 8)
+
+        for column in self.meta['columns']:
+            name = column['name']
+            values = df[name].values
+            if column['type'] == 'scalar':
+                dtype = np.dtype(column['dtype'])
+                if isinstance(values, np.ndarray):
+                    values = values.astype(dtype)
+                else:
+                    values = df[name].to_numpy(dtype=dtype, na_value=np.nan)
+                self._write(name, values, num_rows * dtype.itemsize)
+            elif column['type'] == 'block':
+                self._write(name, array_block(values, column['width']),
+                            num_rows * column['width'] * 8)
+            else:
+                if column['type'] == 'ids':
+                    lengths = [len(value) for value in values]
+                    data = _to_ids(list(itertools.chain.from_iterable(
+                        values)))
+                else:
+                    parts = [('' if pd.isnull(value) else str(value)) \
+                                .encode('utf-8') for value in values]
+                    lengths = [len(part) for part in parts]
+                    data = np.frombuffer(b''.join(parts), dtype=np.uint8)
+                lengths = np.array(lengths, dtype=np.int64)
+                self._write(name + '.indptr',
+                            column['size'] + np.cumsum(lengths),
+                            (num_rows + 1) * 8)
+                self._write(name + '.data', data,
+                            column['size'] * data.itemsize)
+                column['size'] += int(lengths.sum())
+
+        self.meta['num_rows'] = num_rows + len(df)
+        if reindex:
+            self.reindex()
+        else:
+            self._save_meta()
+
+    def _write(self, name, values, offset):
+        '''Writes values to a data file at offset, truncating the rest.'''
+        with open(os.path.join(self.path, name), 'r+b') as fp:
+            fp.seek(offset)
+            fp.truncate()
+            np.ascontiguousarray(values).tofile(fp)
+
+    def reindex(self):
+        '''Rebuilds the id dictionary.'''
+        self._maps = {}
+        ids = np.array(self.ids)
+        order = np.argsort(ids, kind='stable')
+        self._write('ids.sorted', ids[order], 0)
+        self._write('ids.order', order.astype(np.int64), 0)
+        self._maps = {}
+        self._save_meta()
+
+def write_dataset(path, df, year_range=None, chunk_size=100000):
+    '''
+    Writes a dataframe as a dataset.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the dataset. It must not exist yet.
+    df : pandas.DataFrame
+        Publication or author dataframe.
+    year_range : tuple, optional
+        Years of the per-year array columns.
+    chunk_size : int
+        Number of rows converted and written at once.
+
+    Returns
+    -------
+    Dataset
+        The written dataset.
+    '''
+
+    dataset = Dataset.create(path, df, year_range)
+    for start in range(0, len(df), chunk_size):
+        dataset.append(df.iloc[start:start+chunk_size], reindex=False)
+    dataset.reindex()
+    return dataset
+
+def merge_datasets(path, paths, chunk_size=100000):
+    '''
+    Merges several datasets with the same columns, e.g. the publications of
+    several journals, keeping the first row of each id.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the merged dataset. It must not exist yet.
+    paths : list
+        Directories of the datasets to merge.
+    chunk_size : int
+        Number of rows read and written at once.
+
+    Returns
+    -------
+    Dataset
+        The merged dataset.
+    '''
+
+    sources = [Dataset(source_path) for source_path in paths]
+    for source in sources[1:]:
+        if set(source.columns) != set(sources[0].columns):
+            raise ValueError('Cannot merge datasets with different columns.')
+
+    merged = Dataset._create(path, sources[0].meta['columns'],
+                             sources[0].meta['index_name'],
+                             sources[0].year_range)
+    seen = np.zeros(0, dtype=np.int64)
+    for source in sources:
+        for chunk in source.iter_chunks(chunk_size):
+            ids = _to_ids(chunk.index)
+            keep = ~np.isin(ids, seen)
+            # Duplicates within the chunk
+            keep[keep] = ~pd.Index(ids[keep]).duplicated()
+            chunk = chunk[keep]
+            seen = np.union1d(seen, ids[keep])
+            merged.append(chunk, reindex=False)
+    merged.reindex()
+    return merged
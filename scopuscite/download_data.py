@@ -1,23 +1,117 @@
+import json
 import os
+import shutil
 
 import numpy as np
 import pandas as pd
 
 from scopuscite.scopus import Scopus
-from scopuscite.aggregate import aggregate_author_info
-from scopuscite.utils import load_api_key
+from scopuscite.store import SharedStore
+from scopuscite.tracing import Tracer
+from scopuscite.planner import Planner, schedule_jobs, print_schedule
+from scopuscite.export import expand_array_columns, write_table
+from scopuscite.dataset import write_dataset
+from scopuscite.filters import select
+from scopuscite.aggregate import aggregate_author_info, pubs_by_author
+from scopuscite.utils import load_api_key, set_union
 
 def write_author_to_csv(output_file, authors, 
                         cites_per_year=False, year_range=None):
+    '''Writes authors to csv. With ``cites_per_year`` the per-year array
+    columns are expanded into one column per year.'''
 
-    # if cites_per_year:
-    #     for idx, year in enumerate(range(*year_range)):
-    #         authors[str(year)] = authors['cites_by_year'].map(lambda x: x[idx])
-
-    #     authors.drop(columns='cites_by_year', inplace=True)
+    if cites_per_year:
+        authors = expand_array_columns(authors, year_range)
 
     authors.to_csv(output_file, sep=';')
 
+def export_tables(output_name, authors, pubs, params):
+    '''Writes authors and pubs in the columnar format params['export_format']
+    (``'parquet'``, ``'feather'`` or ``'csv'``), if it is set.'''
+
+    if 'export_format' not in params:
+        return
+    print('Export authors and publications as {}.' \
+            .format(params['export_format']))
+    for df, suffix in [(authors, '_auth.'), (pubs, '_pubs.')]:
+        write_table(df, output_name + suffix + params['export_format'],
+                    year_range=params['year_range'])
+
+def save_datasets(output_name, authors, pubs, params):
+    '''Saves authors and pubs as memory-mapped datasets in the directories
+    ``<output_name>_auth`` and ``<output_name>_pubs`` if params['dataset']
+    is set, replacing earlier versions.'''
+
+    if not ('dataset' in params and params['dataset']):
+        return
+    print('Saving authors and publications as datasets.')
+    for df, suffix in [(authors, '_auth'), (pubs, '_pubs')]:
+        if os.path.isdir(output_name + suffix):
+            shutil.rmtree(output_name + suffix)
+        write_dataset(output_name + suffix, df, params['year_range'])
+
+def save_added_ids(output_name, added_authors, added_scopus_ids, params):
+    '''Saves the author and scopus ids added by a delta sync to
+    ``<output_name>_added.json`` if params['delta'] is set, so that later
+    stages can be run on the changes only.'''
+
+    if not ('delta' in params and params['delta']):
+        return
+    print('Saving added ids: {} authors, {} publications.' \
+            .format(len(added_authors), len(added_scopus_ids)))
+    with open(output_name + '_added.json', 'w') as fp:
+        json.dump({'authors' : sorted(added_authors),
+                   'scopus_ids' : sorted(added_scopus_ids)}, fp)
+
+def check_cite_type(params):
+    '''Raises a ValueError if params['cite_type'] does not include ``'all'``,
+    which the aggregation of author citations needs.'''
+
+    cite_type = params['cite_type']
+    cite_types = [cite_type] if isinstance(cite_type, str) else cite_type
+    if 'all' not in cite_types:
+        raise ValueError("cite_type {!r} does not include 'all', which is "
+                         "needed to aggregate the author citations." \
+                            .format(cite_type))
+
+def create_scopus(params):
+    '''Creates a Scopus object with the cache options given in params.'''
+
+    APIKEY = load_api_key()
+    cache_name = params['cache_name'] if 'cache_name' in params else None
+    cache_dir = params['cache_dir'] if 'cache_dir' in params else None
+    ttl = params['ttl'] if 'ttl' in params else None
+    store = None
+    if 'store_dir' in params:
+        store = SharedStore(params['store_dir'],
+            memory_budget=params.get('store_memory_budget'),
+            disk_budget=params.get('store_disk_budget'))
+    max_workers = params['max_workers'] if 'max_workers' in params else 1
+    metrics = params['metrics'] if 'metrics' in params else None
+    profile = params['profile'] if 'profile' in params else None
+    tracer = Tracer(enabled=params.get('trace', False) or profile is not None,
+                    profile=profile, profile_dir=params.get('profile_dir'),
+                    metrics=metrics)
+    return Scopus(APIKEY, cache_name=cache_name, cache_dir=cache_dir,
+                  ttl=ttl, store=store, max_connections=max(10, max_workers),
+                  base_url=params.get('base_url'), metrics=metrics,
+                  tracer=tracer)
+
+def create_planner(scopus, params):
+    '''Creates a Planner with the options of a download given in params.'''
+
+    reload_flags = {'reload_author_list' : 'search_query',
+                    'reload_author_info' : 'author_info',
+                    'reload_author_pub' : 'author_pub',
+                    'reload_pub_info' : 'pub_info'}
+    force_reload = {kind for flag, kind in reload_flags.items() \
+                        if flag in params and params[flag]}
+    condition = params['condition'] if 'condition' in params else None
+    refresh = params['refresh'] if 'refresh' in params else False
+    return Planner(scopus, params['year_range'], params['cite_type'],
+                   condition=condition, refresh=refresh,
+                   force_reload=force_reload)
+
 def download_journal_year_data(year, journal, issn, output_dir, params):
     '''
     Downloads the publications for all authors that have published in a given
@@ -34,8 +128,50 @@ def download_journal_year_data(year, journal, issn, output_dir, params):
         ISSN of journal. Either journal or issn can be omitted.
     output_dir : str
         Where to save the downloaded files.
+    params : dict
+        Further options. Authors are selected with ``condition``, either an
+        expression such as ``'first_pub <= 1998'``, evaluated vectorized (see
+        ``scopuscite.filters``), or a function of a row of the author
+        dataframe. Cache freshness is controlled by ``ttl``, a dict of
+        maximum entry ages in days passed to the Scopus object, and
+        ``refresh``, which re-fetches only entries older than their TTL.
+        If ``store_dir`` is given, all caches live in a shared store in that
+        directory, with optional ``store_memory_budget`` and
+        ``store_disk_budget`` in bytes. A ``metrics`` object (see
+        ``scopuscite.metrics``) collects metrics of the run; a summary is
+        printed at the end. With ``trace=True`` the wall and CPU time, item
+        counts and memory of each stage are recorded and printed at the end;
+        ``profile`` (``'cprofile'`` or ``'tracemalloc'``) additionally
+        profiles each stage, saving cProfile output to ``profile_dir``.
+        With ``dry_run=True`` nothing is downloaded; instead the number of
+        Scopus calls of each stage is estimated from the cache state and
+        compared with the last known quota (see ``scopuscite.planner``).
+        With ``export_format`` (``'parquet'``, ``'feather'`` or ``'csv'``)
+        authors and publications are also exported with one column per year
+        (see ``scopuscite.export``). With ``dataset=True`` they are also saved
+        as memory-mapped datasets (see ``scopuscite.dataset``). Requests are
+        sent to ``base_url`` instead of the Scopus API if it is given.
+        With ``delta=True`` cached author lists and publication sets are
+        synced incrementally, searching only for records added to Scopus
+        since they were fetched; the added ids are saved in
+        ``<operation_name>_added.json``. ``cite_type`` is ``'all'`` or a list
+        of citation variants such as ``['all', 'exclude-self']``, which are
+        fetched together and merged into one row per publication (see
+        ``Scopus.get_publication_info``). The list must include ``'all'``.
+
+    Returns
+    -------
+    Plan or None
+        The plan of the job if ``dry_run`` is set.
+
+    Raises
+    ------
+    ValueError
+        If ``cite_type`` does not include ``'all'``.
     '''
     
+    check_cite_type(params)
+
     # Construct output name
     if not os.path.isdir(output_dir):
         os.mkdir(output_dir)
@@ -49,16 +185,26 @@ def download_journal_year_data(year, journal, issn, output_dir, params):
     output_name = os.path.join(output_dir, operation_name)
 
     # Create Scopus object
-    APIKEY = load_api_key()
-    cache_name = params['cache_name'] if 'cache_name' in params else None
-    cache_dir = params['cache_dir'] if 'cache_dir' in params else None
-    scopus =  Scopus(APIKEY, cache_name=cache_name, cache_dir=cache_dir)
+    scopus = create_scopus(params)
+    tracer = scopus.tracer
+    refresh = params['refresh'] if 'refresh' in params else False
+    delta = params['delta'] if 'delta' in params else False
+
+    if 'dry_run' in params and params['dry_run']:
+        plan = create_planner(scopus, params).plan(year, journal, issn,
+                                                   operation_name)
+        plan.report(scopus.quotas)
+        return plan
     
     # Download list of authors
     reload_author_list = params['reload_author_list'] \
                         if 'reload_author_list' in params else False
-    author_ids = scopus.get_authors_from_journal_year(year, journal, issn,
-                            force_reload=reload_author_list)
+    with tracer.span('author_search') as span:
+        author_ids = scopus.get_authors_from_journal_year(year, journal, issn,
+                            force_reload=reload_author_list, refresh=refresh,
+                            delta=delta)
+        added_authors = scopus.added_authors
+        span.items = len(author_ids) if author_ids is not None else 0
     if author_ids is None:
         print('Aborting download. No author_ids found.')
         return None
@@ -66,14 +212,18 @@ def download_journal_year_data(year, journal, issn, output_dir, params):
     # Get basic information about authors
     reload_author_info = params['reload_author_info'] \
                             if 'reload_author_info' in params else False
-    authors = scopus.get_author_info(author_ids, reload_author_info)
+    with tracer.span('author_info') as span:
+        authors = scopus.get_author_info(author_ids, reload_author_info,
+                                         refresh=refresh)
+        span.items = len(authors)
 
-    print('Saving author information to file.')
-    authors.to_pickle(output_name+'_pubs.pkl')
-    print('Exporting author information to csv.')
-    write_author_to_csv(output_name + '_no_cites.csv', authors, 
-                        cites_per_year=False)
-    print('')
+    with tracer.span('save_author_info'):
+        print('Saving author information to file.')
+        authors.to_pickle(output_name+'_pubs.pkl')
+        print('Exporting author information to csv.')
+        write_author_to_csv(output_name + '_no_cites.csv', authors, 
+                            cites_per_year=False)
+        print('')
 
     print('Total authors: {}'.format(len(authors)))
     print('Total publications: {}'.format(authors['npubs'].sum()))
@@ -83,9 +233,10 @@ def download_journal_year_data(year, journal, issn, output_dir, params):
     condition = params['condition'] if 'condition' in params else None
     if condition is not None:
         print('Apply selection to author list.')
-        selection = authors.apply(condition, axis=1)
-        authors = authors[selection]
-        author_ids = authors.index
+        with tracer.span('selection') as span:
+            authors = authors[select(authors, condition)]
+            author_ids = authors.index
+            span.items = len(authors)
 
         print('Authors satisfying condition: {}'.format(len(authors)))
         print('Total publications of selection: {}' \
@@ -95,21 +246,231 @@ def download_journal_year_data(year, journal, issn, output_dir, params):
      # Get list of publications that need to be downloaded
     reload_author_pub = params['reload_author_pub'] \
                         if 'reload_author_pub' in params else False
-    scopus_ids = scopus.get_author_publications(author_ids, 
-                    force_reload=reload_author_pub)
+    with tracer.span('publication_search') as span:
+        scopus_ids = scopus.get_author_publications(author_ids, 
+                        force_reload=reload_author_pub, refresh=refresh,
+                        delta=delta)
+        span.items = len(scopus_ids)
+    save_added_ids(output_name, added_authors, scopus.added_scopus_ids,
+                   params)
     
     reload_pub_info = params['reload_pub_info'] \
                         if 'reload_pub_info' in params else False
-    pubs = scopus.get_publication_info(scopus_ids, params['year_range'], 
-            params['cite_type'], reload_pub_info)
-    pubs.to_pickle(output_name+'_pubs.pkl')
+    with tracer.span('citation_fetch') as span:
+        pubs = scopus.get_publication_info(scopus_ids, params['year_range'], 
+                params['cite_type'], reload_pub_info, refresh=refresh)
+        span.items = len(pubs)
+    with tracer.span('save_pubs'):
+        pubs.to_pickle(output_name+'_pubs.pkl')
 
     print('Aggregate cite-per-year info for authors.')
-    authors = aggregate_author_info(authors, pubs, year_range=None)
-    authors.to_pickle(output_name+'_auth.pkl')
+    with tracer.span('aggregation') as span:
+        authors = aggregate_author_info(authors, pubs, year_range=None)
+        authors.to_pickle(output_name+'_auth.pkl')
+        span.items = len(authors)
     
     print('Export authors+cites to csv.')
-    write_author_to_csv(output_name + '_export.csv', authors, \
+    with tracer.span('export'):
+        write_author_to_csv(output_name + '_export.csv', authors, \
                         cites_per_year=True, year_range=params['year_range'])
+        export_tables(output_name, authors, pubs, params)
+        save_datasets(output_name, authors, pubs, params)
+
+    if 'metrics' in params:
+        scopus.metrics.report()
+    tracer.report()
+
+    return None
+
+def batch_job_names(jobs):
+    '''Output names of the jobs of a batch, see ``download_batch``.'''
+    job_names = []
+    for job in jobs:
+        if len(job) > 3:
+            job_names.append(job[3])
+        else:
+            journal, issn, year = job[:3]
+            job_names.append('{}_{}'.format(
+                journal if journal is not None else issn, year))
+    return job_names
+
+def fetch_batch(scopus, jobs, job_names, params):
+    '''
+    Runs the download stages of a batch, from the author search to the
+    citation overviews, see ``download_batch``.
+
+    Returns
+    -------
+    job_author_ids : list of sets
+        Author ids found for each job.
+    authors : pandas.DataFrame
+        Information about the selected authors of all jobs.
+    pubs : pandas.DataFrame
+        Information about the publications of the selected authors.
+    '''
+
+    check_cite_type(params)
+    tracer = scopus.tracer
+    refresh = params['refresh'] if 'refresh' in params else False
+    delta = params['delta'] if 'delta' in params else False
+    max_workers = params['max_workers'] if 'max_workers' in params else 1
+
+    # Download list of authors for all jobs
+    reload_author_list = params['reload_author_list'] \
+                        if 'reload_author_list' in params else False
+    with tracer.span('author_search') as span:
+        job_author_ids = scopus.get_authors_from_journal_years(
+            [(job[2], job[0], job[1]) for job in jobs],
+            force_reload=reload_author_list, refresh=refresh, delta=delta,
+            max_workers=max_workers)
+        span.items = len(jobs)
+    for name, author_ids in zip(job_names, job_author_ids):
+        if author_ids is None:
+            print('No author_ids found for {}.'.format(name))
+    job_author_ids = [author_ids if author_ids is not None else set() \
+                        for author_ids in job_author_ids]
+
+    # Get basic information about all authors. The condition is applied
+    # while the author information arrives.
+    reload_author_info = params['reload_author_info'] \
+                            if 'reload_author_info' in params else False
+    condition = params['condition'] if 'condition' in params else None
+    with tracer.span('author_info') as span:
+        authors = scopus.get_author_info(set_union(job_author_ids),
+                                         reload_author_info, refresh=refresh,
+                                         condition=condition)
+        span.items = len(authors)
+
+    if condition is not None:
+        print('Authors satisfying condition: {}'.format(len(authors)))
+        print('Total publications of selection: {}' \
+                .format(authors['npubs'].sum()))
+    else:
+        print('Total authors: {}'.format(len(authors)))
+        print('Total publications: {}'.format(authors['npubs'].sum()))
+    print('')
+
+    # Get publications of all selected authors
+    reload_author_pub = params['reload_author_pub'] \
+                        if 'reload_author_pub' in params else False
+    with tracer.span('publication_search') as span:
+        scopus_ids = scopus.get_author_publications(authors.index,
+                        force_reload=reload_author_pub, refresh=refresh,
+                        delta=delta, max_workers=max_workers)
+        span.items = len(scopus_ids)
+
+    reload_pub_info = params['reload_pub_info'] \
+                        if 'reload_pub_info' in params else False
+    with tracer.span('citation_fetch') as span:
+        pubs = scopus.get_publication_info(scopus_ids, params['year_range'],
+                params['cite_type'], reload_pub_info, refresh=refresh)
+        span.items = len(pubs)
+
+    return job_author_ids, authors, pubs
+
+def warm_cache(jobs, params):
+    '''
+    Fetches everything a batch of jobs needs into the cache without
+    aggregating or writing any output, e.g. to fill the cache ahead of time
+    from a cron job. Takes the same arguments as ``download_batch``.
+
+    Returns
+    -------
+    tuple
+        Number of authors and publications of the batch.
+    '''
+
+    scopus = create_scopus(params)
+    _, authors, pubs = fetch_batch(scopus, jobs, batch_job_names(jobs),
+                                   params)
+    if 'metrics' in params:
+        scopus.metrics.report()
+    scopus.tracer.report()
+    return len(authors), len(pubs)
+
+def download_batch(jobs, output_dir, params):
+    '''
+    Downloads the publications for all authors that have published in several
+    journal-year pairs in one pass.
+
+    All jobs share one Scopus object, i.e. one cache and one connection pool.
+    Author and publication ids are deduplicated across jobs before anything
+    is fetched, so each author and publication is fetched at most once. The
+    outputs are written for each job and for the union of all jobs.
+
+    Parameters
+    ----------
+    jobs : list of tuples
+        Jobs given as ``(journal, issn, year)`` or ``(journal, issn, year,
+        name)``, where ``name`` is used for the output files of the job.
+    output_dir : str
+        Where to save the downloaded files.
+    params : dict
+        Same options as for ``download_journal_year_data``. The merged output
+        is saved under ``operation_name`` and ``max_workers`` sets the number
+        of concurrent requests to Scopus. With ``dry_run=True`` the calls of
+        each job are planned and scheduled across quota windows instead.
+
+    Returns
+    -------
+    list of Plan or None
+        The plans of the jobs if ``dry_run`` is set.
+    '''
+
+    if not os.path.isdir(output_dir):
+        os.mkdir(output_dir)
+
+    job_names = batch_job_names(jobs)
+    merged_name = params['operation_name'] \
+                    if 'operation_name' in params else 'batch'
+
+    scopus = create_scopus(params)
+    tracer = scopus.tracer
+
+    if 'dry_run' in params and params['dry_run']:
+        planner = create_planner(scopus, params)
+        plans = [planner.plan(job[2], job[0], job[1], name) \
+                    for job, name in zip(jobs, job_names)]
+        for plan in plans:
+            plan.report(scopus.quotas)
+        print_schedule(schedule_jobs(plans, scopus.quotas))
+        return plans
+
+    job_author_ids, authors, pubs = fetch_batch(scopus, jobs, job_names,
+                                                params)
+    save_added_ids(os.path.join(output_dir, merged_name),
+                   scopus.added_authors, scopus.added_scopus_ids, params)
+
+    # Aggregation is done per author, so we aggregate once for all jobs
+    print('Aggregate cite-per-year info for authors.')
+    with tracer.span('aggregation') as span:
+        authors = aggregate_author_info(authors, pubs, year_range=None)
+        author_pubs = pubs_by_author(pubs)
+        span.items = len(authors)
+
+    outputs = list(zip(job_names, job_author_ids)) + \
+                [(merged_name, set(authors.index))]
+    export_span = tracer.start('export')
+    for name, author_ids in outputs:
+        print('Saving output {}.'.format(name))
+        output_name = os.path.join(output_dir, name)
+        job_authors = authors[authors.index.isin(author_ids)]
+        job_scopus_ids = set_union(author_pubs[a] for a in job_authors.index \
+                                    if a in author_pubs)
+        job_pubs = pubs[pubs.index.isin(job_scopus_ids)]
+
+        job_pubs.to_pickle(output_name + '_pubs.pkl')
+        job_authors.to_pickle(output_name + '_auth.pkl')
+        write_author_to_csv(output_name + '_export.csv', job_authors,
+                            cites_per_year=True,
+                            year_range=params['year_range'])
+        export_tables(output_name, job_authors, job_pubs, params)
+        save_datasets(output_name, job_authors, job_pubs, params)
+    tracer.finish(export_span, items=len(outputs))
+    print('')
+
+    if 'metrics' in params:
+        scopus.metrics.report()
+    tracer.report()
 
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,193 @@
+"""Columnar export of author and publication dataframes.
+
+Columns holding one array per row, such as ``cites_by_year``, are expanded
+into one integer column per year, e.g. ``cites_by_year_2016``, so that the
+exported tables can be read by tools other than Python. Tables are written in
+chunks as Parquet or Feather if ``pyarrow`` is installed and as csv
+otherwise.
+
+Example
+-------
+>>> write_table(authors, 'authors.parquet', year_range=(1960, 2019))
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ARRAY_COLUMNS = ['cites_by_year', 'cites_by_year_excl_self',
+                 'cites_by_year_excl_books', 'pubs_by_year', 'ncoauthors_acc',
+                 'ncites_acc', 'npubs_acc', 'hindex_acc']
+LIST_COLUMNS = ['authors']
+FORMATS = {'.parquet' : 'parquet', '.feather' : 'feather', '.csv' : 'csv'}
+
+def array_block(values, num_years):
+    '''
+    Stacks a column of per-year arrays into a 2D array.
+
+    Parameters
+    ----------
+    values : sequence
+        One array of length ``num_years`` per row. Other entries, e.g. the 0
+        stored for authors without publications, become rows of zeros.
+    num_years : int
+        Number of years.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape ``(len(values), num_years)``.
+    '''
+
+    block = np.zeros((len(values), num_years), dtype=np.int64)
+    rows = [idx for idx, value in enumerate(values) \
+            if isinstance(value, (np.ndarray, list)) and \
+                len(value) == num_years]
+    if rows:
+        block[rows] = np.stack([values[idx] for idx in rows])
+    return block
+
+def _years(df, columns, year_range):
+    '''Years of the array columns, from year_range or the data.'''
+    if year_range is not None:
+        return list(range(*year_range)) if isinstance(year_range, tuple) \
+                else list(year_range)
+
+    for col in columns:
+        for value in df[col]:
+            if isinstance(value, (np.ndarray, list)):
+                # Author tables have no cites_start_year
+                if 'cites_start_year' not in df.columns:
+                    raise ValueError('The years of the array columns cannot '
+                        'be inferred, year_range is required.')
+                start_year = int(df['cites_start_year'].iloc[0])
+                return list(range(start_year, start_year + len(value)))
+    return []
+
+def expand_array_columns(df, year_range=None, columns=None):
+    '''
+    Expands columns holding per-year arrays into one column per year.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Author or publication dataframe.
+    year_range : tuple or range, optional
+        Years of the arrays. By default the years start at
+        ``cites_start_year``. Required if the dataframe has no such column,
+        e.g. for author dataframes.
+    columns : list, optional
+        Columns to expand, by default those of ``ARRAY_COLUMNS`` in df.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Dataframe with columns ``<column>_<year>`` instead of the array
+        columns.
+
+    Raises
+    ------
+    ValueError
+        If year_range is not given and cannot be inferred.
+    '''
+
+    if columns is None:
+        columns = [col for col in ARRAY_COLUMNS if col in df.columns]
+    if not columns:
+        return df
+
+    years = _years(df, columns, year_range)
+    parts = [df.drop(columns=columns)]
+    for col in columns:
+        block = array_block(df[col].values, len(years))
+        parts.append(pd.DataFrame(block, index=df.index,
+            columns=['{}_{}'.format(col, year) for year in years]))
+    return pd.concat(parts, axis=1)
+
+def export_format(filename, format=None):
+    '''Format of an export, falling back to csv if pyarrow is missing.'''
+    if format is None:
+        format = FORMATS.get(os.path.splitext(filename)[1], 'csv')
+    if format not in {'parquet', 'feather', 'csv'}:
+        raise ValueError('Unknown export format {}.'.format(format))
+    if format != 'csv' and pyarrow is None:
+        print('pyarrow is not installed, exporting as csv.')
+        format = 'csv'
+    return format
+
+def write_table(df, filename, format=None, year_range=None,
+                chunk_size=100000, sep=';'):
+    '''
+    Writes an author or publication dataframe with expanded array columns.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Author or publication dataframe.
+    filename : str
+        Output file. If the format is csv and the extension differs, it is
+        replaced by ``.csv``.
+    format : str, optional
+        ``'parquet'``, ``'feather'`` or ``'csv'``, by default from the
+        extension of filename.
+    year_range : tuple or range, optional
+        Years of the array columns, see ``expand_array_columns``.
+    chunk_size : int
+        Number of rows converted and written at once.
+    sep : str
+        Separator of csv files.
+
+    Returns
+    -------
+    str
+        Name of the written file.
+    '''
+
+    format = export_format(filename, format)
+    if format == 'csv' and not filename.endswith('.csv'):
+        filename = os.path.splitext(filename)[0] + '.csv'
+
+    # Fix the year columns for all chunks
+    columns = [col for col in ARRAY_COLUMNS if col in df.columns]
+    years = _years(df, columns, year_range)
+    df = df.reset_index()
+
+    writer = None
+    tables = []
+    for start in range(0, max(len(df), 1), chunk_size):
+        chunk = expand_array_columns(df.iloc[start:start+chunk_size], years,
+                                     columns)
+        if format == 'csv':
+            for col in LIST_COLUMNS:
+                if col in chunk.columns:
+                    chunk[col] = chunk[col].map(','.join)
+            chunk.to_csv(filename, sep=sep, index=False,
+                         mode='w' if start == 0 else 'a', header=start == 0)
+            continue
+
+        schema = writer.schema if writer is not None else None
+        if schema is None and tables:
+            schema = tables[0].schema
+        table = pyarrow.Table.from_pandas(chunk, schema=schema,
+                                          preserve_index=False)
+        if format == 'parquet':
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(filename, table.schema)
+            writer.write_table(table)
+        else:
+            tables.append(table)
+
+    if writer is not None:
+        writer.close()
+    if format == 'feather':
+        pyarrow.feather.write_feather(pyarrow.concat_tables(tables), filename)
+
+    return filename
@@ -0,0 +1,112 @@
+"""Declarative selection of authors.
+
+Conditions are given as ``DataFrame.eval`` expressions over the columns of
+the author dataframe, e.g. ``'first_pub <= 1998 and npubs >= 10'``, or built
+from column expressions, e.g. ``(col('first_pub') <= 1998) & (col('npubs')
+>= 10)``. They are evaluated vectorized on a whole dataframe instead of row
+by row. Python functions of a row are still accepted and applied with
+``DataFrame.apply``.
+
+Example
+-------
+>>> authors = authors[select(authors, 'first_pub <= 1998')]
+"""
+
+from scopuscite.utils import lazy_import
+
+np = lazy_import('numpy')
+
+class Filter(object):
+    """Selection given by a ``DataFrame.eval`` expression.
+
+    Filters can be combined with ``&``, ``|`` and ``~``.
+    """
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def mask(self, df):
+        '''Boolean array selecting the rows of df.'''
+        if len(df) == 0:
+            return np.zeros(0, dtype=bool)
+        mask = df.eval(self.expr)
+        return np.broadcast_to(np.asarray(mask, dtype=bool), (len(df),))
+
+    def __and__(self, other):
+        return Filter('({}) & ({})'.format(self.expr, as_filter(other).expr))
+
+    def __or__(self, other):
+        return Filter('({}) | ({})'.format(self.expr, as_filter(other).expr))
+
+    def __invert__(self):
+        return Filter('~({})'.format(self.expr))
+
+    def __repr__(self):
+        return 'Filter({!r})'.format(self.expr)
+
+class Column(object):
+    """Column of the author dataframe, compared to values to build filters."""
+
+    def __init__(self, name):
+        self.name = name if name.isidentifier() else '`{}`'.format(name)
+
+    def _compare(self, op, value):
+        return Filter('{} {} {!r}'.format(self.name, op, value))
+
+    def __lt__(self, value):
+        return self._compare('<', value)
+
+    def __le__(self, value):
+        return self._compare('<=', value)
+
+    def __gt__(self, value):
+        return self._compare('>', value)
+
+    def __ge__(self, value):
+        return self._compare('>=', value)
+
+    def __eq__(self, value):
+        return self._compare('==', value)
+
+    def __ne__(self, value):
+        return self._compare('!=', value)
+
+    def isin(self, values):
+        return self._compare('in', list(values))
+
+def col(name):
+    '''Column expression for building filters.'''
+    return Column(name)
+
+def as_filter(condition):
+    '''Converts an expression string to a Filter. Filters are returned
+    unchanged and Python functions of a row give None.'''
+    if isinstance(condition, Filter):
+        return condition
+    if isinstance(condition, str):
+        return Filter(condition)
+    return None
+
+def select(df, condition):
+    '''
+    Evaluates a condition on a dataframe.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Author dataframe.
+    condition : str, Filter or callable
+        Expression, filter or function of a row returning a bool.
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array selecting the rows of df satisfying the condition.
+    '''
+
+    flt = as_filter(condition)
+    if flt is not None:
+        return flt.mask(df)
+    if len(df) == 0:
+        return np.zeros(0, dtype=bool)
+    return np.asarray(df.apply(condition, axis=1), dtype=bool)
@@ -0,0 +1,97 @@
+"""JSON encoding and decoding with the fastest available backend.
+
+Responses of the Scopus API and the packed cache entries are decoded with
+``orjson`` if it is installed, otherwise with ``ujson`` and otherwise with
+the ``json`` module of the standard library. All backends read and write
+the same compact json, so caches written with one backend can be read with
+any other. The backend can be chosen with the environment variable
+``SCOPUSCITE_JSON`` or with ``set_backend``.
+
+Example
+-------
+>>> from scopuscite import jsonlib
+>>> jsonlib.dumps({'a' : [1, 2]})
+b'{"a":[1,2]}'
+>>> jsonlib.loads(b'{"a":[1,2]}')
+{'a': [1, 2]}
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Backends in order of preference
+BACKENDS = ['orjson', 'ujson', 'json']
+
+def _json_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8')
+
+def _ujson_dumps(obj):
+    return ujson.dumps(obj, ensure_ascii=False,
+                       escape_forward_slashes=False).encode('utf-8')
+
+def _ujson_loads(data):
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+    return ujson.loads(data)
+
+_FUNCS = {
+    'orjson' : (lambda data : orjson.loads(data),
+                lambda obj : orjson.dumps(obj)),
+    'ujson' : (_ujson_loads, _ujson_dumps),
+    'json' : (json.loads, _json_dumps),
+}
+
+def available_backends():
+    '''Names of the installed backends, fastest first.'''
+    modules = {'orjson' : orjson, 'ujson' : ujson, 'json' : json}
+    return [name for name in BACKENDS if modules[name] is not None]
+
+def set_backend(name=None):
+    '''
+    Selects the backend used by ``loads`` and ``dumps``.
+
+    Parameters
+    ----------
+    name : str, optional
+        One of ``'orjson'``, ``'ujson'`` or ``'json'``. By default the
+        fastest installed backend is used.
+
+    Returns
+    -------
+    str
+        Name of the selected backend.
+    '''
+
+    global backend, _loads, _dumps
+
+    if name is None:
+        name = available_backends()[0]
+    if name not in BACKENDS:
+        raise ValueError('Unknown json backend {}.'.format(name))
+    if name not in available_backends():
+        raise ImportError('json backend {} is not installed.'.format(name))
+    backend = name
+    _loads, _dumps = _FUNCS[name]
+    return backend
+
+def loads(data):
+    '''Parses json given as bytes or str. Raises ValueError for invalid
+    json with every backend.'''
+    return _loads(data)
+
+def dumps(obj):
+    '''Serializes an object as compact utf-8 encoded json bytes.'''
+    return _dumps(obj)
+
+set_backend(os.environ.get('SCOPUSCITE_JSON') or None)
@@ -0,0 +1,201 @@
+"""Metrics collected while querying Scopus.
+
+A Metrics object keeps counters, gauges and histograms, each identified by a
+name and optional labels, e.g. ``requests{endpoint=citation}``. Every update
+is also sent to the sinks of the object as a record (a dict), so that metrics
+can be written to a file, passed to the logging module or to a callback as
+they are recorded.
+
+Example
+-------
+>>> metrics = Metrics(sinks=[JsonlSink('metrics.jsonl')])
+>>> scopus = Scopus(apikey, metrics=metrics)
+>>> ...
+>>> metrics.report()
+"""
+
+import bisect
+import contextlib
+import json
+import logging
+import threading
+import time
+
+# Upper bounds of histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5.,
+                   10., float('inf'))
+# Log-spaced buckets from 1 microsecond to about 3 hours, for decoding and
+# stage times, which range from far below to far above the request latency
+TIMING_BUCKETS = tuple(float('{}e{}'.format(m, e)) for e in range(-6, 4) \
+                       for m in ('1', '2.5', '5')) + (float('inf'),)
+
+def metric_key(name, labels):
+    '''String identifying a metric and its labels.'''
+    if not labels:
+        return name
+    return '{}{{{}}}'.format(name, ','.join('{}={}'.format(k, labels[k]) \
+                                            for k in sorted(labels)))
+
+class Histogram(object):
+    """Histogram with fixed buckets, keeping count, sum, min and max."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        '''Approximate quantile, the upper bound of the containing bucket.'''
+        if self.count == 0:
+            return None
+        target = q * self.count
+        acc = 0
+        for bound, count in zip(self.buckets, self.counts):
+            acc += count
+            if acc >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count' : self.count, 'sum' : self.sum,
+                'min' : self.min if self.count else None,
+                'max' : self.max if self.count else None,
+                'p50' : self.quantile(0.5), 'p95' : self.quantile(0.95),
+                'buckets' : [[b, c] for b, c in \
+                    zip(self.buckets[:-1], self.counts[:-1])] + \
+                    [['inf', self.counts[-1]]]}
+
+class CallbackSink(object):
+    """Passes each record to a function."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, record):
+        self.callback(record)
+
+class JsonlSink(object):
+    """Appends each record as a line of json to a file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._fp = open(filename, 'a')
+
+    def emit(self, record):
+        self._fp.write(json.dumps(record) + '\n')
+        self._fp.flush()
+
+    def close(self):
+        self._fp.close()
+
+class LoggingSink(object):
+    """Sends each record to a logger."""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger is not None else \
+                        logging.getLogger('scopuscite')
+        self.level = level
+
+    def emit(self, record):
+        self.logger.log(self.level, '%s %s', record['name'],
+                        json.dumps(record))
+
+class Metrics(object):
+    """Collection of counters, gauges and histograms.
+
+    Parameters
+    ----------
+    sinks : list, optional
+        Objects with a method ``emit(record)`` receiving every update.
+    """
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks) if sinks is not None else []
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def _emit(self, kind, name, value, labels):
+        if not self.sinks:
+            return
+        record = {'time' : time.time(), 'type' : kind, 'name' : name,
+                  'value' : value, 'labels' : labels}
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def increment(self, name, value=1, **labels):
+        '''Adds value to a counter.'''
+        key = metric_key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._emit('counter', name, value, labels)
+
+    def gauge(self, name, value, **labels):
+        '''Sets a gauge to value.'''
+        key = metric_key(name, labels)
+        with self._lock:
+            self.gauges[key] = value
+        self._emit('gauge', name, value, labels)
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        '''Adds a value to a histogram.'''
+        key = metric_key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+        self._emit('histogram', name, value, labels)
+
+    @contextlib.contextmanager
+    def timer(self, name, buckets=TIMING_BUCKETS, **labels):
+        '''Observes the time spent in a with block.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, buckets,
+                         **labels)
+
+    def snapshot(self):
+        '''Current values of all metrics as a dict.'''
+        with self._lock:
+            return {'counters' : dict(self.counters),
+                    'gauges' : dict(self.gauges),
+                    'histograms' : {k : h.to_dict() \
+                        for k, h in self.histograms.items()}}
+
+    def hit_rate(self, cache):
+        '''Fraction of cache lookups that were hits for a given cache.'''
+        hits = self.counters.get(
+            metric_key('cache_hits', {'cache' : cache}), 0)
+        misses = self.counters.get(
+            metric_key('cache_misses', {'cache' : cache}), 0)
+        if hits + misses == 0:
+            return None
+        return hits / (hits + misses)
+
+    def report(self):
+        '''Prints a summary of all metrics.'''
+        snapshot = self.snapshot()
+        print('Metrics summary')
+        for key in sorted(snapshot['counters']):
+            print('  {:50s} {}'.format(key, snapshot['counters'][key]))
+        for key in sorted(snapshot['gauges']):
+            print('  {:50s} {}'.format(key, snapshot['gauges'][key]))
+        for key in sorted(snapshot['histograms']):
+            h = snapshot['histograms'][key]
+            print('  {:50s} n={} sum={:.3f} p50={:.6f} p95={:.6f} '
+                  'max={:.6f}'.format(key, h['count'], h['sum'], h['p50'],
+                                      h['p95'], h['max']))
+        print('')
@@ -0,0 +1,400 @@
+"""Local stand-in for the Scopus API.
+
+The server answers the four endpoints used by the Scopus object (search,
+author retrieval, citation overview and abstract retrieval) with responses
+from a synthetic world of authors and publications or from a recording made
+with ``scopuscite.transport.RecordingTransport``. Latency, errors, rate limit
+headers and RESOURCE_NOT_FOUND responses can be configured, so that the
+client can be benchmarked without network access and without using quota.
+
+Example
+-------
+>>> with MockScopusServer(latency=0.05) as server:
+...     scopus = Scopus('key', base_url=server.url)
+...     authors = scopus.get_authors_from_journal_year(2016, issn='0003486X')
+
+The server can also be started from the command line with
+``python -m scopuscite.mock_server --port 8080``.
+"""
+
+import argparse
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from scopuscite.transport import request_key
+
+JOURNALS = [('Annals of Mathematics', '0003486X'),
+            ('Duke Mathematical Journal', '00127094'),
+            ('Inventiones Mathematicae', '00209910'),
+            ('Nature Physics', '17452473'),
+            ('PLoS Biology', '15449173')]
+
+AFFILIATIONS = ['University of Cambridge', 'ETH Zurich', 'Princeton University',
+                'Brunel University London', 'Universite Paris-Saclay']
+
+SEARCH_PATH = '/content/search/scopus'
+AUTHOR_PATH = '/content/author'
+CITATION_PATH = '/content/abstract/citations'
+ABSTRACT_PATH = '/content/abstract/scopus_id/'
+
+class SyntheticWorld(object):
+    """Random, but reproducible, set of authors and publications.
+
+    Parameters
+    ----------
+    num_authors : int
+        Number of authors.
+    num_pubs : int
+        Number of publications.
+    year_range : tuple
+        Publications appear in the years ``start, ..., end-1``.
+    seed : int
+        Seed of the random number generator.
+    """
+
+    def __init__(self, num_authors=2000, num_pubs=10000,
+                 year_range=(1960, 2020), seed=0):
+        rng = random.Random(seed)
+        self.year_range = year_range
+
+        self.author_ids = [str(7000000000 + i) for i in range(num_authors)]
+        # Some authors are much more productive than others
+        weights = [rng.paretovariate(2.) for _ in self.author_ids]
+
+        self.pubs = {}
+        self.author_pubs = {a : [] for a in self.author_ids}
+        for i in range(num_pubs):
+            scopus_id = str(84000000000 + i)
+            num_authors_pub = min(int(rng.paretovariate(1.5)), 20)
+            authors = list(set(rng.choices(self.author_ids, weights,
+                                           k=num_authors_pub)))
+            year = rng.randrange(*year_range)
+            journal, issn = rng.choice(JOURNALS)
+
+            # Citations are spread over the years after publication
+            total = int(rng.paretovariate(1.1)) - 1
+            cites = {}
+            for _ in range(min(total, 1000)):
+                cite_year = min(year + int(rng.expovariate(0.2)),
+                                year_range[1] - 1)
+                cites[cite_year] = cites.get(cite_year, 0) + 1
+
+            self.pubs[scopus_id] = {'year' : year, 'journal' : journal,
+                'issn' : issn, 'authors' : authors, 'cites' : cites,
+                'title' : 'Synthetic publication {}'.format(i)}
+            for a in authors:
+                self.author_pubs[a].append(scopus_id)
+
+        self.authors = {}
+        for idx, a in enumerate(self.author_ids):
+            pubs = [self.pubs[s] for s in self.author_pubs[a]]
+            ncites = [sum(p['cites'].values()) for p in pubs]
+            years = [p['year'] for p in pubs]
+            coauthors = set()
+            for p in pubs:
+                coauthors |= set(p['authors'])
+            self.authors[a] = {'npubs' : len(pubs), 'ncites' : sum(ncites),
+                'first_pub' : min(years) if years else 0,
+                'last_pub' : max(years) if years else 0,
+                'hindex' : sum(1 for k, c in \
+                    enumerate(sorted(ncites, reverse=True)) if c > k),
+                'ncoauthors' : max(len(coauthors) - 1, 0),
+                'affiliation' : AFFILIATIONS[idx % len(AFFILIATIONS)]}
+
+    def search(self, query):
+        '''Returns the scopus ids matching a search query.'''
+        match = re.search(r'AU-ID\((\d+)\)', query)
+        if match:
+            return list(self.author_pubs.get(match.group(1), []))
+
+        res = list(self.pubs)
+        match = re.search(r'PUBYEAR\+IS\+(\d+)', query)
+        if match:
+            year = int(match.group(1))
+            res = [s for s in res if self.pubs[s]['year'] == year]
+        match = re.search(r'ISSN\((\w+)\)', query)
+        if match:
+            res = [s for s in res if self.pubs[s]['issn'] == match.group(1)]
+        match = re.search(r'SRCTITLE\(([^)]*)\)', query)
+        if match:
+            title = match.group(1).lower()
+            res = [s for s in res if title in self.pubs[s]['journal'].lower()]
+        return res
+
+    def search_entry(self, scopus_id):
+        pub = self.pubs[scopus_id]
+        return {'eid' : '2-s2.0-' + scopus_id,
+                'author' : [{'authid' : a} for a in pub['authors']]}
+
+    def author_entry(self, author_id):
+        info = self.authors[author_id]
+        idx = int(author_id) - 7000000000
+        return {
+            'coredata' : {
+                'dc:identifier' : 'AUTHOR_ID:' + author_id,
+                'document-count' : str(info['npubs']),
+                'citation-count' : str(info['ncites']),
+                'cited-by-count' : str(info['ncites']),
+            },
+            'author-profile' : {
+                'preferred-name' : {
+                    'indexed-name' : 'Author{} A.'.format(idx),
+                    'given-name' : 'A.',
+                    'surname' : 'Author{}'.format(idx),
+                },
+                'publication-range' : {'@start' : str(info['first_pub']),
+                                       '@end' : str(info['last_pub'])},
+                'affiliation-current' : {'affiliation' : {'ip-doc' : {
+                    'afdispname' : info['affiliation']}}},
+            },
+            'coauthor-count' : str(info['ncoauthors']),
+            'h-index' : str(info['hindex']),
+        }
+
+    def cite_info_entry(self, scopus_id, start, end):
+        '''Citation overview of a publication for the years start-end.'''
+        pub = self.pubs[scopus_id]
+        cites = pub['cites']
+        return {
+            'dc:identifier' : 'SCOPUS_ID:' + scopus_id,
+            'dc:title' : pub['title'],
+            'prism:publicationName' : pub['journal'],
+            'prism:issn' : pub['issn'],
+            'sort-year' : str(pub['year']),
+            'author' : [{'authid' : a} for a in pub['authors']],
+            'pcc' : str(sum(c for y, c in cites.items() if y < start)),
+            'cc' : [{'$' : str(cites.get(y, 0))} \
+                        for y in range(start, end + 1)],
+            'lcc' : str(sum(c for y, c in cites.items() if y > end)),
+        }
+
+    def abstract_entry(self, scopus_id):
+        pub = self.pubs[scopus_id]
+        return {'coredata' : {
+            'dc:identifier' : 'SCOPUS_ID:' + scopus_id,
+            'eid' : '2-s2.0-' + scopus_id,
+            'dc:title' : pub['title'],
+            'prism:publicationName' : pub['journal'],
+            'prism:issn' : pub['issn'],
+            'prism:coverDate' : '{}-01-01'.format(pub['year']),
+            'citedby-count' : str(sum(pub['cites'].values())),
+        }}
+
+def not_found_body():
+    return {'service-error' : {'status' : {
+        'statusCode' : 'RESOURCE_NOT_FOUND',
+        'statusText' : 'The resource specified cannot be found.'}}}
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           http.server.HTTPServer):
+    daemon_threads = True
+
+class MockScopusServer(object):
+    """Local HTTP server standing in for the Scopus API.
+
+    Parameters
+    ----------
+    host : str
+        Host to bind to.
+    port : int
+        Port to bind to, 0 picks a free port.
+    world : SyntheticWorld, optional
+        Synthetic data served by the server.
+    records : str, optional
+        Recording made with RecordingTransport. Recorded requests are answered
+        from the recording, all others from the synthetic world.
+    latency : float
+        Mean latency of each response in seconds.
+    error_rate : float
+        Fraction of requests answered with a 503 error.
+    not_found_rate : float
+        Fraction of author, citation and abstract requests answered with a
+        RESOURCE_NOT_FOUND error.
+    rate_limit : int
+        Value of the ``X-RateLimit-Limit`` header. The remaining quota is
+        decremented with each request.
+    seed : int
+        Seed for latency and error injection.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, world=None, records=None,
+                 latency=0., error_rate=0., not_found_rate=0.,
+                 rate_limit=20000, seed=0):
+        self.world = world if world is not None else SyntheticWorld()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.rate_limit = rate_limit
+        self.remaining = rate_limit
+        self.reset = int(time.time()) + 7 * 24 * 60 * 60
+        self.num_requests = 0
+
+        self.records = {}
+        if records is not None:
+            with open(records, 'r') as fp:
+                for line in fp:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records[record['key']] = record
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+            def log_message(self, format, *args):
+                pass
+        self.httpd = _ThreadingHTTPServer((host, port), Handler)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        '''Starts serving in a background thread.'''
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _handle(self, request):
+        url = urlsplit(request.path)
+        params = {k : v[0] for k, v in parse_qs(url.query).items()}
+
+        with self._lock:
+            self.num_requests += 1
+            self.remaining = max(self.remaining - 1, 0)
+            headers = {'X-RateLimit-Limit' : str(self.rate_limit),
+                       'X-RateLimit-Remaining' : str(self.remaining),
+                       'X-RateLimit-Reset' : str(self.reset),
+                       'Content-Type' : 'application/json'}
+            latency = self._rng.expovariate(1. / self.latency) \
+                        if self.latency > 0 else 0.
+            error = self._rng.random() < self.error_rate
+            not_found = self._rng.random() < self.not_found_rate
+
+        time.sleep(latency)
+
+        key = request_key(url.path, params)
+        if key in self.records:
+            record = self.records[key]
+            status, body = record['status'], record['body']
+        elif error:
+            status, body = 503, json.dumps({'service-error' : {'status' : {
+                'statusCode' : 'GENERAL_SYSTEM_ERROR',
+                'statusText' : 'Service unavailable.'}}})
+        else:
+            status, js = self._respond(url.path, params, not_found)
+            body = json.dumps(js)
+
+        content = body.encode('utf-8')
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header('Content-Length', str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
+
+    def _respond(self, path, params, not_found):
+        world = self.world
+
+        if path == SEARCH_PATH:
+            scopus_ids = world.search(params.get('query', ''))
+            start = int(params.get('start', 0))
+            count = int(params.get('count', 25))
+            entries = [world.search_entry(s) \
+                        for s in scopus_ids[start:start + count]]
+            if not scopus_ids:
+                entries = [{'error' : 'Result set was empty'}]
+            return 200, {'search-results' : {
+                'opensearch:totalResults' : str(len(scopus_ids)),
+                'opensearch:startIndex' : str(start),
+                'opensearch:itemsPerPage' : str(len(entries)),
+                'entry' : entries}}
+
+        if path == AUTHOR_PATH:
+            author_ids = [a for a in params.get('author_id', '').split(',') \
+                            if a in world.authors]
+            if not_found or not author_ids:
+                return 404, not_found_body()
+            return 200, {'author-retrieval-response-list' : {
+                'author-retrieval-response' : \
+                    [world.author_entry(a) for a in author_ids]}}
+
+        if path == CITATION_PATH:
+            scopus_ids = [s for s in params.get('scopus_id', '').split(',') \
+                            if s in world.pubs]
+            if not_found or not scopus_ids:
+                return 404, not_found_body()
+            if 'date' in params:
+                start, end = [int(y) for y in params['date'].split('-')]
+            else:
+                start, end = world.year_range[0], world.year_range[1] - 1
+            return 200, {'abstract-citations-response' : {
+                'citeInfoMatrix' : {'citeInfoMatrixXML' : {
+                    'citationMatrix' : {'citeInfo' : \
+                        [world.cite_info_entry(s, start, end) \
+                            for s in scopus_ids]}}}}}
+
+        if path.startswith(ABSTRACT_PATH):
+            scopus_id = path[len(ABSTRACT_PATH):]
+            if not_found or scopus_id not in world.pubs:
+                return 404, not_found_body()
+            return 200, {'abstract-retrieval-response' : \
+                            world.abstract_entry(scopus_id)}
+
+        return 404, not_found_body()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local stand-in server for the Scopus API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--records', default=None,
+                        help='Recording to serve responses from.')
+    parser.add_argument('--num-authors', type=int, default=2000)
+    parser.add_argument('--num-pubs', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--not-found-rate', type=float, default=0.)
+    parser.add_argument('--rate-limit', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    world = SyntheticWorld(args.num_authors, args.num_pubs, seed=args.seed)
+    server = MockScopusServer(args.host, args.port, world=world,
+        records=args.records, latency=args.latency,
+        error_rate=args.error_rate, not_found_rate=args.not_found_rate,
+        rate_limit=args.rate_limit, seed=args.seed)
+    print('Serving Scopus stand-in at {}'.format(server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""Planning of the Scopus calls needed by a download.
+
+The planner inspects the caches of a Scopus object, without calling the API,
+and counts the calls each stage of a journal-year download would make: the
+pages of the journal search, the batches of author retrievals, the searches
+for the publications of each author and the batches of citation overviews.
+Where a stage depends on results that are not cached yet, e.g. the authors
+of a journal search that has not been run, the number of calls is estimated
+from typical sizes and the stage is marked as an estimate.
+
+Plans are compared with the last known quota of each endpoint, which the
+Scopus object saves in its cache directory, and can be scheduled across
+quota windows.
+
+Example
+-------
+>>> planner = Planner(scopus, year_range=(1960, 2019))
+>>> plans = [planner.plan(2016, issn='0003486X', name='annals_2016'),
+...          planner.plan(2016, issn='00127094', name='duke_2016')]
+>>> print_schedule(schedule_jobs(plans, scopus.quotas))
+"""
+
+import math
+import time
+
+from scopuscite.cache import SECONDS_PER_DAY, entry_value, stale_keys, \
+    unpack
+from scopuscite.filters import select
+from scopuscite.scopus import journal_year_query, AuthorColumns, BATCH_SIZES
+from scopuscite.utils import set_union
+
+# Results per call, as initially requested by the Scopus object. The sizes
+# adapt during a download, mostly shrinking after errors, so the number of
+# calls can be larger.
+SEARCH_PAGE_SIZE = BATCH_SIZES['search'][0]
+AUTHOR_PAGE_SIZE = BATCH_SIZES['author_pub'][0]
+AUTHOR_BATCH_SIZE = BATCH_SIZES['author'][0]
+CITATION_BATCH_SIZE = BATCH_SIZES['citation'][0]
+
+# Default weekly quotas of the endpoints, used if no quota is known yet
+QUOTA_WINDOW = 7 * SECONDS_PER_DAY
+DEFAULT_QUOTAS = {'search' : 20000, 'author' : 5000, 'citation' : 20000}
+
+STAGE_ENDPOINTS = {'author_search' : 'search', 'author_info' : 'author',
+                   'author_pub' : 'search', 'pub_info' : 'citation'}
+
+def remaining_quota(quotas, endpoint, now=None):
+    '''Last known remaining quota of an endpoint, the full limit if the
+    quota has been reset since and the default quota if nothing is known.'''
+    quotas = quotas if quotas is not None else {}
+    if endpoint not in quotas:
+        return DEFAULT_QUOTAS[endpoint]
+    quota = quotas[endpoint]
+    now = time.time() if now is None else now
+    if quota.get('reset') is not None and quota['reset'] <= now:
+        return quota['limit']
+    return quota['remaining']
+
+def quota_limit(quotas, endpoint):
+    '''Quota of an endpoint per window.'''
+    quotas = quotas if quotas is not None else {}
+    if endpoint not in quotas:
+        return DEFAULT_QUOTAS[endpoint]
+    return quotas[endpoint]['limit']
+
+class Plan(object):
+    """Number of calls of each stage of a job."""
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+
+    def add_stage(self, stage, items, cached, stale, calls, exact):
+        self.stages.append({'stage' : stage,
+                            'endpoint' : STAGE_ENDPOINTS[stage],
+                            'items' : items, 'cached' : cached,
+                            'stale' : stale, 'calls' : calls,
+                            'exact' : exact})
+
+    @property
+    def calls(self):
+        return sum(stage['calls'] for stage in self.stages)
+
+    @property
+    def exact(self):
+        return all(stage['exact'] for stage in self.stages)
+
+    def calls_by_endpoint(self):
+        res = {}
+        for stage in self.stages:
+            endpoint = stage['endpoint']
+            res[endpoint] = res.get(endpoint, 0) + stage['calls']
+        return res
+
+    def fits(self, quotas=None, now=None):
+        '''Whether the job fits into the remaining quota of each endpoint.'''
+        return all(calls <= remaining_quota(quotas, endpoint, now) \
+                    for endpoint, calls in self.calls_by_endpoint().items())
+
+    def report(self, quotas=None):
+        '''Prints the calls of each stage and whether the job fits.'''
+        print('Plan for {}'.format(self.name))
+        print('  {:15s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+            'stage', 'items', 'cached', 'stale', 'calls'))
+        for stage in self.stages:
+            print('  {:15s} {:>10s} {:>10d} {:>10d} {:>10s}'.format(
+                stage['stage'],
+                ('' if stage['exact'] else '~') + str(stage['items']),
+                stage['cached'], stage['stale'],
+                ('' if stage['exact'] else '~') + str(stage['calls'])))
+        for endpoint, calls in sorted(self.calls_by_endpoint().items()):
+            print('  Calls to {}: {} of {} remaining'.format(
+                endpoint, calls, remaining_quota(quotas, endpoint)))
+        if not self.exact:
+            print('  Numbers marked with ~ are estimates.')
+        print('  Job fits into remaining quota: {}'.format(
+            'yes' if self.fits(quotas) else 'no'))
+        print('')
+
+class Planner(object):
+    """Plans the Scopus calls of journal-year downloads from the cache state.
+
+    Successive calls of ``plan`` assume that the earlier jobs have been run,
+    i.e. entries fetched by an earlier job are counted as cached.
+
+    Parameters
+    ----------
+    scopus : Scopus
+        Scopus object whose caches are inspected. No calls are made.
+    year_range : tuple
+        Year range of the citation data, see ``get_publication_info``.
+    cite_type : str or list
+        Type of citations, see ``get_publication_info``. For a list of types
+        every variant is counted separately.
+    condition : callable, optional
+        Selection of authors, see ``download_journal_year_data``. It can only
+        be applied if the information of all authors of a job is cached.
+    refresh : bool
+        If ``True`` cache entries older than their TTL count as fetched.
+    force_reload : bool or collection
+        If ``True`` all cache entries count as fetched. Can also be given as
+        the names of the caches that are reloaded, e.g. ``{'author_info'}``.
+    results_per_query : int
+        Estimated number of publications of a journal-year search.
+    authors_per_pub : float
+        Estimated number of authors per publication.
+    pubs_per_author : float
+        Estimated number of publications of an author, used if the author
+        information is not cached.
+    """
+
+    def __init__(self, scopus, year_range, cite_type='all', condition=None,
+                 refresh=False, force_reload=False,
+                 results_per_query=SEARCH_PAGE_SIZE, authors_per_pub=4.,
+                 pubs_per_author=40.):
+        self.scopus = scopus
+        self.year_range = year_range
+        self.cite_types = [cite_type] if isinstance(cite_type, str) \
+                            else list(dict.fromkeys(cite_type))
+        self.condition = condition
+        self.refresh = refresh
+        if force_reload is True:
+            force_reload = ['search_query', 'author_info', 'author_pub',
+                            'pub_info']
+        self.force_reload = set(force_reload) if force_reload else set()
+        self.results_per_query = results_per_query
+        self.authors_per_pub = authors_per_pub
+        self.pubs_per_author = pubs_per_author
+
+        scopus.load_search_query_cache()
+        scopus.load_author_info_cache()
+        scopus.load_author_pub_cache()
+        scopus.load_pub_info_cache()
+        self.caches = {'search_query' : scopus.cache_search_query,
+                       'author_info' : scopus.cache_author_info,
+                       'author_pub' : scopus.cache_author_pub,
+                       'pub_info' : scopus.cache_pub_info}
+        # Keys fetched by the jobs planned so far
+        self._planned = {kind : set() for kind in self.caches}
+
+    def _split(self, kind, keys):
+        '''Splits keys into those to be fetched and counts the cached and
+        stale ones.'''
+        cache = self.caches[kind]
+        planned = self._planned[kind]
+
+        in_cache = [key for key in keys \
+                    if key not in planned and key in cache]
+        stale = set()
+        if kind in self.force_reload:
+            stale = set(in_cache)
+        elif self.refresh:
+            stale = set(stale_keys(cache, in_cache,
+                                   self.scopus.ttl.get(kind)))
+
+        fetch = [key for key in keys if key not in planned and \
+                    (key not in cache or key in stale)]
+        return fetch, len(keys) - len(fetch), len(stale)
+
+    def _select_authors(self, author_ids):
+        '''Applies the condition to the authors if possible and returns the
+        selected authors with their number of publications.'''
+        cache = self.caches['author_info']
+        if 'author_info' in self.force_reload or \
+            not all(author_id in cache for author_id in author_ids):
+            return author_ids, {}, self.condition is None
+
+        # All authors are cached, the entries are decoded without going
+        # through get_author_info, which would save the cache
+        columns = AuthorColumns()
+        columns.extend(unpack(entry_value(cache[author_id])) \
+                        for author_id in author_ids)
+        authors = columns.frame()
+        npubs = authors['npubs'].to_dict()
+        if self.condition is None:
+            return author_ids, npubs, True
+        authors = authors[select(authors, self.condition)]
+        return list(authors.index), npubs, True
+
+    def plan(self, year, journal=None, issn=None, name=None):
+        '''
+        Plans the calls of a journal-year download.
+
+        Parameters
+        ----------
+        year : int
+            Year of publication.
+        journal : str
+            Name of journal.
+        issn : str
+            Issn of journal.
+        name : str, optional
+            Name of the job in reports.
+
+        Returns
+        -------
+        Plan
+            Number of calls of each stage.
+        '''
+
+        if name is None:
+            name = '{}_{}'.format(journal if journal is not None else issn,
+                                  year)
+        plan = Plan(name)
+
+        # Pages of the journal search
+        search_query = journal_year_query(year, journal, issn)
+        fetch, cached, stale = self._split('search_query', [search_query])
+        plan.add_stage('author_search', 1, cached, stale,
+                       math.ceil(self.results_per_query / SEARCH_PAGE_SIZE) \
+                        if fetch else 0, not fetch)
+        self._planned['search_query'].add(search_query)
+
+        author_ids = None
+        if search_query in self.caches['search_query']:
+            # Stale results are an estimate of the refreshed results
+            author_ids = list(entry_value(
+                self.caches['search_query'][search_query]))
+
+        if author_ids is None:
+            num_authors = int(self.results_per_query * self.authors_per_pub)
+            num_pubs = int(num_authors * self.pubs_per_author)
+            plan.add_stage('author_info', num_authors, 0, 0,
+                           math.ceil(num_authors / AUTHOR_BATCH_SIZE), False)
+            plan.add_stage('author_pub', num_authors, 0, 0,
+                num_authors * math.ceil(self.pubs_per_author / \
+                                        AUTHOR_PAGE_SIZE), False)
+            plan.add_stage('pub_info', num_pubs, 0, 0,
+                           math.ceil(num_pubs / CITATION_BATCH_SIZE), False)
+            return plan
+        exact = not fetch
+
+        # Batches of author retrievals
+        fetch, cached, stale = self._split('author_info', author_ids)
+        plan.add_stage('author_info', len(author_ids), cached, stale,
+                       math.ceil(len(fetch) / AUTHOR_BATCH_SIZE), exact)
+        self._planned['author_info'].update(author_ids)
+
+        # Searches for the publications of each author
+        selected, npubs, selected_exact = self._select_authors(author_ids)
+        exact = exact and selected_exact
+        fetch, cached, stale = self._split('author_pub', selected)
+        calls = 0
+        num_unknown_pubs = 0
+        for author_id in fetch:
+            if author_id in npubs:
+                num = npubs[author_id]
+            else:
+                num = self.pubs_per_author
+                exact = False
+            calls += max(math.ceil(num / AUTHOR_PAGE_SIZE), 1)
+            num_unknown_pubs += num
+        plan.add_stage('author_pub', len(selected), cached, stale, calls,
+                       exact)
+        self._planned['author_pub'].update(selected)
+
+        # Batches of citation overviews. Publications of authors that are not
+        # cached are counted once per author, an upper bound.
+        fetched_authors = set(fetch)
+        scopus_ids = set_union(
+            entry_value(self.caches['author_pub'][author_id]) \
+                for author_id in selected \
+                if author_id not in fetched_authors and \
+                    author_id in self.caches['author_pub'])
+        keys = [(scopus_id, self.year_range, cite_type) \
+                    for cite_type in self.cite_types \
+                    for scopus_id in scopus_ids]
+        fetch, cached, stale = self._split('pub_info', keys)
+        # Each variant is fetched in its own batches
+        calls = 0
+        for cite_type in self.cite_types:
+            num_pubs = sum(1 for key in fetch if key[2] == cite_type) + \
+                        int(num_unknown_pubs)
+            calls += math.ceil(num_pubs / CITATION_BATCH_SIZE)
+        num_keys = len(keys) + len(self.cite_types) * int(num_unknown_pubs)
+        plan.add_stage('pub_info', num_keys, cached, stale, calls,
+                       exact and num_unknown_pubs == 0)
+        self._planned['pub_info'].update(keys)
+
+        return plan
+
+def schedule_jobs(plans, quotas=None, now=None, window=QUOTA_WINDOW):
+    '''
+    Distributes the calls of jobs over quota windows.
+
+    Jobs are run in the given order and the stages of each job one after the
+    other. When the quota of an endpoint is used up the job continues in the
+    next window; since all fetched entries are cached, no call is repeated.
+    All endpoints are assumed to reset at the same time.
+
+    Parameters
+    ----------
+    plans : list of Plan
+        Plans of the jobs in the order in which they are run.
+    quotas : dict, optional
+        Last known quota of each endpoint, e.g. ``Scopus.quotas``.
+    now : float, optional
+        Start time of the schedule, by default the current time.
+    window : float
+        Length of a quota window in seconds.
+
+    Returns
+    -------
+    list
+        One dict per window with its ``start`` time, the ``calls`` per
+        endpoint and the ``parts`` of jobs run in it, given as tuples
+        ``(name, stage, calls)``.
+    '''
+
+    now = time.time() if now is None else now
+    quotas = quotas if quotas is not None else {}
+    endpoints = set(DEFAULT_QUOTAS) | set(quotas)
+    limits = {e : quota_limit(quotas, e) for e in endpoints}
+    remaining = {e : remaining_quota(quotas, e, now) for e in endpoints}
+
+    # The first window ends with the earliest known reset
+    resets = [q['reset'] for q in quotas.values() \
+                if q.get('reset') is not None and q['reset'] > now]
+    first_reset = min(resets) if resets else now + window
+
+    windows = [{'start' : now, 'calls' : {}, 'parts' : []}]
+    for plan in plans:
+        for stage in plan.stages:
+            endpoint = stage['endpoint']
+            calls = stage['calls']
+            if calls > 0 and limits[endpoint] <= 0:
+                raise ValueError('No quota for endpoint {}.'.format(endpoint))
+
+            while calls > 0:
+                current = windows[-1]
+                take = min(calls, remaining[endpoint])
+                if take > 0:
+                    current['parts'].append((plan.name, stage['stage'], take))
+                    current['calls'][endpoint] = \
+                        current['calls'].get(endpoint, 0) + take
+                    remaining[endpoint] -= take
+                    calls -= take
+                if calls > 0:
+                    start = first_reset if len(windows) == 1 else \
+                                current['start'] + window
+                    windows.append({'start' : start, 'calls' : {},
+                                    'parts' : []})
+                    remaining = dict(limits)
+
+    return windows
+
+def print_schedule(windows):
+    '''Prints the jobs run in each quota window.'''
+    for idx, window in enumerate(windows):
+        print('Window {} starting {}'.format(idx + 1,
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(window['start']))))
+        for name, stage, calls in window['parts']:
+            print('  {:30s} {:15s} {:>8d} calls'.format(name, stage, calls))
+        for endpoint, calls in sorted(window['calls'].items()):
+            print('  Total calls to {}: {}'.format(endpoint, calls))
+    print('')
@@ -0,0 +1,367 @@
+"""Background prefetching into the caches of a Scopus object.
+
+The prefetch service reads jobs from a spool directory and fetches their
+author information, publication lists, citation overviews or journal-year
+searches into the cache, so that interactive calls later find a warm cache.
+Jobs are json files with a ``kind`` and a list of ``items``:
+
+    {"kind" : "pubs", "items" : ["84963533430", ...],
+     "year_range" : [1960, 2019], "cite_type" : "all"}
+
+where ``kind`` is ``'authors'`` (author information), ``'author_pubs'``
+(publication lists of authors), ``'pubs'`` (citation overviews) or
+``'journal_year'`` (items are ``[year, journal, issn]``). Jobs can be added
+with ``submit`` or sent as json lines to a local socket.
+
+The service only uses a share of the rate limit: requests are throttled to
+``share`` times ``max_rate`` per second, and it pauses once the remaining
+quota of an endpoint falls below ``1 - share`` of the limit, keeping the
+rest for interactive use. During ``idle_hours`` the larger ``idle_share``
+applies. Progress is written to ``status.json`` in the spool directory.
+
+Example
+-------
+>>> submit('data/spool', 'pubs', scopus_ids, year_range=(1960, 2019))
+>>> service = PrefetchService(scopus, 'data/spool', share=0.3)
+>>> service.run()
+"""
+
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+# Requests per second allowed by the Scopus API for most endpoints
+MAX_RATE = 9.
+JOB_KINDS = {'authors' : 'author', 'author_pubs' : 'search',
+             'pubs' : 'citation', 'journal_year' : 'search'}
+STATUS_NAME = 'status.json'
+_counter = itertools.count()
+
+class RateLimiter(object):
+    """Token bucket limiting the rate of calls, shared between threads.
+
+    Parameters
+    ----------
+    rate : float
+        Calls per second.
+    burst : int, optional
+        Number of calls that can be made at once after an idle period, by
+        default one second worth of calls.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        '''Changes the rate, e.g. when entering idle hours.'''
+        with self._lock:
+            self.rate = rate
+
+    def acquire(self):
+        '''Blocks until a call can be made.'''
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst,
+                    self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.:
+                    self._tokens -= 1.
+                    return
+                wait = (1. - self._tokens) / max(self.rate, 1e-6)
+            time.sleep(wait)
+
+def _write_json(filename, obj):
+    '''Writes a json file atomically.'''
+    tmp_filename = '{}.{}.{}.tmp'.format(filename, os.getpid(),
+                                         threading.get_ident())
+    with open(tmp_filename, 'w') as fp:
+        json.dump(obj, fp)
+    os.replace(tmp_filename, filename)
+
+def submit(spool_dir, kind, items, year_range=None, cite_type='all'):
+    '''
+    Adds a prefetch job to a spool directory.
+
+    Parameters
+    ----------
+    spool_dir : str
+        Spool directory of the prefetch service.
+    kind : str
+        ``'authors'``, ``'author_pubs'``, ``'pubs'`` or ``'journal_year'``.
+    items : list
+        Author ids, scopus ids or ``(year, journal, issn)`` tuples.
+    year_range : tuple, optional
+        Year range of the citation overviews, required for ``'pubs'``.
+    cite_type : str or list
+        Citation type of the citation overviews.
+
+    Returns
+    -------
+    str
+        Name of the job file.
+    '''
+
+    if kind not in JOB_KINDS:
+        raise ValueError('Unknown prefetch job kind {}.'.format(kind))
+    if kind == 'pubs' and year_range is None:
+        raise ValueError('Prefetching publications requires a year_range.')
+    if not os.path.isdir(spool_dir):
+        os.makedirs(spool_dir)
+    job = {'kind' : kind, 'items' : [item if isinstance(item, str) \
+                                        else list(item) for item in items]}
+    if year_range is not None:
+        job['year_range'] = list(year_range)
+        job['cite_type'] = cite_type
+    filename = os.path.join(spool_dir, '{:.6f}-{}-{}.json'.format(
+        time.time(), os.getpid(), next(_counter)))
+    _write_json(filename, job)
+    return filename
+
+def read_status(spool_dir):
+    '''Progress of the prefetch service of a spool directory.'''
+    filename = os.path.join(spool_dir, STATUS_NAME)
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, 'r') as fp:
+        return json.load(fp)
+
+class PrefetchService(object):
+    """Prefetches spooled jobs into the caches of a Scopus object.
+
+    Parameters
+    ----------
+    scopus : Scopus
+        Scopus object whose caches are filled. Its rate limiter is replaced.
+    spool_dir : str
+        Directory with the job files. Jobs are claimed by renaming them to
+        ``.work``, so several services can share a spool directory, and are
+        moved to ``done`` or ``failed`` afterwards.
+    share : float
+        Share of the request rate and of the quota used for prefetching.
+    max_rate : float
+        Requests per second allowed by the API.
+    idle_hours : tuple, optional
+        Hours ``(start, end)`` of the local time during which ``idle_share``
+        applies, e.g. ``(22, 6)``.
+    idle_share : float
+        Share used during idle hours.
+    batch_size : int
+        Number of items fetched between progress updates.
+    poll_interval : float
+        Seconds to wait for new jobs or for the quota.
+    socket_path : str, optional
+        Path of a Unix socket accepting jobs as json lines. The line
+        ``"status"`` is answered with the status.
+    """
+
+    def __init__(self, scopus, spool_dir, share=0.5, max_rate=MAX_RATE,
+                 idle_hours=None, idle_share=1., batch_size=500,
+                 poll_interval=10., socket_path=None):
+        self.scopus = scopus
+        self.spool_dir = spool_dir
+        self.share = share
+        self.max_rate = max_rate
+        self.idle_hours = idle_hours
+        self.idle_share = idle_share
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.socket_path = socket_path
+
+        for name in ['done', 'failed']:
+            path = os.path.join(spool_dir, name)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        self.rate_limiter = RateLimiter(self.current_share() * max_rate)
+        scopus.rate_limiter = self.rate_limiter
+        self._stop = threading.Event()
+        self._server = None
+        self.status = {'state' : 'starting', 'job' : None, 'kind' : None,
+                       'items_done' : 0, 'items_total' : 0,
+                       'jobs_done' : 0, 'jobs_failed' : 0, 'items_fetched' : 0,
+                       'share' : self.current_share(), 'last_error' : None,
+                       'started' : time.time()}
+
+    def current_share(self, now=None):
+        '''Share of the rate limit that applies at the given time.'''
+        if self.idle_hours is None:
+            return self.share
+        hour = time.localtime(now).tm_hour
+        start, end = self.idle_hours
+        idle = start <= hour < end if start <= end \
+                else hour >= start or hour < end
+        return self.idle_share if idle else self.share
+
+    def update_status(self, **kwargs):
+        '''Updates the status and writes it to the spool directory.'''
+        self.status.update(kwargs)
+        self.status['queued'] = len(self.pending_jobs())
+        self.status['quotas'] = self.scopus.quotas
+        self.status['updated'] = time.time()
+        _write_json(os.path.join(self.spool_dir, STATUS_NAME), self.status)
+
+    def pending_jobs(self):
+        '''Job files waiting in the spool directory, oldest first.'''
+        return sorted(name for name in os.listdir(self.spool_dir) \
+                        if name.endswith('.json') and name != STATUS_NAME)
+
+    def claim_job(self):
+        '''Claims the oldest pending job, returning its file name.'''
+        for name in self.pending_jobs():
+            filename = os.path.join(self.spool_dir, name)
+            try:
+                os.rename(filename, filename + '.work')
+            except OSError:
+                # Claimed by another service
+                continue
+            return filename + '.work'
+        return None
+
+    def wait_for_quota(self, endpoint):
+        '''Waits while the remaining quota of an endpoint is reserved for
+        interactive use. Returns False if the service was stopped.'''
+        while not self._stop.is_set():
+            share = self.current_share()
+            self.rate_limiter.set_rate(share * self.max_rate)
+            quota = self.scopus.quotas.get(endpoint)
+            if quota is None or quota['limit'] is None or \
+                    quota['remaining'] > (1. - share) * quota['limit']:
+                return True
+            self.update_status(state='waiting for quota', share=share)
+            wait = self.poll_interval
+            if quota.get('reset') is not None:
+                wait = min(max(quota['reset'] - time.time(), 1.), wait)
+            self._stop.wait(wait)
+        return False
+
+    def fetch(self, job, items):
+        '''Fetches the items of a job into the cache.'''
+        kind = job['kind']
+        scopus = self.scopus
+        if kind == 'authors':
+            scopus.get_author_info(items)
+        elif kind == 'author_pubs':
+            scopus.get_author_publications(items)
+        elif kind == 'pubs':
+            cite_type = job.get('cite_type', 'all')
+            scopus.get_publication_info(items, tuple(job['year_range']),
+                cite_type if isinstance(cite_type, str) else list(cite_type))
+        else:
+            scopus.get_authors_from_journal_years(
+                [tuple(item) for item in items])
+
+    def run_job(self, filename):
+        '''Runs a claimed job in batches, updating the progress.'''
+        with open(filename, 'r') as fp:
+            job = json.load(fp)
+        if job.get('kind') not in JOB_KINDS:
+            raise ValueError('Unknown prefetch job kind {}.' \
+                                .format(job.get('kind')))
+        items = job['items']
+        self.update_status(state='prefetching', job=os.path.basename(filename),
+                           kind=job['kind'], items_done=0,
+                           items_total=len(items))
+        for start in range(0, len(items), self.batch_size):
+            if not self.wait_for_quota(JOB_KINDS[job['kind']]):
+                return False
+            batch = items[start:start+self.batch_size]
+            self.fetch(job, batch)
+            self.status['items_fetched'] += len(batch)
+            self.update_status(items_done=start + len(batch),
+                               share=self.current_share())
+        return True
+
+    def run_once(self):
+        '''Runs all pending jobs and returns the number of jobs run.'''
+        num_jobs = 0
+        while not self._stop.is_set():
+            filename = self.claim_job()
+            if filename is None:
+                break
+            name = os.path.basename(filename)[:-len('.work')]
+            try:
+                if not self.run_job(filename):
+                    # Stopped, the job is picked up again on restart
+                    os.rename(filename, filename[:-len('.work')])
+                    break
+                os.rename(filename, os.path.join(self.spool_dir, 'done', name))
+                self.status['jobs_done'] += 1
+            except Exception as e:
+                os.rename(filename,
+                          os.path.join(self.spool_dir, 'failed', name))
+                self.status['jobs_failed'] += 1
+                self.status['last_error'] = '{}: {}'.format(name, e)
+            num_jobs += 1
+        self.update_status(state='idle', job=None, kind=None)
+        return num_jobs
+
+    def run(self):
+        '''Runs jobs until stop is called, polling the spool directory.'''
+        if self.socket_path is not None:
+            self.serve_socket()
+        try:
+            while not self._stop.is_set():
+                self.run_once()
+                self._stop.wait(self.poll_interval)
+        finally:
+            self.update_status(state='stopped', job=None, kind=None)
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                os.remove(self.socket_path)
+
+    def stop(self):
+        '''Stops the service after the current batch.'''
+        self._stop.set()
+
+    def serve_socket(self):
+        '''Accepts jobs as json lines on a Unix socket in a thread.'''
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    line = line.decode('utf-8').strip()
+                    if not line:
+                        continue
+                    try:
+                        if json.loads(line) == 'status':
+                            reply = service.status
+                        else:
+                            job = json.loads(line)
+                            reply = {'job' : os.path.basename(submit(
+                                service.spool_dir, job['kind'], job['items'],
+                                job.get('year_range'),
+                                job.get('cite_type', 'all')))}
+                    except (ValueError, KeyError, TypeError) as e:
+                        reply = {'error' : str(e)}
+                    self.wfile.write((json.dumps(reply) + '\n') \
+                                        .encode('utf-8'))
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = socketserver.ThreadingUnixStreamServer(
+            self.socket_path, Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  daemon=True)
+        thread.start()
+
+def send_job(socket_path, job):
+    '''Sends a job, or the string ``'status'``, to the socket of a prefetch
+    service and returns the reply.'''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(job) + '\n').encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+        reply = sock.makefile('r').readline()
+    return json.loads(reply)
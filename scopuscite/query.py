@@ -0,0 +1,490 @@
+"""Read-only query index over the local caches.
+
+``build_index`` decodes the entries of the caches of a ``Scopus`` object
+once and writes the publications, authors, publication sets and journal-year
+author lists into a sqlite database, indexed by author id, scopus id,
+journal, ISSN and year. ``QueryIndex`` answers lookups from this database
+in milliseconds, without loading the cache pickles and without calling the
+API, e.g. from a notebook or a dashboard.
+
+The index is updated incrementally: cache files that did not change since
+the last build are not read again, and only entries fetched since are
+decoded. Entries removed from the caches, e.g. evicted from a shared store,
+are removed from the index.
+
+Example
+-------
+>>> scopus = Scopus(None, cache_name='math_2016', cache_dir='data/cache')
+>>> filename = build_index(scopus)
+>>> index = QueryIndex(filename)
+>>> index.author('7004212771')
+>>> pubs = index.author_publications('7004212771')
+>>> index.journal_publications(issn='0003486X', year=2016)
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+
+from scopuscite import jsonlib
+from scopuscite.cache import entry_value, entry_time, file_stamp, unpack
+from scopuscite.scopus import AuthorColumns, AUTHOR_COLUMNS, CITE_TYPES
+from scopuscite.utils import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+INDEX_SUFFIX = '_index.sqlite'
+
+# Kinds of caches in the index, see Scopus.load_<kind>_cache
+KINDS = ['search_query', 'author_pub', 'pub_info', 'author_info']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    kind TEXT PRIMARY KEY, stamp TEXT);
+CREATE TABLE IF NOT EXISTS pubs (
+    scopus_id TEXT, start_year INTEGER, end_year INTEGER, cite_type TEXT,
+    title TEXT, journal TEXT COLLATE NOCASE, issn TEXT, year INTEGER,
+    authors TEXT, cites_by_year TEXT, pcc INTEGER, lcc INTEGER,
+    ncites INTEGER, fetched REAL,
+    PRIMARY KEY (scopus_id, start_year, end_year, cite_type));
+CREATE INDEX IF NOT EXISTS pubs_journal ON pubs (journal, year);
+CREATE INDEX IF NOT EXISTS pubs_issn ON pubs (issn, year);
+CREATE INDEX IF NOT EXISTS pubs_year ON pubs (year);
+CREATE TABLE IF NOT EXISTS authorships (
+    author_id TEXT, scopus_id TEXT, PRIMARY KEY (author_id, scopus_id));
+CREATE INDEX IF NOT EXISTS authorships_pub ON authorships (scopus_id);
+CREATE TABLE IF NOT EXISTS authors (
+    author_id TEXT PRIMARY KEY, name TEXT, first_name TEXT, last_name TEXT,
+    affiliation TEXT, first_pub INTEGER, last_pub INTEGER, npubs INTEGER,
+    ncites INTEGER, ncited_by INTEGER, ncoauthors INTEGER, hindex INTEGER,
+    fetched REAL);
+CREATE TABLE IF NOT EXISTS pub_sets (
+    author_id TEXT PRIMARY KEY, fetched REAL);
+CREATE TABLE IF NOT EXISTS author_pubs (
+    author_id TEXT, scopus_id TEXT, PRIMARY KEY (author_id, scopus_id));
+CREATE INDEX IF NOT EXISTS author_pubs_pub ON author_pubs (scopus_id);
+CREATE TABLE IF NOT EXISTS searches (
+    query TEXT PRIMARY KEY, journal TEXT COLLATE NOCASE, issn TEXT,
+    year INTEGER, fetched REAL);
+CREATE INDEX IF NOT EXISTS searches_journal ON searches (journal, year);
+CREATE INDEX IF NOT EXISTS searches_issn ON searches (issn, year);
+CREATE TABLE IF NOT EXISTS search_authors (
+    query TEXT, author_id TEXT, PRIMARY KEY (query, author_id));
+CREATE INDEX IF NOT EXISTS search_authors_author
+    ON search_authors (author_id);
+'''
+
+# Columns of the publication dataframes, as returned by
+# Scopus.get_publication_info, with the issn added
+PUB_COLUMNS = ['title', 'journal', 'issn', 'year', 'authors',
+               'cites_by_year', 'pcc', 'lcc', 'cites_start_year', 'ncites']
+
+def index_filename(scopus):
+    '''Default file of the query index of a Scopus object.'''
+    return os.path.join(scopus.cache_dir, scopus.cache_name + INDEX_SUFFIX)
+
+def parse_search_query(search_query):
+    '''
+    Extracts the journal, ISSN and year of a journal-year search query, see
+    ``scopuscite.scopus.journal_year_query``.
+
+    Returns
+    -------
+    tuple
+        ``(journal, issn, year)``, with ``None`` for missing parts.
+    '''
+
+    year = re.search(r'PUBYEAR\+IS\+(\d+)', search_query)
+    journal = re.search(r'SRCTITLE\((.*?)\)(?: AND |$)', search_query)
+    issn = re.search(r'ISSN\((\w+)\)', search_query)
+    return (journal.group(1) if journal else None,
+            issn.group(1) if issn else None,
+            int(year.group(1)) if year else None)
+
+def _json_list(values):
+    '''Json array of ids, passed as one parameter to json_each.'''
+    return jsonlib.dumps(list(values)).decode('utf-8')
+
+def _source_stamp(scopus, kind):
+    '''Stamp of the cache file of a kind, None if the caches are views on a
+    shared store, which are always read.'''
+    if scopus.store is not None:
+        return None
+    if kind == 'search_query':
+        name = scopus.CACHE_SEARCH_QUERY_NAME
+    else:
+        suffix = {'author_info' : scopus.CACHE_AUTHOR_INFO_SUFFIX,
+                  'author_pub' : scopus.CACHE_AUTHOR_PUB_SUFFIX,
+                  'pub_info' : scopus.CACHE_PUB_INFO_SUFFIX}[kind]
+        name = scopus.cache_name + suffix
+    stamp = file_stamp(os.path.join(scopus.cache_dir, name))
+    return jsonlib.dumps(stamp).decode('utf-8') if stamp is not None else None
+
+def _changed_keys(con, cache, table, key_columns, row_key=None):
+    '''Splits the keys of a cache into those fetched since they were indexed
+    and the row keys of indexed entries that are no longer in the cache.'''
+    if row_key is None:
+        row_key = lambda key : (key,)
+    indexed = {row[:-1] : row[-1] for row in con.execute(
+        'SELECT {}, fetched FROM {}'.format(', '.join(key_columns), table))}
+    changed = []
+    for key in cache.keys():
+        fetched = entry_time(cache[key])
+        if indexed.pop(row_key(key), None) != fetched:
+            changed.append(key)
+    return changed, list(indexed)
+
+def _index_search_query(con, scopus):
+    cache = scopus.cache_search_query
+    changed, removed = _changed_keys(con, cache, 'searches', ['query'])
+    for table in ['searches', 'search_authors']:
+        con.executemany('DELETE FROM {} WHERE query = ?'.format(table),
+                        removed + [(query,) for query in changed])
+    con.executemany('INSERT INTO searches VALUES (?, ?, ?, ?, ?)',
+        [(query,) + parse_search_query(query) + \
+            (entry_time(cache[query]),) for query in changed])
+    con.executemany('INSERT INTO search_authors VALUES (?, ?)',
+        [(query, author_id) for query in changed \
+            for author_id in entry_value(cache[query])])
+    return len(changed)
+
+def _index_author_pub(con, scopus):
+    cache = scopus.cache_author_pub
+    changed, removed = _changed_keys(con, cache, 'pub_sets', ['author_id'])
+    for table in ['pub_sets', 'author_pubs']:
+        con.executemany('DELETE FROM {} WHERE author_id = ?'.format(table),
+                        removed + [(author_id,) for author_id in changed])
+    con.executemany('INSERT INTO pub_sets VALUES (?, ?)',
+        [(author_id, entry_time(cache[author_id])) for author_id in changed])
+    con.executemany('INSERT INTO author_pubs VALUES (?, ?)',
+        [(author_id, scopus_id) for author_id in changed \
+            for scopus_id in entry_value(cache[author_id])])
+    return len(changed)
+
+def _index_pub_info(con, scopus):
+    cache = scopus.cache_pub_info
+    # Cache keys are (scopus_id, (start_year, end_year), cite_type)
+    row_key = lambda key : (key[0], key[1][0], key[1][1], key[2])
+    changed, removed = _changed_keys(con, cache, 'pubs',
+        ['scopus_id', 'start_year', 'end_year', 'cite_type'], row_key)
+    keys = [row_key(key) for key in changed]
+    con.executemany('DELETE FROM pubs WHERE scopus_id = ? AND ' \
+                    'start_year = ? AND end_year = ? AND cite_type = ?',
+                    removed + keys)
+    scopus_ids = {key[0] for key in removed + keys}
+    con.executemany('DELETE FROM authorships WHERE scopus_id = ?',
+                    [(scopus_id,) for scopus_id in scopus_ids])
+    rows = []
+    for key, row_key in zip(changed, keys):
+        entry = cache[key]
+        cite_info = unpack(entry_value(entry))
+        pub = scopus.decode_cite_info(cite_info, row_key[1], 'all')
+        rows.append(row_key + (pub['title'], pub['journal'],
+            cite_info.get('prism:issn'), pub['year'],
+            jsonlib.dumps(pub['authors']).decode('utf-8'),
+            jsonlib.dumps([int(c) for c in pub['cites_by_year']]) \
+                .decode('utf-8'),
+            pub['pcc'], pub['lcc'], int(pub['ncites']), entry_time(entry)))
+    con.executemany('INSERT INTO pubs VALUES ({})'.format(
+        ', '.join(['?'] * 14)), rows)
+    # The authors of the changed publications, from all their rows, which
+    # might be cached for other year ranges
+    con.execute('INSERT OR IGNORE INTO authorships SELECT DISTINCT ' \
+                'json_each.value, pubs.scopus_id FROM pubs, ' \
+                'json_each(pubs.authors) WHERE pubs.scopus_id IN ' \
+                '(SELECT value FROM json_each(?))', (_json_list(scopus_ids),))
+    return len(changed)
+
+def _index_author_info(con, scopus):
+    cache = scopus.cache_author_info
+    changed, removed = _changed_keys(con, cache, 'authors', ['author_id'])
+    con.executemany('DELETE FROM authors WHERE author_id = ?',
+                    removed + [(author_id,) for author_id in changed])
+
+    # Tombstoned author ids are not indexed
+    columns = AuthorColumns()
+    columns.extend(unpack(entry_value(cache[author_id])) \
+                    for author_id in changed)
+    authors = columns.frame()
+    times = {author_id : entry_time(cache[author_id]) for author_id in changed}
+    fetched = [times.get(author_id, 0.) for author_id in authors.index]
+    rows = zip(authors.index, *([authors[c].tolist() \
+                    for c in AUTHOR_COLUMNS] + [fetched]))
+    query = 'INSERT OR REPLACE INTO authors (author_id, {}, fetched) ' \
+            'VALUES ({})'.format(', '.join(AUTHOR_COLUMNS),
+                                 ', '.join(['?'] * (len(AUTHOR_COLUMNS) + 2)))
+    con.executemany(query, [tuple(row) for row in rows])
+    return len(changed)
+
+def build_index(scopus, filename=None, kinds=None):
+    '''
+    Builds or updates the query index of the caches of a Scopus object.
+
+    Parameters
+    ----------
+    scopus : scopuscite.scopus.Scopus
+        Scopus object whose caches are indexed. No API key is needed.
+    filename : str, optional
+        Sqlite file of the index, by default ``<cache_name>_index.sqlite``
+        in the cache directory.
+    kinds : list of str, optional
+        Caches to index, by default all of ``KINDS``.
+
+    Returns
+    -------
+    str
+        Filename of the index.
+    '''
+
+    if filename is None:
+        filename = index_filename(scopus)
+    kinds = kinds if kinds is not None else KINDS
+    funcs = {'search_query' : _index_search_query,
+             'author_pub' : _index_author_pub,
+             'pub_info' : _index_pub_info,
+             'author_info' : _index_author_info}
+
+    con = sqlite3.connect(filename)
+    try:
+        con.execute('PRAGMA journal_mode=WAL')
+        con.executescript(SCHEMA)
+        for kind in kinds:
+            stamp = _source_stamp(scopus, kind)
+            row = con.execute('SELECT stamp FROM sources WHERE kind = ?',
+                              (kind,)).fetchone()
+            if stamp is not None and row is not None and row[0] == stamp:
+                print('Index of {} cache is up to date.'.format(kind))
+                continue
+
+            getattr(scopus, 'load_{}_cache'.format(kind))()
+            with con:
+                num_changed = funcs[kind](con, scopus)
+                con.execute('INSERT OR REPLACE INTO sources VALUES (?, ?)',
+                            (kind, stamp))
+            print('Indexed {} entries of {} cache.'.format(num_changed, kind))
+    finally:
+        con.close()
+
+    return filename
+
+class QueryIndex(object):
+    """Lookups of cached authors and publications in a query index.
+
+    The index is opened read-only, so that it can be queried while
+    ``build_index`` updates it. Each thread uses its own connection.
+
+    Publication lookups return dataframes indexed by scopus id with the
+    columns of ``Scopus.get_publication_info`` and the ISSN of the journal,
+    if it was cached. Publications cached for several year ranges are
+    returned once, for the most recently fetched one, unless ``year_range``
+    is given.
+
+    Parameters
+    ----------
+    filename : str
+        Sqlite file written by ``build_index``.
+    """
+
+    def __init__(self, filename):
+        if not os.path.exists(filename):
+            raise FileNotFoundError('No query index {}.'.format(filename))
+        self.filename = filename
+        self._local = threading.local()
+
+    @property
+    def con(self):
+        '''Read-only connection of the current thread.'''
+        if getattr(self._local, 'con', None) is None:
+            uri = 'file:{}?mode=ro'.format(
+                urllib.parse.quote(os.path.abspath(self.filename)))
+            self._local.con = sqlite3.connect(uri, uri=True)
+        return self._local.con
+
+    def close(self):
+        '''Closes the connection of the current thread.'''
+        if getattr(self._local, 'con', None) is not None:
+            self._local.con.close()
+            self._local.con = None
+
+    def _authors_frame(self, where, args):
+        rows = self.con.execute('SELECT author_id, {} FROM authors {}' \
+            .format(', '.join(AUTHOR_COLUMNS), where), args).fetchall()
+        return pd.DataFrame(rows, columns=['author_id'] + AUTHOR_COLUMNS) \
+                    .set_index('author_id')
+
+    def _pubs_frame(self, where, args, year_range, cite_type):
+        query = 'SELECT scopus_id, start_year, {} FROM pubs WHERE ' \
+                'cite_type = ? AND ({})'.format(', '.join(
+                    c for c in PUB_COLUMNS if c != 'cites_start_year'), where)
+        args = [cite_type] + list(args)
+        if year_range is not None:
+            query += ' AND start_year = ? AND end_year = ?'
+            args += list(year_range)
+        query += ' ORDER BY fetched'
+
+        # Later rows are more recently fetched
+        pubs = {}
+        for row in self.con.execute(query, args):
+            scopus_id, start_year, title, journal, issn, year, authors, \
+                cites, pcc, lcc, ncites = row
+            pubs[scopus_id] = {'scopus_id' : scopus_id, 'title' : title,
+                'journal' : journal, 'issn' : issn, 'year' : year,
+                'authors' : jsonlib.loads(authors),
+                'cites_by_year' : np.array(jsonlib.loads(cites), dtype=int),
+                'pcc' : pcc, 'lcc' : lcc, 'cites_start_year' : start_year,
+                'ncites' : ncites}
+
+        pubs = pd.DataFrame(list(pubs.values()),
+                            columns=['scopus_id'] + PUB_COLUMNS)
+        # Named like the columns of Scopus.decode_cite_info
+        pubs = pubs.rename(columns={'cites_by_year' : \
+                                    'cites_by_year' + CITE_TYPES[cite_type]})
+        return pubs.set_index('scopus_id')
+
+    def author(self, author_id):
+        '''Cached profile of an author as a dict, None if it is not
+        cached.'''
+        authors = self._authors_frame('WHERE author_id = ?', (author_id,))
+        if len(authors) == 0:
+            return None
+        info = authors.iloc[0].to_dict()
+        info['author_id'] = author_id
+        return info
+
+    def authors(self, author_ids=None):
+        '''Cached profiles of the given or all authors as a dataframe indexed
+        by author id.'''
+        if author_ids is None:
+            return self._authors_frame('', ())
+        return self._authors_frame('WHERE author_id IN (SELECT value FROM ' \
+            'json_each(?))', (_json_list(author_ids),))
+
+    def author_publication_ids(self, author_id):
+        '''
+        Scopus ids of the cached publications of an author, from the cached
+        publication set of the author and the author lists of the cached
+        publications.
+        '''
+
+        rows = self.con.execute('SELECT scopus_id FROM author_pubs WHERE ' \
+            'author_id = ? UNION SELECT scopus_id FROM authorships WHERE ' \
+            'author_id = ?', (author_id, author_id))
+        return {row[0] for row in rows}
+
+    def author_publications(self, author_id, year_range=None,
+                            cite_type='all'):
+        '''
+        Cached publications of an author and their citations by year.
+
+        Parameters
+        ----------
+        author_id : str
+            Author id.
+        year_range : tuple, optional
+            Year range ``(start, end)`` of the citation data, as passed to
+            ``Scopus.get_publication_info``.
+        cite_type : str
+            ``'all'``, ``'exclude-self'`` or ``'exclude-books'``.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Publications of the author with cached citation data.
+        '''
+
+        return self._pubs_frame('scopus_id IN (SELECT scopus_id FROM ' \
+            'author_pubs WHERE author_id = ? UNION SELECT scopus_id FROM ' \
+            'authorships WHERE author_id = ?)', (author_id, author_id),
+            year_range, cite_type)
+
+    def publication(self, scopus_id, year_range=None, cite_type='all'):
+        '''Cached information of a publication as a dict, None if it is not
+        cached.'''
+        pubs = self._pubs_frame('scopus_id = ?', (scopus_id,), year_range,
+                                cite_type)
+        if len(pubs) == 0:
+            return None
+        info = pubs.iloc[0].to_dict()
+        info['scopus_id'] = scopus_id
+        return info
+
+    def publications(self, scopus_ids, year_range=None, cite_type='all'):
+        '''Cached information of several publications as a dataframe.'''
+        return self._pubs_frame('scopus_id IN (SELECT value FROM ' \
+            'json_each(?))', (_json_list(scopus_ids),), year_range, cite_type)
+
+    def journal_publications(self, journal=None, issn=None, year=None,
+                             year_range=None, cite_type='all'):
+        '''
+        Cached publications of a journal.
+
+        Parameters
+        ----------
+        journal : str, optional
+            Name of the journal, matched exactly but ignoring case.
+        issn : str, optional
+            ISSN of the journal. Only publications whose ISSN was cached are
+            found, see ``scopuscite.cache.CITE_INFO_FIELDS``.
+        year : int, optional
+            Year of publication, by default all years.
+        year_range, cite_type
+            See ``author_publications``.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Publications of the journal with cached citation data.
+        '''
+
+        where, args = self._journal_filter(journal, issn, year)
+        return self._pubs_frame(where, args, year_range, cite_type)
+
+    def journal_authors(self, journal=None, issn=None, year=None):
+        '''
+        Author ids of the cached journal-year searches, see
+        ``Scopus.get_authors_from_journal_year``.
+
+        Parameters
+        ----------
+        journal, issn, year
+            See ``journal_publications``. Omitted parts match any search.
+
+        Returns
+        -------
+        set
+            Author ids found by the matching searches.
+        '''
+
+        where, args = self._journal_filter(journal, issn, year)
+        rows = self.con.execute('SELECT DISTINCT author_id FROM ' \
+            'search_authors WHERE query IN (SELECT query FROM searches ' \
+            'WHERE {})'.format(where), args)
+        return {row[0] for row in rows}
+
+    @staticmethod
+    def _journal_filter(journal, issn, year):
+        conditions, args = [], []
+        for column, value in [('journal', journal), ('issn', issn),
+                              ('year', year)]:
+            if value is not None:
+                conditions.append('{} = ?'.format(column))
+                args.append(value)
+        return ' AND '.join(conditions) if conditions else '1', args
+
+    def coauthors(self, author_id):
+        '''Ids of the authors sharing a cached publication with an author.'''
+        rows = self.con.execute('SELECT DISTINCT b.author_id FROM ' \
+            'authorships a JOIN authorships b ON a.scopus_id = b.scopus_id ' \
+            'WHERE a.author_id = ? AND b.author_id != ?',
+            (author_id, author_id))
+        return {row[0] for row in rows}
+
+    def counts(self):
+        '''Number of indexed rows of each table.'''
+        return {table : self.con.execute(
+                    'SELECT COUNT(*) FROM {}'.format(table)).fetchone()[0] \
+                for table in ['pubs', 'authors', 'author_pubs',
+                              'authorships', 'searches']}
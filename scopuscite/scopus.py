@@ -2,47 +2,422 @@
 publication information with local caching.
 """
 
+import functools
+import json
 import math
-import os, sys
-import pickle
+import os
+import threading
 import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from scopuscite import jsonlib
+from scopuscite.batching import AdaptiveSize, RequestCoalescer, FetchError, \
+    MAX_SEARCH_PAGE, MAX_AUTHOR_BATCH, MAX_CITATION_BATCH
+from scopuscite.utils import chunks, scopus_id_to_eid, eid_to_scopus_id, \
+    set_union, deep_sizeof, lazy_import
+from scopuscite.metrics import Metrics, TIMING_BUCKETS
+from scopuscite.tracing import Tracer
+from scopuscite.filters import select
+from scopuscite.cache import make_entry, entry_value, entry_time, \
+    stale_keys, project, extend_fields, pack, unpack, CITE_INFO_FIELDS, \
+    AUTHOR_INFO_FIELDS, SECONDS_PER_DAY, load_cache, save_cache
+
+# Imported on first use, so that the cache and quota can be inspected quickly
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+requests = lazy_import('requests')
+humanize = lazy_import('humanize')
+
+API_BASE = 'https://api.elsevier.com'
+URI_SEARCH = API_BASE + '/content/search/scopus'
+URI_AUTHOR = API_BASE + '/content/author'
+URI_CITATION = API_BASE + '/content/abstract/citations'
+URI_ABSTRACT = API_BASE + '/content/abstract/scopus_id/'
+
+AUTHOR_COLUMNS = ['name', 'first_name', 'last_name', 'affiliation',
+                  'first_pub', 'last_pub', 'npubs', 'ncites', 'ncited_by',
+                  'ncoauthors', 'hindex']
+AUTHOR_INT_COLUMNS = ['npubs', 'ncites', 'ncited_by', 'ncoauthors', 'hindex',
+                      'first_pub', 'last_pub']
+AUTHOR_STR_COLUMNS = ['name', 'first_name', 'last_name']
+
+# Suffix of the columns holding each citation variant
+CITE_TYPES = {'all' : '', 'exclude-self' : '_excl_self',
+              'exclude-books' : '_excl_books'}
+CITE_VARIANT_COLUMNS = ['cites_by_year', 'pcc', 'lcc', 'ncites']
+
+# Initial and maximal number of results per call of each kind of call
+BATCH_SIZES = {'search' : (200, MAX_SEARCH_PAGE),
+               'author_pub' : (50, MAX_SEARCH_PAGE),
+               'author' : (25, MAX_AUTHOR_BATCH),
+               'citation' : (25, MAX_CITATION_BATCH)}
+
+# Minimal time in seconds between two saves of the quota during downloads
+QUOTA_SAVE_INTERVAL = 5.
+
+def journal_year_query(year, journal=None, issn=None):
+    '''Search query for all publications in a journal in a given year.'''
+    search_query = 'PUBYEAR+IS+' + str(year)
+    if journal is not None:
+        search_query += ' AND SRCTITLE(' + journal + ')'
+    if issn is not None:
+        search_query += ' AND ISSN(' + issn + ')'
+    return search_query
+
+def load_date_query(search_query, since):
+    '''
+    Restricts a search query to records added to Scopus after a given time.
+
+    Records loaded on the day of ``since`` may have been added after it, so
+    the query also matches that day. Entries without a fetch time, i.e.
+    ``since == 0``, are queried in full.
+    '''
+    if not since:
+        return search_query
+    day = time.strftime('%Y%m%d', time.gmtime(since - SECONDS_PER_DAY))
+    return '(' + search_query + ') AND ORIG-LOAD-DATE AFT ' + day
+
+def cite_info_score(cite_info):
+    '''Total number of citations in a cached citation overview entry.'''
+    cite_info = unpack(cite_info)
+    score = int(cite_info['pcc']) if 'pcc' in cite_info else 0
+    score += int(cite_info['lcc']) if 'lcc' in cite_info else 0
+    if 'cc' in cite_info and isinstance(cite_info['cc'], list):
+        score += sum(int(x['$']) for x in cite_info['cc'])
+    return score
+
+def merge_cite_variants(pubs_lists, cite_types):
+    '''
+    Merges the decoded citation overviews of several citation variants into
+    one row per publication.
+
+    Parameters
+    ----------
+    pubs_lists : dict
+        List of dicts returned by ``decode_cite_info`` for each variant.
+    cite_types : list
+        Citation variants, e.g. ``['all', 'exclude-self']``.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Publication dataframe with the columns ``cites_by_year``, ``pcc``,
+        ``lcc`` and ``ncites`` of each variant, suffixed as in
+        ``CITE_TYPES``, e.g. ``ncites_excl_self``. Variants missing for a
+        publication are NaN.
+    '''
+
+    frames = [pd.DataFrame(pubs_lists[cite_type]).set_index('scopus_id') \
+                for cite_type in cite_types if pubs_lists[cite_type]]
+    if not frames:
+        return pd.DataFrame(pubs_lists[cite_types[0]])
+
+    # Fields common to all variants are taken from the first one available
+    variant_columns = set(col + suffix for col in CITE_VARIANT_COLUMNS \
+                          for suffix in CITE_TYPES.values())
+    base = pd.concat([df[[col for col in df.columns \
+                            if col not in variant_columns]] \
+                      for df in frames])
+    pubs = base[~base.index.duplicated()].copy()
+
+    for cite_type in cite_types:
+        if not pubs_lists[cite_type]:
+            continue
+        suffix = CITE_TYPES[cite_type]
+        df = pd.DataFrame(pubs_lists[cite_type]).set_index('scopus_id')
+        df = df[~df.index.duplicated()]
+        for col in CITE_VARIANT_COLUMNS:
+            pubs[col + suffix] = df[col + suffix if col == 'cites_by_year' \
+                                    else col].reindex(pubs.index)
+    return pubs
+
+def author_info_score(author):
+    '''Total number of citations in a cached author retrieval entry.'''
+    author = unpack(author)
+    try:
+        return int(author['coredata']['citation-count'])
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+def _to_int(value):
+    '''Parses an integer field of a response, 0 if it is missing or not a
+    number.'''
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+class AuthorColumns(object):
+    """Column buffers for decoded author retrieval responses.
+
+    The fields of each response are appended directly to typed buffers:
+    int64 arrays for the counts and years, lists for the names and category
+    codes for the affiliations, which are shared by many authors. Missing
+    fields are decoded as 0 or the empty string, tombstoned author ids are
+    skipped. ``frame`` returns the same dataframe as decoding every response
+    with ``Scopus.decode_author_response``, except that the affiliation
+    column is categorical.
+    """
+
+    def __init__(self):
+        self.author_ids = []
+        self.strings = {col : [] for col in AUTHOR_STR_COLUMNS}
+        self.ints = {col : array('q') for col in AUTHOR_INT_COLUMNS}
+        self.affiliation_codes = array('q')
+        self.affiliations = {}
+
+    def __len__(self):
+        return len(self.author_ids)
+
+    def append(self, author):
+        '''
+        Decodes an author retrieval response into the buffers.
+
+        Input
+        author      Dict containing the parsed json.
 
-import numpy as np
-import pandas as pd
+        Output
+        added       False if the author id is a tombstone or the response
+                    has no author id.
+        '''
 
-import requests
-from humanize import naturalsize
+        profile = author.get('author-profile') or {}
+        alias = profile.get('alias')
+        if isinstance(alias, dict) and \
+            alias.get('@current-status') == 'tombstone':
+            return False
+        coredata = author.get('coredata') or {}
+        if 'dc:identifier' not in coredata:
+            return False
+
+        self.author_ids.append(coredata['dc:identifier'][10:])
+
+        ints = self.ints
+        ints['npubs'].append(_to_int(coredata.get('document-count')))
+        ints['ncites'].append(_to_int(coredata.get('citation-count')))
+        ints['ncited_by'].append(_to_int(coredata.get('cited-by-count')))
+        ints['ncoauthors'].append(_to_int(author.get('coauthor-count')))
+        ints['hindex'].append(_to_int(author.get('h-index')))
+        pub_range = profile.get('publication-range') or {}
+        ints['first_pub'].append(_to_int(pub_range.get('@start')))
+        ints['last_pub'].append(_to_int(pub_range.get('@end')))
+
+        names = profile.get('preferred-name') or {}
+        self.strings['name'].append(names.get('indexed-name', ''))
+        self.strings['first_name'].append(names.get('given-name', ''))
+        self.strings['last_name'].append(names.get('surname', ''))
+
+        affiliation = ''
+        current = profile.get('affiliation-current')
+        if current:
+            current = current.get('affiliation') or {}
+            if isinstance(current, list):
+                current = current[0] if current else {}
+            affiliation = (current.get('ip-doc') or {}).get('afdispname', '')
+        code = self.affiliations.get(affiliation)
+        if code is None:
+            code = len(self.affiliations)
+            self.affiliations[affiliation] = code
+        self.affiliation_codes.append(code)
+        return True
+
+    def extend(self, authors):
+        '''Decodes several responses, returns the number of authors added.'''
+        return sum(self.append(author) for author in authors)
+
+    def frame(self, start=0):
+        '''
+        Collects the decoded authors in a dataframe indexed by author_id.
 
-from scopuscite.utils import chunks, scopus_id_to_eid, eid_to_scopus_id
+        Input
+        start       Only authors appended after the first start authors are
+                    included.
 
-URI_SEARCH = 'https://api.elsevier.com/content/search/scopus'
-URI_AUTHOR = 'https://api.elsevier.com/content/author'
-URI_CITATION = 'https://api.elsevier.com/content/abstract/citations'
-URI_ABSTRACT = 'https://api.elsevier.com/content/abstract/scopus_id/'
+        Output
+        authors     Dataframe with integer columns AUTHOR_INT_COLUMNS.
+        '''
+
+        columns = {}
+        for col in AUTHOR_COLUMNS:
+            if col in self.ints:
+                columns[col] = np.frombuffer(self.ints[col], dtype=np.int64) \
+                                [start:].copy()
+            elif col == 'affiliation':
+                columns[col] = pd.Categorical.from_codes(
+                    np.frombuffer(self.affiliation_codes, dtype=np.int64) \
+                        [start:],
+                    categories=list(self.affiliations))
+            else:
+                columns[col] = self.strings[col][start:]
+        index = pd.Index(self.author_ids[start:], dtype=object,
+                         name='author_id')
+        return pd.DataFrame(columns, index=index, columns=AUTHOR_COLUMNS)
+
+    def keep(self, mask, start=0):
+        '''Keeps only the authors after position start for which mask is
+        True, e.g. the authors of the last batch satisfying a condition.'''
+        mask = np.asarray(mask, dtype=bool)
+        rows = np.flatnonzero(mask) + start
+        if len(rows) == len(self) - start:
+            return
+        self.author_ids[start:] = [self.author_ids[i] for i in rows]
+        for values in self.strings.values():
+            values[start:] = [values[i] for i in rows]
+        for col, values in self.ints.items():
+            self.ints[col] = values[:start] + array('q',
+                np.frombuffer(values, dtype=np.int64)[rows].tobytes())
+        self.affiliation_codes = self.affiliation_codes[:start] + \
+            array('q', np.frombuffer(self.affiliation_codes,
+                                     dtype=np.int64)[rows].tobytes())
 
 class Scopus(object):
     """Class to query the Scopus API with local caching to avoid redundant 
     calls.
+
+    Every cache entry carries the time it was fetched. With the ``ttl``
+    parameter one can set a maximum age in days for the entries of each
+    cache; the keys are ``'search_query'``, ``'author_pub'``, ``'pub_info'``
+    and ``'author_info'``. Calling the ``get_*`` methods with
+    ``refresh=True`` then re-fetches only entries older than the TTL.
+
+    The json responses stored in the ``'pub_info'`` and ``'author_info'``
+    caches are reduced to the fields used by the decoders (unless
+    ``projection=False``) and stored as compact json compressed with
+    ``codec`` (``'zlib'``, ``'lzma'`` or ``None``). Further fields can be kept
+    by listing them per cache in ``allowlist``, with nested fields given as
+    dot-separated paths.
+
+    If a ``store`` (see ``scopuscite.store.SharedStore``) is given, the caches
+    are views on this store instead of per-name pickle files, so that entries
+    are shared between all cache names.
+
+    All requests go through one HTTP session with a pool of up to
+    ``max_connections`` connections, which can be used concurrently.
+    Requests can be sent to another server, e.g. the stand-in server in
+    ``scopuscite.mock_server``, by setting ``base_url``, and recorded or
+    replayed by passing a ``transport`` from ``scopuscite.transport``.
+
+    Request counts, latencies, retries, response sizes, cache hit rates and
+    sizes, decode times and the remaining quota are recorded in ``metrics``
+    (see ``scopuscite.metrics``). Cache loading, reading, fetching and saving
+    are recorded as spans in ``tracer`` (see ``scopuscite.tracing``). The last
+    known quota of each endpoint is kept in ``quotas`` and saved in the cache
+    directory with the caches, or by ``close``, so that jobs can be planned
+    before any call is made (see ``scopuscite.planner``). Requests wait for an optional ``rate_limiter``
+    (see ``scopuscite.prefetch.RateLimiter``).
+
+    The page sizes of searches (``'search'`` and ``'author_pub'``) and the
+    batch sizes of author and citation retrievals (``'author'`` and
+    ``'citation'``) adapt to the latency and errors of the calls, see
+    ``scopuscite.batching``. ``batch_sizes`` can set other initial sizes; an
+    ``AdaptiveSize`` can be passed as well. Author and citation retrievals
+    and publication searches of concurrent callers, e.g. the threads of the
+    prefetch service, are coalesced, so that batches are full and no id is
+    requested twice at the same time.
+
+    With ``delta=True`` cached author lists and publication sets are synced
+    incrementally: only records added to Scopus since the entry was fetched
+    are searched and merged into the cached set. The ids added by the last
+    call are kept in ``added_authors`` and ``added_scopus_ids``.
     """
 
-    def __init__(self, apikey, cache_name=None, cache_dir=None):
+    def __init__(self, apikey, cache_name=None, cache_dir=None, ttl=None,
+                 projection=True, allowlist=None, codec='zlib', store=None,
+                 max_connections=10, base_url=None, transport=None,
+                 metrics=None, tracer=None, rate_limiter=None,
+                 batch_sizes=None):
         self.CACHE_DIR_DEFAULT = 'local_cache'
         self.CACHE_NAME_DEFAULT = 'cache'
         self.CACHE_AUTHOR_PUB_SUFFIX = '_author_pub.pkl'
         self.CACHE_PUB_INFO_SUFFIX = '_pub.pkl'
         self.CACHE_AUTHOR_INFO_SUFFIX = '_author.pkl'
         self.CACHE_SEARCH_QUERY_NAME = 'cache_search_query.pkl'
+        self.QUOTA_NAME = 'quota.json'
 
         self.apikey = apikey
         self.cache_name = cache_name if cache_name is not None else \
                             self.CACHE_NAME_DEFAULT
         self.cache_dir = cache_dir if cache_dir is not None else \
                             self.CACHE_DIR_DEFAULT
+        self.ttl = ttl if ttl is not None else {}
+        self.store = store
+        # Stamps of the cache files when they were last loaded or saved
+        self._cache_stamps = {}
+
+        # The session and its connection pool are created on first use
+        self.max_connections = max_connections
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._transport = transport
+        self.rate_limiter = rate_limiter
+
+        batch_sizes = batch_sizes if batch_sizes is not None else {}
+        self.batch_sizes = {}
+        for name, (initial, maximum) in BATCH_SIZES.items():
+            size = batch_sizes.get(name, initial)
+            if not isinstance(size, AdaptiveSize):
+                size = AdaptiveSize(size, maximum)
+            self.batch_sizes[name] = size
+        self._coalescers = {}
+        self._coalescer_lock = threading.Lock()
+
+        base_url = base_url if base_url is not None else API_BASE
+        self.uri_search = URI_SEARCH.replace(API_BASE, base_url)
+        self.uri_author = URI_AUTHOR.replace(API_BASE, base_url)
+        self.uri_citation = URI_CITATION.replace(API_BASE, base_url)
+        self.uri_abstract = URI_ABSTRACT.replace(API_BASE, base_url)
+
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        # Last known quota, from the X-RateLimit-* headers
+        self.quota_remaining = None
+        self.quota_limit = None
+        self.quota_reset = None
+        self.quotas = {}
+        self._quota_lock = threading.Lock()
+        self._quota_changed = False
+        self._quota_saved = time.monotonic()
+        self.codec = codec
+        # Ids added to the cached sets by the last delta sync
+        self.added_authors = set()
+        self.added_scopus_ids = set()
+
+        allowlist = allowlist if allowlist is not None else {}
+        if projection:
+            self.cite_info_fields = extend_fields(CITE_INFO_FIELDS,
+                allowlist.get('pub_info', []))
+            self.author_info_fields = extend_fields(AUTHOR_INFO_FIELDS,
+                allowlist.get('author_info', []))
+        else:
+            self.cite_info_fields = True
+            self.author_info_fields = True
 
         # Check if cache directory exists
         if not os.path.isdir(self.cache_dir):
             os.mkdir(self.cache_dir)
 
+        self.load_quota()
+
+    @property
+    def session(self):
+        '''HTTP session with a pool of up to max_connections connections.'''
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4,
+                    pool_maxsize=self.max_connections)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+        return self._session
+
+    @property
+    def transport(self):
+        '''Transport sending the requests, by default the session.'''
+        return self._transport if self._transport is not None \
+                else self.session
+
     def load_search_query_cache(self):
         """
         Loads the cache containing author ids from search queries
@@ -51,21 +426,28 @@ class Scopus(object):
             Function saves cache in self.cache_search_query
         """
 
+        if self.store is not None:
+            self.cache_search_query = \
+                self.store.view('search_query', self.cache_name)
+            return
+
         filename = os.path.join(self.cache_dir, self.CACHE_SEARCH_QUERY_NAME)
-        if os.path.exists(filename):
-            with open(filename, 'rb') as fp:
-                self.cache_search_query = pickle.load(fp)
-        else:
-            self.cache_search_query = {}
+        self.cache_search_query, self._cache_stamps[filename] = \
+            load_cache(filename)
 
     def save_search_query_cache(self):
         '''
         Saves the cache in self.cache_search_query to file.
         '''
 
+        self.flush_quota()
+        if self.store is not None:
+            self.store.flush()
+            return
+
         filename = os.path.join(self.cache_dir, self.CACHE_SEARCH_QUERY_NAME)
-        with open(filename, 'wb') as fp:
-                pickle.dump(self.cache_search_query, fp)   
+        self._cache_stamps[filename] = save_cache(filename,
+            self.cache_search_query, self._cache_stamps.get(filename))
 
     def load_author_pub_cache(self):
         '''
@@ -76,23 +458,30 @@ class Scopus(object):
             Function saves cache in self.cache_author_pub
         '''
 
+        if self.store is not None:
+            self.cache_author_pub = \
+                self.store.view('author_pub', self.cache_name)
+            return
+
         filename = os.path.join(self.cache_dir, 
             self.cache_name + self.CACHE_AUTHOR_PUB_SUFFIX)
-        if os.path.exists(filename):
-            with open(filename, 'rb') as fp:
-                self.cache_author_pub = pickle.load(fp)
-        else:
-            self.cache_author_pub = {}
+        self.cache_author_pub, self._cache_stamps[filename] = \
+            load_cache(filename)
 
     def save_author_pub_cache(self):
         '''
         Saves the cache in self.cache_author_pub to file.
         '''
 
+        self.flush_quota()
+        if self.store is not None:
+            self.store.flush()
+            return
+
         filename = os.path.join(self.cache_dir, 
             self.cache_name + self.CACHE_AUTHOR_PUB_SUFFIX)
-        with open(filename, 'wb') as fp:
-                pickle.dump(self.cache_author_pub, fp)
+        self._cache_stamps[filename] = save_cache(filename,
+            self.cache_author_pub, self._cache_stamps.get(filename))
 
     def load_pub_info_cache(self):
         '''
@@ -102,23 +491,30 @@ class Scopus(object):
             Function saves cache in self.cache_pub_info
         '''
 
+        if self.store is not None:
+            self.cache_pub_info = \
+                self.store.view('pub_info', self.cache_name)
+            return
+
         filename = os.path.join(self.cache_dir, 
             self.cache_name + self.CACHE_PUB_INFO_SUFFIX)
-        if os.path.exists(filename):
-            with open(filename, 'rb') as fp:
-                self.cache_pub_info = pickle.load(fp)
-        else:
-            self.cache_pub_info = {}
+        self.cache_pub_info, self._cache_stamps[filename] = \
+            load_cache(filename)
 
     def save_pub_info_cache(self):
         '''
         Saves the cache in self.cache_pub_info to file.
         '''
 
+        self.flush_quota()
+        if self.store is not None:
+            self.store.flush()
+            return
+
         filename = os.path.join(self.cache_dir, 
             self.cache_name + self.CACHE_PUB_INFO_SUFFIX)
-        with open(filename, 'wb') as fp:
-                pickle.dump(self.cache_pub_info, fp, pickle.HIGHEST_PROTOCOL)
+        self._cache_stamps[filename] = save_cache(filename,
+            self.cache_pub_info, self._cache_stamps.get(filename))
 
     def load_author_info_cache(self):
         '''
@@ -128,36 +524,174 @@ class Scopus(object):
             Function saves cache in self.cache_author_info
         '''
 
+        if self.store is not None:
+            self.cache_author_info = \
+                self.store.view('author_info', self.cache_name)
+            return
+
         filename = os.path.join(self.cache_dir, 
             self.cache_name + self.CACHE_AUTHOR_INFO_SUFFIX)
-        if os.path.exists(filename):
-            with open(filename, 'rb') as fp:
-                self.cache_author_info = pickle.load(fp)
-        else:
-            self.cache_author_info = {}
+        self.cache_author_info, self._cache_stamps[filename] = \
+            load_cache(filename)
 
     def save_author_info_cache(self):
         '''
         Saves the cache in self.cache_author_info to file.
         '''
 
+        self.flush_quota()
+        if self.store is not None:
+            self.store.flush()
+            return
+
         filename = os.path.join(self.cache_dir, 
             self.cache_name + self.CACHE_AUTHOR_INFO_SUFFIX)
-        with open(filename, 'wb') as fp:
-                pickle.dump(self.cache_author_info, fp)
+        self._cache_stamps[filename] = save_cache(filename,
+            self.cache_author_info, self._cache_stamps.get(filename))
+
+    def cache_memory(self, cache, kind):
+        '''
+        Approximate memory used by a loaded cache, recorded in the
+        cache_memory gauge.
+
+        Walking all entries of a cache is slow, so the size of a pickle
+        cache is only measured if the metrics are sent to a sink. For a view
+        on a shared store the size of the loaded shards of its kind is used.
+
+        Output
+        size        Size in bytes or None if it was not measured.
+        '''
+
+        if self.store is not None:
+            size = self.store.memory_size(kind)
+        elif self.metrics.sinks:
+            size = deep_sizeof(cache)
+        else:
+            return None
+        self.metrics.gauge('cache_memory', size, cache=kind)
+        return size
+
+    def endpoint_name(self, url):
+        '''Name of the API endpoint of an url, used to label metrics.'''
+        endpoints = [(self.uri_search, 'search'),
+                     (self.uri_author, 'author'),
+                     (self.uri_citation, 'citation'),
+                     (self.uri_abstract, 'abstract')]
+        for uri, name in endpoints:
+            if url.startswith(uri):
+                return name
+        return 'other'
+
+    def load_quota(self):
+        '''
+        Loads the last known quota of each endpoint from the cache directory.
+        '''
+
+        filename = os.path.join(self.cache_dir, self.QUOTA_NAME)
+        if not os.path.isfile(filename):
+            return
+        try:
+            with open(filename, 'r') as fp:
+                self.quotas = json.load(fp)
+        except ValueError:
+            return
+
+    def save_quota(self):
+        '''
+        Saves the last known quota of each endpoint to the cache directory.
+        '''
+
+        filename = os.path.join(self.cache_dir, self.QUOTA_NAME)
+        tmp_filename = '{}.{}.{}.tmp'.format(filename, os.getpid(),
+                                             threading.get_ident())
+        with open(tmp_filename, 'w') as fp:
+            json.dump(dict(self.quotas), fp)
+        os.replace(tmp_filename, filename)
+
+    def flush_quota(self, force=True):
+        '''
+        Saves the quota if it changed since it was last saved. The quota is
+        saved with the caches and at most every QUOTA_SAVE_INTERVAL seconds
+        while calls are made, unless force is True.
+        '''
+
+        with self._quota_lock:
+            if not self._quota_changed or (not force and \
+                time.monotonic() - self._quota_saved < QUOTA_SAVE_INTERVAL):
+                return
+            self._quota_changed = False
+            self._quota_saved = time.monotonic()
+            self.save_quota()
+
+    def close(self):
+        '''Saves the quota and closes the HTTP session.'''
+        self.flush_quota()
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def record_quota(self, r, endpoint='other'):
+        '''Updates the last known quota from the headers of a response.'''
+        headers = r.headers
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+        self.quota_remaining = int(headers['X-RateLimit-Remaining'])
+        self.quota_limit = int(headers['X-RateLimit-Limit'])
+        if 'X-RateLimit-Reset' in headers:
+            self.quota_reset = int(headers['X-RateLimit-Reset'])
+        self.quotas[endpoint] = {'remaining' : self.quota_remaining,
+                                 'limit' : self.quota_limit,
+                                 'reset' : self.quota_reset,
+                                 'time' : time.time()}
+        self._quota_changed = True
+        self.flush_quota(force=False)
+        self.metrics.gauge('quota_remaining', self.quota_remaining,
+                           endpoint=endpoint)
+        self.metrics.gauge('quota_limit', self.quota_limit, endpoint=endpoint)
+
+    def decode_json(self, r, endpoint='other'):
+        '''Parses the body of a response with the json backend of
+        scopuscite.jsonlib.'''
+        start = time.perf_counter()
+        js = jsonlib.loads(r.content)
+        self.metrics.observe('json_decode_time', time.perf_counter() - start,
+                             TIMING_BUCKETS, endpoint=endpoint)
+        return js
 
     def call_api(self, url, params):
+        endpoint = self.endpoint_name(url)
         max_calls = 3
-        for _ in range(max_calls):
-            r = requests.get(url, params=params)
+        for attempt in range(max_calls):
+            if attempt > 0:
+                self.metrics.increment('retries', endpoint=endpoint)
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            start = time.perf_counter()
+            r = self.transport.get(url, params=params)
+            self.metrics.observe('request_latency',
+                time.perf_counter() - start, endpoint=endpoint)
+            self.metrics.increment('requests', endpoint=endpoint,
+                                   status=r.status_code)
+            self.metrics.increment('response_bytes', len(r.content),
+                                   endpoint=endpoint)
+            self.record_quota(r, endpoint)
 
             #print(url)
             #print(params)
             #print(r.status_code)
 
             if r.status_code == 200:
-                js = r.json()
+                js = self.decode_json(r, endpoint)
                 return r, js
+            elif r.status_code == 404:
+                # Missing ressources are reported with a service-error that
+                # the caller has to handle. No point in trying again.
+                try:
+                    return r, self.decode_json(r, endpoint)
+                except ValueError:
+                    return r, None
             # elif not r.status_code in {503, 504}:
             #     print(r)
             #     print(r.headers)
@@ -165,12 +699,38 @@ class Scopus(object):
             
             # time.sleep(1)
 
+        self.metrics.increment('failed_calls', endpoint=endpoint)
         print('Number of consecutive failed to Scopus exceeds {}.' \
                 .format(max_calls))
         print(r)
         print(r.headers)
         return r, None
 
+    def call_batch(self, name, url, params):
+        '''
+        Calls the API and adapts the batch size name to the latency and
+        outcome of the call, see call_api.
+        '''
+        size = self.batch_sizes[name]
+        start = time.perf_counter()
+        r, js = self.call_api(url, params)
+        if js is None:
+            size.failure()
+        else:
+            size.success(time.perf_counter() - start)
+        self.metrics.gauge('batch_size', size.value, kind=name)
+        return r, js
+
+    def coalescer(self, key, fetch, size):
+        '''
+        Returns the request coalescer for lookups with the given key,
+        creating it with the fetch function and batch size if needed.
+        '''
+        with self._coalescer_lock:
+            if key not in self._coalescers:
+                self._coalescers[key] = RequestCoalescer(fetch, size)
+            return self._coalescers[key]
+
     def check_api_response(self, r, js):
         '''
         Checks the response from scopus for errors
@@ -198,7 +758,8 @@ class Scopus(object):
         return 2
 
     def get_authors_from_journal_year(self, year, journal=None, issn=None,
-                                    force_reload=False):
+                                    force_reload=False, refresh=False,
+                                    delta=False):
         """Retrieves author ids for a given journal and year.
 
         The function retrieves from Scopus the author ids of all authors that
@@ -219,6 +780,17 @@ class Scopus(object):
         force_reload : bool, optional
             If ``True`` then function ignores the local cache and queries 
             Scopus.
+        refresh : bool, optional
+            If ``True`` then the cached result is re-fetched if it is older
+            than ``ttl['search_query']``.
+        delta : bool, optional
+            If ``True`` then a cached result that would be re-fetched is
+            instead extended by the authors of publications added to Scopus
+            since it was fetched. Without ``refresh`` every cached result is
+            synced.
+
+            Authors that were not in the cached result are stored in
+            ``added_authors``.
 
         Returns
         -------
@@ -228,76 +800,212 @@ class Scopus(object):
 
         print('Querying Scopus to retrieve list of authors.')
 
-        search_query = 'PUBYEAR+IS+' + str(year)
-        if journal is not None:
-            search_query += ' AND SRCTITLE(' + journal + ')'
-        if issn is not None:
-            search_query += ' AND ISSN(' + issn + ')'
+        search_query = journal_year_query(year, journal, issn)
 
         self.load_search_query_cache()
-
-        if not force_reload and search_query in self.cache_search_query:
-            authors = self.cache_search_query[search_query]
+        self.added_authors = set()
+
+        cached = search_query in self.cache_search_query
+        sync = cached and delta and not force_reload and not refresh
+        if cached and refresh and not force_reload:
+            if stale_keys(self.cache_search_query, [search_query],
+                          self.ttl.get('search_query')):
+                print('Cached authors are stale, refreshing.')
+                force_reload = True
+                sync = delta
+
+        if not force_reload and cached and not sync:
+            authors = entry_value(self.cache_search_query[search_query])
+            self.metrics.increment('cache_hits', cache='search_query')
             print('Authors retrieved from cache.')
         else:
-            
-            par = {'apikey': self.apikey, 
-                'query': search_query,
-                'httpAccept': 'application/json',
-                'field': 'eid,author',
-                'count': 200,
-                'start': 0}
-
-            r, js = self.call_api(URI_SEARCH, par)
-            if js is None:
-                print('Something went wrong when querying scopus')
+            self.metrics.increment('cache_misses', cache='search_query')
+            if sync:
+                entry = self.cache_search_query[search_query]
+                authors = self._search_authors(
+                    load_date_query(search_query, entry_time(entry)))
+            else:
+                authors = self._search_authors(search_query)
+            if authors is None and cached:
+                print('Falling back to cached authors.')
+                authors = entry_value(self.cache_search_query[search_query])
+            elif authors is None:
                 return None
-            
-            num_results = int(js['search-results']['opensearch:totalResults'])
-            retrieved = 0
+            else:
+                cached_authors = entry_value(
+                    self.cache_search_query[search_query]) if cached \
+                    else set()
+                if sync:
+                    authors = cached_authors | authors
+                self.added_authors = authors - cached_authors
+                print('Authors added: {}'.format(len(self.added_authors)))
+                # Save result to cache
+                self.cache_search_query[search_query] = make_entry(authors)
+                self.save_search_query_cache()
 
-            if num_results == 0:
-                print('Nothing found. Check search query')
-                return set()
+        print('Authors found: {}'.format(len(authors)))
+        print('')
 
-            authors = set()
-            while retrieved < num_results:
+        return authors
 
-                entries = js['search-results']['entry']
-                for entry in entries:
-                    if 'author' in entry:
-                        authors |= { a['authid'] for a in entry['author'] }
+    def get_authors_from_journal_years(self, jobs, force_reload=False,
+                                       refresh=False, delta=False,
+                                       max_workers=1):
+        """Retrieves author ids for several journal-year pairs.
 
-                par['start'] += len(entries)
-                retrieved += len(entries)
+        Search queries not found in the cache are sent to Scopus concurrently.
 
-                if retrieved >= num_results:
-                    break
+        Parameters
+        ----------
+        jobs : list of tuples
+            Tuples ``(year, journal, issn)``, see
+            ``get_authors_from_journal_year``.
+        force_reload : bool, optional
+            If ``True`` then function ignores the local cache and queries 
+            Scopus.
+        refresh : bool, optional
+            If ``True`` then cached results older than ``ttl['search_query']``
+            are re-fetched.
+        delta : bool, optional
+            If ``True`` then cached results are synced incrementally, see
+            ``get_authors_from_journal_year``.
+        max_workers : int, optional
+            Number of queries sent to Scopus concurrently.
 
-                r, js = self.call_api(URI_SEARCH, par)
-                if js is None:
-                    print('Something went wrong when querying scopus.')
-                    return None
+        Returns
+        -------
+        list
+            Set of author ids for each job, ``None`` if the query failed.
+            Authors that were not in the cached results are stored in
+            ``added_authors``.
+        """
 
-            print('Api calls remaining: {} / {}' \
-                    .format(r.headers['X-RateLimit-Remaining'],
-                            r.headers['X-RateLimit-Limit']))
+        print('Querying Scopus to retrieve list of authors for {} jobs.' \
+                .format(len(jobs)))
 
-            # Save result to cache                
-            self.cache_search_query[search_query] = authors            
-            self.save_search_query_cache()
+        queries = [journal_year_query(*job) for job in jobs]
 
-        print('Authors found: {}'.format(len(authors)))
+        self.load_search_query_cache()
+        self.added_authors = set()
+
+        # Fetch times of the cached results that are synced incrementally
+        since = {}
+        if force_reload:
+            queries_new = list(set(queries))
+        else:
+            stale = []
+            if refresh:
+                stale = stale_keys(self.cache_search_query, queries,
+                                   self.ttl.get('search_query'))
+            elif delta:
+                stale = queries
+            queries_new = list({q for q in queries \
+                if q not in self.cache_search_query or q in stale})
+            if delta:
+                since = {q : entry_time(self.cache_search_query[q]) \
+                            for q in queries_new \
+                            if q in self.cache_search_query}
+        self.metrics.increment('cache_hits', len(set(queries)) - \
+            len(queries_new), cache='search_query')
+        self.metrics.increment('cache_misses', len(queries_new),
+                               cache='search_query')
+        print('Queries to send to Scopus: {}'.format(len(queries_new)))
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            results = list(executor.map(self._search_authors,
+                [load_date_query(q, since[q]) if q in since else q \
+                    for q in queries_new]))
+
+        for search_query, authors in zip(queries_new, results):
+            if authors is not None:
+                cached_authors = entry_value(
+                    self.cache_search_query[search_query]) \
+                    if search_query in self.cache_search_query else set()
+                if search_query in since:
+                    authors = cached_authors | authors
+                self.added_authors |= authors - cached_authors
+                self.cache_search_query[search_query] = make_entry(authors)
+        self.save_search_query_cache()
+
+        # Failed queries fall back to stale cache entries, if there are any
+        res = []
+        for search_query in queries:
+            if search_query in self.cache_search_query:
+                res.append(entry_value(self.cache_search_query[search_query]))
+            else:
+                res.append(None)
+
+        print('Authors found: {}'.format(len(set_union( \
+            authors for authors in res if authors is not None))))
+        print('Authors added: {}'.format(len(self.added_authors)))
         print('')
 
+        return res
+
+    def _search_authors(self, search_query):
+        '''
+        Runs a search query and collects the author ids of all results.
+
+        Input
+        search_query    Scopus search query
+
+        Output
+        authors         Set of author ids or None if something went wrong.
+        '''
+
+        par = {'apikey': self.apikey, 
+            'query': search_query,
+            'httpAccept': 'application/json',
+            'field': 'eid,author',
+            'count': self.batch_sizes['search'].value,
+            'start': 0}
+
+        r, js = self.call_batch('search', self.uri_search, par)
+        if js is None:
+            print('Something went wrong when querying scopus')
+            return None
+        
+        num_results = int(js['search-results']['opensearch:totalResults'])
+        retrieved = 0
+
+        if num_results == 0:
+            print('Nothing found. Check search query')
+            return set()
+
+        authors = set()
+        while retrieved < num_results:
+
+            entries = js['search-results']['entry']
+            for entry in entries:
+                if 'author' in entry:
+                    authors |= { a['authid'] for a in entry['author'] }
+
+            par['start'] += len(entries)
+            retrieved += len(entries)
+
+            if retrieved >= num_results:
+                break
+
+            par['count'] = self.batch_sizes['search'].value
+            r, js = self.call_batch('search', self.uri_search, par)
+            if js is None:
+                print('Something went wrong when querying scopus.')
+                return None
+
+        print('Api calls remaining: {} / {}' \
+                .format(r.headers['X-RateLimit-Remaining'],
+                        r.headers['X-RateLimit-Limit']))
+
         return authors
 
-    def get_single_author_publications(self, author_id):
+    def get_single_author_publications(self, author_id, since=None):
         '''
         Retrieves the scopus_ids of publications of a single author
 
         Input
         author_id       paper to query
+        since           If given, only publications added to Scopus after
+                        this time (seconds since the epoch) are retrieved.
 
         Output
         scopus_ids      set of scopus_ids
@@ -307,12 +1015,12 @@ class Scopus(object):
         
         par = {'apikey': self.apikey, 
             'httpAccept': 'application/json',
-            'query': 'AU-ID(' + author_id + ')',
+            'query': load_date_query('AU-ID(' + author_id + ')', since),
             'field': 'eid,author',
-            'count': 50,
+            'count': self.batch_sizes['author_pub'].value,
             'start': 0}
 
-        _, js = self.call_api(URI_SEARCH, params=par)
+        _, js = self.call_batch('author_pub', self.uri_search, par)
         if js is None:
             return None
         
@@ -336,23 +1044,60 @@ class Scopus(object):
             if retrieved >= num_results:
                 break
 
-            _, js = self.call_api(URI_SEARCH, params=par)
+            par['count'] = self.batch_sizes['author_pub'].value
+            _, js = self.call_batch('author_pub', self.uri_search, par)
             if js is None:
                 return None
         
         return scopus_ids
-            
 
-    def get_author_publications(self, author_ids, force_reload=False):
+    def _fetch_author_publications(self, author_ids):
+        '''Publication searches of several authors, used by the request
+        coalescer of get_author_publications.'''
+        res = {}
+        for author_id in author_ids:
+            scopus_ids = self.get_single_author_publications(author_id)
+            if scopus_ids is None:
+                raise FetchError('Search for author {} failed.' \
+                                    .format(author_id))
+            res[author_id] = scopus_ids
+        return res
+
+    def _coalesced_author_publications(self, author_id, since=None):
+        '''Publications of an author, see get_single_author_publications.
+        Concurrent searches for the same author are sent only once.'''
+        if since is not None:
+            return self.get_single_author_publications(author_id, since)
+        # One author per batch, the searches of a batch run sequentially
+        coalescer = self.coalescer('author_pub',
+                                   self._fetch_author_publications, 1)
+        try:
+            return coalescer.get([author_id])[author_id]
+        except FetchError:
+            return None
+
+    def get_author_publications(self, author_ids, force_reload=False,
+                                refresh=False, refresh_budget=None,
+                                delta=False, max_workers=1):
         '''
         Retrieves set of scopus_ids with all publications from given author ids.
 
         Input:
         author_ids      List of author ids to be queried.
         force_reload    If True cache is ignored.
+        refresh         If True, cached entries older than ttl['author_pub']
+                        are re-fetched, stalest first.
+        refresh_budget  Maximum number of stale entries to re-fetch.
+        delta           If True, cached entries are synced incrementally
+                        instead of re-fetched: only publications added to
+                        Scopus since the entry was fetched are searched. All
+                        cached entries are synced unless refresh is set.
+        max_workers     Number of authors queried concurrently.
 
         Output:
         scopus_ids      Set of eids with all publications from the authors.
+                        Eids not in the cached sets of the authors are stored
+                        in self.added_scopus_ids.
         '''
 
         print('Querying Scopus to retrieve list of publication scopus ids.')
@@ -361,16 +1106,34 @@ class Scopus(object):
         author_ids = list(author_ids)
         author_ids_new = []
         scopus_ids = set()
+        self.added_scopus_ids = set()
 
         print('Loading cache.')
-        self.load_author_pub_cache()
+        with self.tracer.span('cache_load'):
+            self.load_author_pub_cache()
+
+        # Select stale cache entries that will be re-fetched
+        stale = set()
+        if refresh and not force_reload:
+            stale = set(stale_keys(self.cache_author_pub, author_ids,
+                                   self.ttl.get('author_pub'), refresh_budget))
+            print('Stale entries to refresh: {}'.format(len(stale)))
+        elif delta and not force_reload:
+            stale = {a for a in author_ids if a in self.cache_author_pub}
+
+        # Fetch times of the entries that are synced incrementally
+        since = {}
+        if delta:
+            since = {a : entry_time(self.cache_author_pub[a]) for a in stale}
+            print('Entries to sync: {}'.format(len(since)))
 
         # Start by retrieving cached authors
         if not force_reload:
             num_read_cache = 0
             for author_id in author_ids:
-                if author_id in self.cache_author_pub:
-                    scopus_ids |= self.cache_author_pub[author_id]
+                if author_id in self.cache_author_pub and \
+                    author_id not in stale:
+                    scopus_ids |= entry_value(self.cache_author_pub[author_id])
     
                     num_read_cache += 1
                     if num_read_cache % 100 == 0:
@@ -385,8 +1148,13 @@ class Scopus(object):
         chunk_size = 20 # For caching purposes
         num_chunks = math.ceil(len(author_ids_new) / chunk_size)
         
+        self.metrics.increment('cache_hits',
+            len(author_ids) - len(author_ids_new), cache='author_pub')
+        self.metrics.increment('cache_misses', len(author_ids_new),
+                               cache='author_pub')
+
         print('Authors to query Scopus: {}'.format(len(author_ids_new)))
-        r = None
+        span = self.tracer.start('fetch')
         for idx, chunk in enumerate(chunks(author_ids_new, chunk_size)):
             
             print('Chunk {} / {}'.format(idx+1, num_chunks))
@@ -394,24 +1162,40 @@ class Scopus(object):
             # This dict will be added to the cache
             author_pub = dict()
 
-            for a in chunk:
-                pubs = self.get_single_author_publications(a)
+            with ThreadPoolExecutor(max_workers) as executor:
+                results = list(executor.map(
+                    self._coalesced_author_publications, chunk,
+                    [since.get(a) for a in chunk]))
+
+            for a, pubs in zip(chunk, results):
                 if pubs is not None:
-                    author_pub[a] = pubs
+                    cached_pubs = entry_value(self.cache_author_pub[a]) \
+                        if a in self.cache_author_pub else set()
+                    if a in since:
+                        pubs = cached_pubs | pubs
+                    self.added_scopus_ids |= pubs - cached_pubs
+                    author_pub[a] = make_entry(pubs)
                     scopus_ids |= pubs
+                elif a in stale:
+                    # Keep the stale entry if refreshing failed
+                    scopus_ids |= entry_value(self.cache_author_pub[a])
 
             # Update cache
             self.cache_author_pub.update(author_pub)
             self.save_author_pub_cache()
 
+        self.tracer.finish(span, items=len(author_ids_new))
+
         # Save cache (just to be sure)
-        self.save_author_pub_cache()
+        with self.tracer.span('cache_save'):
+            self.save_author_pub_cache()
 
-        if r is not None:
+        if author_ids_new and 'search' in self.quotas:
             print('Api calls remaining: {} / {}' \
-                    .format(r.headers['X-RateLimit-Remaining'],
-                            r.headers['X-RateLimit-Limit']))
+                    .format(self.quotas['search']['remaining'],
+                            self.quotas['search']['limit']))
         print('Publications found: {}'.format(len(scopus_ids)))
+        print('Publications added: {}'.format(len(self.added_scopus_ids)))
         print('')
         
         return scopus_ids
@@ -448,10 +1232,7 @@ class Scopus(object):
         else:
             info['authors'] = []
 
-        cite_names = {'all' : 'cites_by_year',
-                      'exclude-self' : 'cites_by_year_excl_self',
-                      'exclude-books' : 'cites_by_year_excl_books' }
-        col_name = cite_names[cite_type]
+        col_name = 'cites_by_year' + CITE_TYPES[cite_type]
         if 'cc' in cite_info and isinstance(cite_info['cc'], list):
             info[col_name] = \
                 np.array([ int(x['$']) for x in cite_info['cc'] ])
@@ -461,12 +1242,47 @@ class Scopus(object):
         info['pcc'] = int(cite_info['pcc']) if 'pcc' in cite_info else 0
         info['lcc'] = int(cite_info['lcc']) if 'lcc' in cite_info else 0
         info['cites_start_year'] = start_year
-        info['ncites'] = sum(info['cites_by_year']) + info['pcc'] + info['lcc']
+        info['ncites'] = sum(info[col_name]) + info['pcc'] + info['lcc']
         
         return info
 
+    def _fetch_cite_info(self, year_range, cite_type, scopus_ids):
+        '''
+        Retrieves the citation overviews of a batch of publications. Used by
+        the request coalescer of get_publication_info.
+
+        Output
+        cite_info       Dict with the entry of each scopus_id. It is empty
+                        if Scopus did not find the publications.
+        '''
+
+        par = {'apikey': self.apikey, 
+            'scopus_id': ','.join(scopus_ids),
+            'httpAccept':'application/json', 
+            'date': '%i-%i' % (year_range[0], year_range[1]-1),
+            'count' : str(len(scopus_ids)),
+            'view' : 'STANDARD'}
+        # Default is all citation, no parameter needed in this case
+        if cite_type in {'exclude-self', 'exclude-books'}:
+            par['citation'] = cite_type
+
+        r, js = self.call_batch('citation', self.uri_citation, par)
+        if js is None:
+            raise FetchError('Citation overview failed.')
+
+        if 'service-error' in js:
+            if self.check_api_response(r, js) == 1:
+                return {}
+            raise FetchError('Citation overview failed.')
+
+        cite_info = js['abstract-citations-response'] \
+                    ['citeInfoMatrix']['citeInfoMatrixXML'] \
+                    ['citationMatrix']['citeInfo']
+        return {entry['dc:identifier'][10:] : entry for entry in cite_info}
+
     def get_publication_info(self, scopus_ids, year_range, cite_type='all',
-                             force_reload=False):
+                             force_reload=False, refresh=False,
+                             refresh_budget=None, refresh_priority='stalest'):
         '''
         Retrieves detailed information about publications with given scopus ids
         from Scopus and collects information in a dataframe.
@@ -477,8 +1293,18 @@ class Scopus(object):
                         Following python convention we return citation data for
                         the years
                             start, start+1, ..., end-1
-        cite_type       'all', 'exclude-self', 'exclude-books'
+        cite_type       'all', 'exclude-self', 'exclude-books' or a list of
+                        these. For a list, the variants of each chunk are
+                        fetched concurrently, each is cached separately and
+                        they are merged into one row per publication, see
+                        merge_cite_variants.
         force_reload    If True, cache is ignored
+        refresh         If True, cached entries older than ttl['pub_info']
+                        are re-fetched.
+        refresh_budget  Maximum number of stale entries to re-fetch.
+        refresh_priority
+                        'stalest' re-fetches the oldest entries first, 'cited'
+                        the most cited publications first.
 
         Output
         pubs            Dataframe with the information
@@ -486,105 +1312,162 @@ class Scopus(object):
 
         print('Retrieving publication info for {} ids.'.format(len(scopus_ids)))
         
+        cite_types = [cite_type] if isinstance(cite_type, str) \
+                        else list(dict.fromkeys(cite_type))
         scopus_id_list = list(scopus_ids)
-        scopus_id_list_new = []
-        pubs_list = []
+        scopus_id_list_new = {ct : [] for ct in cite_types}
+        pubs_list = {ct : [] for ct in cite_types}
         
         # Load cache file
         print('Loading cache file.')
-        self.load_pub_info_cache()
-        print('Cache size: {}' \
-                .format(naturalsize(sys.getsizeof(self.cache_pub_info, 0))))
+        with self.tracer.span('cache_load'), \
+                self.metrics.timer('cache_load_time', cache='pub_info'):
+            self.load_pub_info_cache()
+        cache_memory = self.cache_memory(self.cache_pub_info, 'pub_info')
+        if cache_memory is not None:
+            print('Cache size: {}'.format(
+                humanize.naturalsize(cache_memory)))
+
+        # Select stale cache entries that will be re-fetched
+        stale = set()
+        if refresh and not force_reload:
+            score = cite_info_score if refresh_priority == 'cited' else None
+            keys = [(scopus_id, year_range, ct) \
+                        for ct in cite_types for scopus_id in scopus_id_list]
+            stale = set(stale_keys(self.cache_pub_info, keys,
+                                   self.ttl.get('pub_info'), refresh_budget,
+                                   score))
+            print('Stale entries to refresh: {}'.format(len(stale)))
         
         # Load publications from cache
+        span = self.tracer.start('cache_read')
+        decode_start = time.perf_counter()
         if not force_reload:
             num_read_cache = 0
-            for scopus_id in scopus_id_list:
-                cache_key = (scopus_id, year_range, cite_type)
-                if cache_key in self.cache_pub_info:
-                    entry = self.cache_pub_info[cache_key]
-                    pub = self.decode_cite_info(entry, year_range[0], cite_type)
-                    pubs_list.append(pub)
-                    
-                    num_read_cache += 1
-                    if num_read_cache % 10000 == 0:
-                        print('Read from cache: {}'.format(num_read_cache))
-                else:
-                    scopus_id_list_new.append(scopus_id)
+            for ct in cite_types:
+                for scopus_id in scopus_id_list:
+                    cache_key = (scopus_id, year_range, ct)
+                    if cache_key in self.cache_pub_info and \
+                        cache_key not in stale:
+                        entry = unpack(
+                            entry_value(self.cache_pub_info[cache_key]))
+                        pub = self.decode_cite_info(entry, year_range[0], ct)
+                        pubs_list[ct].append(pub)
+                        
+                        num_read_cache += 1
+                        if num_read_cache % 10000 == 0:
+                            print('Read from cache: {}'.format(num_read_cache))
+                    else:
+                        scopus_id_list_new[ct].append(scopus_id)
             print('Total read from cache: {}'.format(num_read_cache))
         else:
-            scopus_id_list_new = scopus_id_list
+            scopus_id_list_new = {ct : scopus_id_list for ct in cite_types}
             print('Ignoring cache, reloading all info.')
+        self.metrics.observe('decode_time', time.perf_counter() - decode_start,
+                             TIMING_BUCKETS, cache='pub_info', source='cache')
+        num_read = sum(len(pubs_list[ct]) for ct in cite_types)
+        num_new = sum(len(scopus_id_list_new[ct]) for ct in cite_types)
+        self.tracer.finish(span, items=num_read)
+
+        self.metrics.increment('cache_hits', num_read, cache='pub_info')
+        self.metrics.increment('cache_misses', num_new, cache='pub_info')
         
-        par = {'apikey': self.apikey, 
-            'scopus_id': '',
-            'httpAccept':'application/json', 
-            'date': '%i-%i' % (year_range[0], year_range[1]-1),
-            'count' : '25',
-            'view' : 'STANDARD'}
-        # Default is all citation, no parameter needed in this case
-        if cite_type in {'exclude-self', 'exclude-books'}:
-            par['citation'] = cite_type
-        
-        print('To be retrieved from Scopus: {}'.format(len(scopus_id_list_new)))
-        
-        chunk_size = 25 # Limit set by Scopus API
-        num_chunks = math.ceil(len(scopus_id_list_new) / chunk_size)
+        print('To be retrieved from Scopus: {}'.format(num_new))
+
+        def fetch(task):
+            ct, chunk = task
+            coalescer = self.coalescer(('citation', year_range, ct),
+                functools.partial(self._fetch_cite_info, year_range, ct),
+                self.batch_sizes['citation'])
+            try:
+                return coalescer.get(chunk)
+            except FetchError:
+                return None
+
+        # The variants of one chunk are fetched concurrently
+        executor = ThreadPoolExecutor(len(cite_types)) \
+                    if len(cite_types) > 1 else None
         
-        r = None
+        # The chunk size adapts to the latency of the calls
+        pos = {ct : 0 for ct in cite_types}
+        idx = 0
         res_not_found = 0
-        for idx, chunk in enumerate(chunks(scopus_id_list_new, chunk_size)):
-            if (idx+1) % 20 == 0:
-                print('Chunk {} / {}.'.format(idx+1, num_chunks))
-            par['scopus_id'] = ','.join(chunk)
-            
-            r, js = self.call_api(URI_CITATION, par)
-            if js is None:
-                print('Something went wrong.')
-                break;
+        failed = False
+        span = self.tracer.start('fetch')
+        while not failed and \
+            any(pos[ct] < len(scopus_id_list_new[ct]) for ct in cite_types):
+            idx += 1
+            if idx % 20 == 0:
+                print('Retrieved {} / {}.'.format(sum(pos.values()), num_new))
+            chunk_size = self.batch_sizes['citation'].value
+            tasks = []
+            for ct in cite_types:
+                if pos[ct] < len(scopus_id_list_new[ct]):
+                    tasks.append((ct, scopus_id_list_new[ct] \
+                                        [pos[ct]:pos[ct]+chunk_size]))
+                    pos[ct] += chunk_size
+            results = executor.map(fetch, tasks) if executor is not None \
+                        else map(fetch, tasks)
             
-            # Something went wrong
-            if 'service-error' in js and \
-                'status' in js['service-error'] and \
-                'statusCode' in js['service-error']['status'] and \
-                js['service-error']['status']['statusCode'] \
-                    == 'RESOURCE_NOT_FOUND':
-                res_not_found += 1
-                continue
-            
-            cite_info = js['abstract-citations-response'] \
-                        ['citeInfoMatrix']['citeInfoMatrixXML'] \
-                        ['citationMatrix']['citeInfo']
-            
-            for entry in cite_info:
-                # Save result to cache
-                scopus_id = entry['dc:identifier'][10:]
-                cache_key = (scopus_id, year_range, cite_type)
-                self.cache_pub_info[cache_key] = entry
+            for (ct, chunk), found in zip(tasks, results):
+                if found is None:
+                    print('Something went wrong.')
+                    failed = True
+                    break;
                 
-                # Decode result
-                pub = self.decode_cite_info(entry, year_range[0], cite_type)
-                pubs_list.append(pub)
+                decode_start = time.perf_counter()
+                for scopus_id in chunk:
+                    entry = found[scopus_id]
+                    if entry is None:
+                        res_not_found += 1
+                        continue
+
+                    # Save result to cache
+                    cache_key = (scopus_id, year_range, ct)
+                    self.cache_pub_info[cache_key] = make_entry(pack(
+                        project(entry, self.cite_info_fields), self.codec))
+                    stale.discard(cache_key)
+                    
+                    # Decode result
+                    pub = self.decode_cite_info(entry, year_range[0], ct)
+                    pubs_list[ct].append(pub)
+                self.metrics.observe('decode_time',
+                    time.perf_counter() - decode_start, TIMING_BUCKETS,
+                    cache='pub_info', source='api')
                 
-            if (idx+1) % 200 == 0:
+            if idx % 200 == 0:
                 print('Saving cache file.')
                 self.save_pub_info_cache()
+
+        if executor is not None:
+            executor.shutdown()
+        self.tracer.finish(span, items=num_new)
+
+        # Keep stale entries that could not be refreshed
+        for cache_key in stale:
+            entry = unpack(entry_value(self.cache_pub_info[cache_key]))
+            pubs_list[cache_key[2]].append(
+                self.decode_cite_info(entry, year_range[0], cache_key[2]))
         
         # Save cache file
         print('Saving cache file.')
-        self.save_pub_info_cache()
+        with self.tracer.span('cache_save'), \
+                self.metrics.timer('cache_save_time', cache='pub_info'):
+            self.save_pub_info_cache()
         
         if res_not_found > 0:
             print('Ressources not found: {}.'.format(res_not_found))
         
-        if r is not None:
-            print('{} / {} api calls remaining.' \
-                    .format(r.headers['X-RateLimit-Remaining'],
-                            r.headers['X-RateLimit-Limit']))
-        else:
+        if num_new == 0:
             print('Scopus api was not called.')
+        elif self.quota_remaining is not None:
+            print('{} / {} api calls remaining.' \
+                    .format(self.quota_remaining, self.quota_limit))
         
-        pubs = pd.DataFrame(pubs_list).set_index('scopus_id')
+        if isinstance(cite_type, str):
+            pubs = pd.DataFrame(pubs_list[cite_type]).set_index('scopus_id')
+        else:
+            pubs = merge_cite_variants(pubs_list, cite_types)
         print('Publication info retrieved.')
         print('')
     
@@ -641,7 +1524,54 @@ class Scopus(object):
 
         return info
 
-    def get_author_info(self, author_ids, force_reload=False):
+    def filter_authors(self, columns, condition, start=0):
+        '''
+        Keeps the decoded authors satisfying a condition.
+
+        Input
+        columns         AuthorColumns with the decoded authors.
+        condition       Expression, Filter or function of a row, see
+                        scopuscite.filters.select. If None, all authors are
+                        kept.
+        start           Only authors after this position are filtered.
+        '''
+
+        if condition is None or len(columns) == start:
+            return
+        mask = np.asarray(select(columns.frame(start), condition))
+        self.metrics.increment('authors_filtered', int((~mask).sum()))
+        columns.keep(mask, start)
+
+    def _fetch_author_info(self, author_ids):
+        '''
+        Retrieves the profiles of a batch of authors. Used by the request
+        coalescer of get_author_info.
+
+        Output
+        authors         Dict with the response of each author id.
+        '''
+
+        par = {'apikey': self.apikey, 
+               'author_id' : ','.join(author_ids),
+               'httpAccept' : 'application/json',
+               'view' : 'ENHANCED'}
+
+        r, js = self.call_batch('author', self.uri_author, par)
+        
+        # Something went wrong
+        if js is None or 'service-error' in js:
+            print('Last response headers.')
+            print(r.headers)
+            raise FetchError('Author retrieval failed.')
+
+        response_list = js['author-retrieval-response-list'] \
+                          ['author-retrieval-response']
+        return {entry['coredata']['dc:identifier'][10:] : entry \
+                    for entry in response_list}
+
+    def get_author_info(self, author_ids, force_reload=False, refresh=False,
+                        refresh_budget=None, refresh_priority='stalest',
+                        condition=None):
         '''
         Retrieves detailed information about authors with given author ids from
         Scopus and collects information in a dataframe.
@@ -649,6 +1579,16 @@ class Scopus(object):
         Input
         author_ids      List of eids to be queried.
         force_reload    If True, cache is ignored
+        refresh         If True, cached entries older than ttl['author_info']
+                        are re-fetched.
+        refresh_budget  Maximum number of stale entries to re-fetch.
+        refresh_priority
+                        'stalest' re-fetches the oldest entries first, 'cited'
+                        the most cited authors first.
+        condition       If given, only authors satisfying the condition are
+                        returned, see scopuscite.filters.select. It is applied
+                        to each batch as it arrives, so discarded authors are
+                        never collected.
 
         Output
         authors         Dataframe with the information
@@ -658,24 +1598,38 @@ class Scopus(object):
 
         author_id_list = list(author_ids)
         author_id_list_new = []
-        author_list = []
+        columns = AuthorColumns()
 
         # Load cache file
         print('Loading cache file.')
-        self.load_author_info_cache()
-        print('Cache size: {}' \
-                .format(naturalsize(sys.getsizeof(self.cache_author_info, 0))))
+        with self.tracer.span('cache_load'), \
+                self.metrics.timer('cache_load_time', cache='author_info'):
+            self.load_author_info_cache()
+        cache_memory = self.cache_memory(self.cache_author_info, 'author_info')
+        if cache_memory is not None:
+            print('Cache size: {}'.format(
+                humanize.naturalsize(cache_memory)))
+
+        # Select stale cache entries that will be re-fetched
+        stale = set()
+        if refresh and not force_reload:
+            score = author_info_score if refresh_priority == 'cited' else None
+            stale = set(stale_keys(self.cache_author_info, author_id_list,
+                                   self.ttl.get('author_info'),
+                                   refresh_budget, score))
+            print('Stale entries to refresh: {}'.format(len(stale)))
         
         # Load those that have already been cached
+        span = self.tracer.start('cache_read')
+        decode_start = time.perf_counter()
         if not force_reload:
             num_read_cache = 0
             for author_id in author_id_list:
-                if author_id in self.cache_author_info:
-                    entry = self.cache_author_info[author_id]
-                    author = self.decode_author_response(entry)
-                    if author is not None:
-                        author_list.append(author)
-                        
+                if author_id in self.cache_author_info and \
+                    author_id not in stale:
+                    columns.append(unpack(
+                        entry_value(self.cache_author_info[author_id])))
+
                     num_read_cache += 1
                     if num_read_cache % 100 == 0:
                         print('Read from cache: {}'.format(num_read_cache))
@@ -685,73 +1639,84 @@ class Scopus(object):
         else:
             author_id_list_new = author_id_list
             print('Ignoring cache, reloading all data.')
+        self.filter_authors(columns, condition)
+        self.metrics.observe('decode_time', time.perf_counter() - decode_start,
+                             TIMING_BUCKETS, cache='author_info',
+                             source='cache')
+        self.tracer.finish(span, items=len(columns))
         
-        par = {'apikey': self.apikey, 
-               'author_id' : '',
-               'httpAccept' : 'application/json',
-               'view' : 'ENHANCED'}
-        r = None
+        self.metrics.increment('cache_hits',
+            len(author_id_list) - len(author_id_list_new), cache='author_info')
+        self.metrics.increment('cache_misses', len(author_id_list_new),
+                               cache='author_info')
 
         print('To be read from Scopus: {}'.format(len(author_id_list_new)))
 
-        chunk_size = 25 # Limit set by Scopus API
-        num_chunks = math.ceil(len(author_id_list_new) / chunk_size)
-        
-        for idx, chunk in enumerate(chunks(author_id_list_new, chunk_size)):
-            print('Chunk {} / {}.'.format(idx+1, num_chunks))
-            par['author_id'] = ','.join(chunk)
-            
-
-            r = requests.get(URI_AUTHOR, params=par)
-            js = r.json()
-            
-            # Something went wrong
-            if 'service-error' in js:
+        coalescer = self.coalescer('author', self._fetch_author_info,
+                                   self.batch_sizes['author'])
+
+        # The chunk size adapts to the latency of the calls
+        pos = 0
+        idx = 0
+        span = self.tracer.start('fetch')
+        while pos < len(author_id_list_new):
+            idx += 1
+            chunk_size = self.batch_sizes['author'].value
+            chunk = author_id_list_new[pos:pos+chunk_size]
+            pos += chunk_size
+            print('Retrieved {} / {}.'.format(pos - len(chunk),
+                                              len(author_id_list_new)))
+
+            try:
+                found = coalescer.get(chunk)
+            except FetchError:
                 print('Something went wrong when calling Scopus API.')
-                print('Last response headers.')
-                print(r.headers)
                 break
-            
-            response_list = js['author-retrieval-response-list'] \
-                              ['author-retrieval-response']
                 
-            for entry in response_list:
+            start = len(columns)
+            for author_id in chunk:
+                entry = found[author_id]
+                if entry is None:
+                    continue
+
                 # Save result to cache
-                author_id = entry['coredata']['dc:identifier'][10:]
-                self.cache_author_info[author_id] = entry
+                self.cache_author_info[author_id] = make_entry(pack(
+                    project(entry, self.author_info_fields), self.codec))
+                stale.discard(author_id)
     
                 # Decode result
-                author = self.decode_author_response(entry)
-                if author is not None:
-                    author_list.append(author)
+                columns.append(entry)
+            self.filter_authors(columns, condition, start)
 
-            if (idx+1) % 20 == 0:
+            if idx % 20 == 0:
                 print('Saving cache file.')
                 self.save_author_info_cache()
 
+        self.tracer.finish(span, items=len(author_id_list_new))
+
+        # Keep stale entries that could not be refreshed
+        start = len(columns)
+        for author_id in stale:
+            columns.append(unpack(
+                entry_value(self.cache_author_info[author_id])))
+        self.filter_authors(columns, condition, start)
+
         print('Saving cache file.')
-        self.save_author_info_cache()
+        with self.tracer.span('cache_save'), \
+                self.metrics.timer('cache_save_time', cache='author_info'):
+            self.save_author_info_cache()
 
-        if r is not None:
-            print('Api call remaining: {} / {}' \
-                    .format(r.headers['X-RateLimit-Remaining'],
-                            r.headers['X-RateLimit-Limit']))
-        else:
+        if not author_id_list_new:
             print('Scopus api was not called.')
+        elif self.quota_remaining is not None:
+            print('Api call remaining: {} / {}' \
+                    .format(self.quota_remaining, self.quota_limit))
         
-        authors = pd.DataFrame(author_list)
-        
-        int_cols = ['npubs', 'ncites', 'ncited_by', 'ncoauthors',
-                    'hindex', 'first_pub', 'last_pub']
-        for col in int_cols:
-            authors[col] = pd.to_numeric(authors[col], errors='coerce') \
-                            .fillna(0).astype(np.int64)
-        
-        authors.set_index('author_id', inplace=True)
-
-        authors = authors.reindex(['name', 'first_name', 'last_name', 
-            'affiliation', 'first_pub', 'last_pub', 'npubs', 'ncites', 
-            'ncited_by', 'ncoauthors', 'hindex'], axis=1)
+        decode_start = time.perf_counter()
+        authors = columns.frame()
+        self.metrics.observe('decode_time', time.perf_counter() - decode_start,
+                             TIMING_BUCKETS, cache='author_info',
+                             source='dataframe')
 
         print('Author info retrieved.')
         print('')
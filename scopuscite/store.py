@@ -0,0 +1,380 @@
+"""Cache store shared between all cache names.
+
+The store keeps the cache entries of all projects in one place, keyed only by
+the entity id (author id, scopus id, search query), so that an entity fetched
+for one project is never fetched again for another one. Each cache name gets
+a view on the store, which records the keys used by that project.
+
+Entries are distributed over a fixed number of shard files per cache kind.
+Only recently used shards are kept in memory and cold entries are evicted
+from disk once the store exceeds its disk budget.
+
+Several processes can share a store. Shard and view files are written under a
+file lock, merging the entries written by other processes, and a lookup that
+misses reloads the shard if another process has changed it since.
+"""
+
+import collections
+import os
+import pickle
+import socket
+import time
+import zlib
+
+from scopuscite.cache import file_lock, file_stamp, merge_entries
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+KINDS = ('search_query', 'author_pub', 'pub_info', 'author_info')
+
+# Access times are only updated if they are older than this (in seconds), to
+# avoid rewriting shards that are only read.
+ACCESS_RESOLUTION = 60 * 60
+
+class SharedStore(object):
+    """Sharded on-disk store for cache entries with LRU eviction.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the store.
+    num_shards : int, optional
+        Number of shard files per cache kind.
+    memory_budget : int, optional
+        Approximate number of bytes of shards kept in memory. If ``None``
+        shards are never unloaded.
+    disk_budget : int, optional
+        Maximum size in bytes of the store on disk. If exceeded, the least
+        recently used entries are evicted on ``flush``. If ``None``, entries
+        are never evicted.
+    """
+
+    def __init__(self, store_dir, num_shards=256, memory_budget=None,
+                 disk_budget=None):
+        self.store_dir = store_dir
+        self.num_shards = num_shards
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+
+        # Loaded shards in LRU order, (kind, shard) -> {'entries', 'access'}
+        self._shards = collections.OrderedDict()
+        self._sizes = {}
+        self._stamps = {}
+        self._dirty = set()
+        self._views = {}
+        # Sizes of the shard files, listed on first use of disk_size
+        self._disk_sizes = None
+        self._disk_total = 0
+
+        for kind in KINDS:
+            os.makedirs(os.path.join(store_dir, kind), exist_ok=True)
+        os.makedirs(os.path.join(store_dir, 'views'), exist_ok=True)
+
+    def view(self, kind, cache_name=None):
+        '''Returns the view of a project on one of the caches.'''
+        if (kind, cache_name) not in self._views:
+            self._views[(kind, cache_name)] = StoreView(self, kind, cache_name)
+        return self._views[(kind, cache_name)]
+
+    def shard_id(self, key):
+        '''Shard in which a key is stored.'''
+        return zlib.crc32(repr(key).encode('utf-8')) % self.num_shards
+
+    def shard_file(self, kind, shard):
+        return os.path.join(self.store_dir, kind, 'shard_{:04d}.pkl' \
+                                                    .format(shard))
+
+    def _read_shard(self, kind, shard):
+        filename = self.shard_file(kind, shard)
+        stamp = file_stamp(filename)
+        if stamp is not None:
+            with open(filename, 'rb') as fp:
+                data = pickle.load(fp)
+            size = stamp[1]
+        else:
+            data = {'entries' : {}, 'access' : {}}
+            size = 0
+        self._stamps[(kind, shard)] = stamp
+        return data, size
+
+    def _merge_shard(self, data, other):
+        merge_entries(data['entries'], other['entries'])
+        for key, access in other['access'].items():
+            if access > data['access'].get(key, 0.):
+                data['access'][key] = access
+
+    def _write_shard(self, kind, shard, data):
+        filename = self.shard_file(kind, shard)
+        with file_lock(filename):
+            # Merge entries written by other processes
+            stamp = file_stamp(filename)
+            if stamp is not None and stamp != self._stamps.get((kind, shard)):
+                with open(filename, 'rb') as fp:
+                    self._merge_shard(data, pickle.load(fp))
+
+            tmp_filename = '{}.{}.{}.tmp'.format(filename,
+                socket.gethostname(), os.getpid())
+            with open(tmp_filename, 'wb') as fp:
+                pickle.dump(data, fp, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_filename, filename)
+            stamp = file_stamp(filename)
+        self._stamps[(kind, shard)] = stamp
+        if self._disk_sizes is not None:
+            self._disk_total += stamp[1] - \
+                                self._disk_sizes.get((kind, shard), 0)
+            self._disk_sizes[(kind, shard)] = stamp[1]
+        return stamp[1]
+
+    def _shard(self, kind, key):
+        '''Returns a loaded shard, loading it from disk if necessary.'''
+        shard_key = (kind, self.shard_id(key))
+        if shard_key in self._shards:
+            self._shards.move_to_end(shard_key)
+        else:
+            data, size = self._read_shard(*shard_key)
+            self._shards[shard_key] = data
+            self._sizes[shard_key] = size
+            self._unload_cold_shards()
+        return shard_key, self._shards[shard_key]
+
+    def _unload_cold_shards(self):
+        '''Unloads least recently used shards until within memory budget.'''
+        if self.memory_budget is None:
+            return
+        while len(self._shards) > 1 and \
+                sum(self._sizes.values()) > self.memory_budget:
+            shard_key, data = self._shards.popitem(last=False)
+            if shard_key in self._dirty:
+                self._write_shard(shard_key[0], shard_key[1], data)
+                self._dirty.discard(shard_key)
+            del self._sizes[shard_key]
+            del self._stamps[shard_key]
+
+    def memory_size(self, kind=None):
+        '''Approximate size in bytes of the loaded shards, of one kind or of
+        all kinds.'''
+        return sum(size for shard_key, size in self._sizes.items() \
+                    if kind is None or shard_key[0] == kind)
+
+    def contains(self, kind, key):
+        shard_key, data = self._shard(kind, key)
+        if key not in data['entries']:
+            # The entry might have been added by another process
+            filename = self.shard_file(*shard_key)
+            if file_stamp(filename) != self._stamps.get(shard_key):
+                other, _ = self._read_shard(*shard_key)
+                self._merge_shard(data, other)
+        return key in data['entries']
+
+    def get(self, kind, key):
+        shard_key, data = self._shard(kind, key)
+        entry = data['entries'][key]
+        now = time.time()
+        if now - data['access'].get(key, 0.) > ACCESS_RESOLUTION:
+            data['access'][key] = now
+            self._dirty.add(shard_key)
+        return entry
+
+    def put(self, kind, key, entry):
+        shard_key, data = self._shard(kind, key)
+        data['entries'][key] = entry
+        data['access'][key] = time.time()
+        self._dirty.add(shard_key)
+        self._sizes[shard_key] += len(pickle.dumps((key, entry),
+                                                   pickle.HIGHEST_PROTOCOL))
+        self._unload_cold_shards()
+
+    def delete(self, kind, key):
+        shard_key, data = self._shard(kind, key)
+        del data['entries'][key]
+        data['access'].pop(key, None)
+        self._dirty.add(shard_key)
+        for view in self._views.values():
+            if view.kind == kind:
+                view.forget(key)
+
+    def flush(self):
+        '''Writes modified shards and views to disk and enforces the disk
+        budget.'''
+        for shard_key in list(self._dirty):
+            self._sizes[shard_key] = self._write_shard(
+                shard_key[0], shard_key[1], self._shards[shard_key])
+        self._dirty.clear()
+
+        for view in self._views.values():
+            view.save()
+
+        if self.disk_budget is not None and \
+                self.disk_size() > self.disk_budget:
+            self.evict()
+
+    def _scan_disk(self):
+        '''Lists the sizes of all shard files.'''
+        self._disk_sizes = {}
+        for kind in KINDS:
+            for shard in range(self.num_shards):
+                stamp = file_stamp(self.shard_file(kind, shard))
+                if stamp is not None:
+                    self._disk_sizes[(kind, shard)] = stamp[1]
+        self._disk_total = sum(self._disk_sizes.values())
+
+    def disk_size(self):
+        '''Size of all shard files in bytes. The files are listed once, then
+        the size is updated whenever a shard is written. Shards written by
+        other processes are only counted after the next ``evict``.'''
+        if self._disk_sizes is None:
+            self._scan_disk()
+        return self._disk_total
+
+    def evict(self, target=None):
+        '''Evicts least recently used entries until the store is smaller than
+        ``target`` bytes, by default 90% of the disk budget.'''
+
+        if target is None:
+            target = 0.9 * self.disk_budget
+        self._scan_disk()
+
+        # Collect access times and sizes of all entries
+        entries = []
+        for kind in KINDS:
+            for shard in range(self.num_shards):
+                if (kind, shard) in self._shards:
+                    data = self._shards[(kind, shard)]
+                elif os.path.exists(self.shard_file(kind, shard)):
+                    data, _ = self._read_shard(kind, shard)
+                else:
+                    continue
+                for key, entry in data['entries'].items():
+                    access = data['access'].get(key, 0.)
+                    size = len(pickle.dumps((key, entry, access),
+                                            pickle.HIGHEST_PROTOCOL))
+                    entries.append((access, size, kind, key))
+        entries.sort(key=lambda x : x[0])
+
+        # Entry sizes are only estimates, so we check the size on disk after
+        # each round of evictions.
+        num_evicted = 0
+        evicted = {kind : set() for kind in KINDS}
+        excess = self.disk_size() - target
+        while excess > 0 and num_evicted < len(entries):
+            while excess > 0 and num_evicted < len(entries):
+                _, size, kind, key = entries[num_evicted]
+                self.delete(kind, key)
+                evicted[kind].add(key)
+                excess -= size
+                num_evicted += 1
+
+            for shard_key in list(self._dirty):
+                self._sizes[shard_key] = self._write_shard(
+                    shard_key[0], shard_key[1], self._shards[shard_key])
+            self._dirty.clear()
+            excess = self.disk_size() - target
+
+        # Remove the evicted keys from the views that are not loaded
+        loaded = {view.filename for view in self._views.values()}
+        for filename in os.listdir(os.path.join(self.store_dir, 'views')):
+            filename = os.path.join(self.store_dir, 'views', filename)
+            if filename in loaded or not filename.endswith('.pkl'):
+                continue
+            for kind in KINDS:
+                if filename.endswith('_{}.pkl'.format(kind)) and evicted[kind]:
+                    update_view_file(filename, set(), evicted[kind])
+        for view in self._views.values():
+            view.save()
+
+        print('Evicted {} entries from store.'.format(num_evicted))
+
+    def import_cache(self, kind, cache, cache_name=None):
+        '''Adds the entries of a cache dict, e.g. a legacy pickle file, to the
+        store and to the view of ``cache_name``.'''
+        self.view(kind, cache_name).update(cache)
+        self.flush()
+
+def update_view_file(filename, added, removed):
+    '''Adds and removes keys of a view file under a file lock, keeping the
+    keys added by other processes. Returns the keys in the file.'''
+    with file_lock(filename):
+        keys = set()
+        if os.path.exists(filename):
+            with open(filename, 'rb') as fp:
+                keys = pickle.load(fp)
+        keys = (keys - removed) | added
+        tmp_filename = '{}.{}.{}.tmp'.format(filename,
+            socket.gethostname(), os.getpid())
+        with open(tmp_filename, 'wb') as fp:
+            pickle.dump(keys, fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, filename)
+    return keys
+
+class StoreView(MutableMapping):
+    """Dict-like view of one project on a cache of the shared store.
+
+    Lookups see all entries in the store, so that entries fetched by other
+    projects are reused. Iteration and ``len`` only cover the keys that were
+    read or written through this view and are answered from the key set of
+    the view, without loading shards. Keys evicted from the store are
+    removed from all views.
+    """
+
+    def __init__(self, store, kind, cache_name=None):
+        self.store = store
+        self.kind = kind
+        self.cache_name = cache_name
+        self.filename = os.path.join(store.store_dir, 'views',
+            '{}_{}.pkl'.format(cache_name, kind))
+
+        if os.path.exists(self.filename):
+            with open(self.filename, 'rb') as fp:
+                self.keys_used = pickle.load(fp)
+        else:
+            self.keys_used = set()
+        # Changes since the view file was last read or written
+        self._added = set()
+        self._removed = set()
+
+    def _use(self, key):
+        if key not in self.keys_used:
+            self.keys_used.add(key)
+            self._added.add(key)
+            self._removed.discard(key)
+
+    def forget(self, key):
+        '''Removes a key deleted from the store from the view.'''
+        if key in self.keys_used:
+            self.keys_used.discard(key)
+            self._removed.add(key)
+            self._added.discard(key)
+
+    def save(self):
+        if not self._added and not self._removed:
+            return
+        # Keep keys added and drop keys evicted by other processes
+        self.keys_used = update_view_file(self.filename, self._added,
+                                          self._removed)
+        self._added = set()
+        self._removed = set()
+
+    def __contains__(self, key):
+        return self.store.contains(self.kind, key)
+
+    def __getitem__(self, key):
+        entry = self.store.get(self.kind, key)
+        self._use(key)
+        return entry
+
+    def __setitem__(self, key, entry):
+        self.store.put(self.kind, key, entry)
+        self._use(key)
+
+    def __delitem__(self, key):
+        self.store.delete(self.kind, key)
+        self.forget(key)
+
+    def __iter__(self):
+        return iter(list(self.keys_used))
+
+    def __len__(self):
+        return len(self.keys_used)
@@ -0,0 +1,202 @@
+"""Tracing of the stages of a download.
+
+A Tracer records spans: named, possibly nested, sections of a run with their
+wall and CPU time, number of processed items and change in resident memory.
+Optionally the top-level spans (the stages of a run) are profiled with
+cProfile or tracemalloc. At the end of a run ``report`` prints a summary.
+
+Example
+-------
+>>> tracer = Tracer(profile='cprofile')
+>>> with tracer.span('author_info') as span:
+...     authors = scopus.get_author_info(author_ids)
+...     span.items = len(authors)
+>>> tracer.report()
+"""
+
+import contextlib
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from scopuscite.metrics import TIMING_BUCKETS
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def current_rss():
+    '''Resident set size of the process in bytes, None if unknown.'''
+    try:
+        with open('/proc/self/statm', 'r') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # Peak instead of current usage, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+class Span(object):
+    """Section of a run recorded by a Tracer."""
+
+    def __init__(self, name, path, depth, attrs):
+        self.name = name
+        self.path = path
+        self.depth = depth
+        self.attrs = attrs
+        self.items = None
+        self.wall = None
+        self.cpu = None
+        self.rss_delta = None
+        self.profile = None
+
+    def to_dict(self):
+        return {'name' : self.name, 'path' : self.path, 'depth' : self.depth,
+                'wall' : self.wall, 'cpu' : self.cpu, 'items' : self.items,
+                'rss_delta' : self.rss_delta, 'attrs' : self.attrs}
+
+class Tracer(object):
+    """Records spans of a run.
+
+    Parameters
+    ----------
+    enabled : bool
+        If ``False`` spans are not recorded and cost almost nothing.
+    profile : str, optional
+        ``'cprofile'`` or ``'tracemalloc'`` to profile the top-level spans.
+    profile_dir : str, optional
+        If given, cProfile statistics of each profiled span are saved there
+        as ``<name>.prof``.
+    metrics : Metrics, optional
+        If given, the wall time of each span is observed as ``stage_time``.
+    """
+
+    def __init__(self, enabled=True, profile=None, profile_dir=None,
+                 metrics=None):
+        if profile not in {None, 'cprofile', 'tracemalloc'}:
+            raise ValueError('Unknown profiler {}.'.format(profile))
+        self.enabled = enabled
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.metrics = metrics
+        self.spans = []
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def start(self, name, **attrs):
+        '''Starts a span. Prefer the ``span`` context manager if possible.'''
+        if not self.enabled:
+            return None
+
+        stack = self._stack()
+        path = '/'.join([s.name for s in stack] + [name])
+        span = Span(name, path, len(stack), attrs)
+        stack.append(span)
+        self.spans.append(span)
+
+        if self.profile is not None and span.depth == 0:
+            if self.profile == 'cprofile':
+                import cProfile
+                span.profile = cProfile.Profile()
+                span.profile.enable()
+            else:
+                tracemalloc.start()
+                span.profile = tracemalloc.take_snapshot()
+
+        span._rss = current_rss()
+        span._cpu = time.process_time()
+        span._wall = time.perf_counter()
+        return span
+
+    def finish(self, span, items=None):
+        '''Ends a span started with ``start``.'''
+        if span is None:
+            return
+
+        span.wall = time.perf_counter() - span._wall
+        span.cpu = time.process_time() - span._cpu
+        rss = current_rss()
+        if rss is not None and span._rss is not None:
+            span.rss_delta = rss - span._rss
+        if items is not None:
+            span.items = items
+
+        if span.profile is not None:
+            if self.profile == 'cprofile':
+                span.profile.disable()
+                if self.profile_dir is not None:
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    span.profile.dump_stats(os.path.join(self.profile_dir,
+                        span.name + '.prof'))
+            else:
+                snapshot = tracemalloc.take_snapshot()
+                span.attrs['tracemalloc_peak'] = \
+                    tracemalloc.get_traced_memory()[1]
+                span.profile = snapshot.compare_to(span.profile, 'lineno')
+                tracemalloc.stop()
+
+        stack = self._stack()
+        if span in stack:
+            del stack[stack.index(span):]
+
+        if self.metrics is not None:
+            self.metrics.observe('stage_time', span.wall, TIMING_BUCKETS,
+                                 stage=span.path)
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        '''Records the enclosed block as a span. The number of processed
+        items can be set on the yielded span.'''
+        span = self.start(name, **attrs)
+        try:
+            yield span if span is not None else Span(name, name, 0, attrs)
+        finally:
+            self.finish(span)
+
+    def summary(self):
+        '''List of all recorded spans as dicts.'''
+        return [span.to_dict() for span in self.spans]
+
+    def report(self, top=10):
+        '''Prints the recorded spans and the profiles of the stages.'''
+        if not self.enabled:
+            return
+
+        print('Trace summary')
+        print('  {:40s} {:>10s} {:>10s} {:>10s} {:>12s}'.format(
+            'span', 'wall [s]', 'cpu [s]', 'items', 'rss delta'))
+        for span in self.spans:
+            if span.wall is None:
+                continue
+            name = '  ' * span.depth + span.name
+            items = '' if span.items is None else str(span.items)
+            rss = '' if span.rss_delta is None else \
+                    '{:.1f} MB'.format(span.rss_delta / 2**20)
+            print('  {:40s} {:10.3f} {:10.3f} {:>10s} {:>12s}'.format(
+                name, span.wall, span.cpu, items, rss))
+        print('')
+
+        for span in self.spans:
+            if span.profile is None or span.wall is None:
+                continue
+            print('Profile of {}'.format(span.name))
+            if self.profile == 'cprofile':
+                out = io.StringIO()
+                pstats.Stats(span.profile, stream=out) \
+                    .sort_stats('cumulative').print_stats(top)
+                print(out.getvalue())
+            else:
+                print('Peak traced memory: {:.1f} MB'.format(
+                    span.attrs['tracemalloc_peak'] / 2**20))
+                for stat in span.profile[:top]:
+                    print(stat)
+                print('')
@@ -0,0 +1,110 @@
+"""Transports to record and replay the HTTP traffic of the Scopus object.
+
+A transport is any object with a method ``get(url, params)`` returning a
+response with attributes ``status_code``, ``headers`` and ``content``,
+for example a ``requests.Session``. Recordings are stored as json lines, one
+request per line, with the API key removed from the parameters.
+"""
+
+import json
+import threading
+from urllib.parse import urlsplit
+
+def request_key(url, params):
+    '''Key identifying a request independently of host and API key.'''
+    params = {k : str(v) for k, v in params.items() if k != 'apikey'}
+    return urlsplit(url).path + '?' + json.dumps(params, sort_keys=True)
+
+class ReplayResponse(object):
+    """Response object returned by ReplayTransport."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def __repr__(self):
+        return '<Response [{}]>'.format(self.status_code)
+
+class RecordingTransport(object):
+    """Sends requests with another transport and records the responses.
+
+    Parameters
+    ----------
+    filename : str
+        Recording file, responses are appended to it.
+    transport : object, optional
+        Transport used to send the requests, by default a new
+        ``requests.Session``.
+    """
+
+    def __init__(self, filename, transport=None):
+        if transport is None:
+            import requests
+            transport = requests.Session()
+        self.filename = filename
+        self.transport = transport
+        self._lock = threading.Lock()
+
+    def get(self, url, params):
+        r = self.transport.get(url, params=params)
+        record = {'key' : request_key(url, params),
+                  'status' : r.status_code,
+                  'headers' : dict(r.headers),
+                  'body' : r.content.decode('utf-8')}
+        with self._lock:
+            with open(self.filename, 'a') as fp:
+                fp.write(json.dumps(record) + '\n')
+        return r
+
+class ReplayTransport(object):
+    """Answers requests from a recording without using the network.
+
+    If the same request was recorded several times, the recorded responses
+    are returned in order, repeating the last one.
+
+    Parameters
+    ----------
+    filename : str
+        Recording made with RecordingTransport.
+    strict : bool, optional
+        If ``True``, requests missing from the recording raise a KeyError,
+        otherwise a RESOURCE_NOT_FOUND response is returned.
+    """
+
+    def __init__(self, filename, strict=True):
+        self.strict = strict
+        self.records = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+        with open(filename, 'r') as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self.records.setdefault(record['key'], []).append(record)
+
+    def get(self, url, params):
+        key = request_key(url, params)
+        if key not in self.records:
+            if self.strict:
+                raise KeyError('Request not in recording: {}'.format(key))
+            body = {'service-error' : {'status' : {
+                'statusCode' : 'RESOURCE_NOT_FOUND',
+                'statusText' : 'Request not in recording.'}}}
+            return ReplayResponse(404, {}, json.dumps(body).encode('utf-8'))
+
+        with self._lock:
+            idx = self._calls.get(key, 0)
+            self._calls[key] = idx + 1
+        records = self.records[key]
+        record = records[min(idx, len(records) - 1)]
+        return ReplayResponse(record['status'], record['headers'],
+                              record['body'].encode('utf-8'))
@@ -1,6 +1,33 @@
 import configparser
+import importlib
+import sys
 
-import numpy as np
+class LazyModule(object):
+    """Module that is imported when one of its attributes is first used.
+
+    Used for heavy dependencies such as numpy and pandas, so that commands
+    that only touch the cache or the quota start quickly.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self._name)
+
+def lazy_import(name):
+    '''Returns a module that is only imported when it is first used.'''
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+np = lazy_import('numpy')
 
 def chunks(l, n):
     '''Yields successive n-sized chunks from list l.'''
@@ -40,6 +67,39 @@ def load_api_key():
 
     return config['Authentication']['APIKey']
 
+def deep_sizeof(obj):
+    '''Approximate memory used by an object including its contents.
+
+    Unlike ``sys.getsizeof``, which only counts the outer container, this
+    follows dicts, lists, tuples and sets recursively. Objects referenced
+    several times are counted once.
+
+    Parameters
+    ----------
+    obj : object
+
+    Returns
+    -------
+    int
+        Size in bytes.
+    '''
+
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if id(x) in seen:
+            continue
+        seen.add(id(x))
+        size += sys.getsizeof(x)
+        if isinstance(x, dict):
+            stack.extend(x.keys())
+            stack.extend(x.values())
+        elif isinstance(x, (list, tuple, set, frozenset)):
+            stack.extend(x)
+    return size
+
 def set_union(sets):
     '''Computes the union of sets in an iterator.
 
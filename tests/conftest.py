@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The package and the synthetic data generator are used from the source tree
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scopuscite import utils
+from scopuscite.aggregate import aggregate_author_info, \
+    aggregate_author_info_chunked, author_metrics_by_year
+
+from synthetic import generate_pubs, generate_authors
+
+YEAR_RANGE = (1990, 2020)
+
+@pytest.fixture(scope='module')
+def data():
+    pubs = generate_pubs(300, 60, year_range=YEAR_RANGE, seed=3)
+    rng = np.random.RandomState(3)
+    pcc = rng.randint(0, 5, size=len(pubs))
+    pubs['pcc'] = pcc
+    pubs['ncites'] = pubs['ncites'] + pcc
+
+    # An author listed twice on a paper
+    first = pubs.index[0]
+    pubs.at[first, 'authors'] = pubs.at[first, 'authors'] + \
+                                 pubs.at[first, 'authors'][:1]
+
+    # An author without publications
+    authors = generate_authors(pubs)
+    extra = authors.iloc[:1].copy()
+    extra.index = pd.Index(['6999999999'], name=authors.index.name)
+    authors = pd.concat([authors, extra])
+    return authors, pubs
+
+def author_pubs(authors, pubs):
+    '''Publications of each author, by brute force.'''
+    return {a : pubs[pubs['authors'].map(lambda x : a in x)] \
+                for a in authors.index}
+
+def assert_frames_equal(a, b):
+    assert list(a.columns) == list(b.columns)
+    assert list(a.index) == list(b.index)
+    for col in a.columns:
+        for x, y in zip(a[col], b[col]):
+            if isinstance(x, float) and np.isnan(x):
+                assert isinstance(y, float) and np.isnan(y), col
+            else:
+                assert np.array_equal(np.asarray(x), np.asarray(y)), col
+
+def test_aggregate_author_info(data):
+    authors, pubs = data
+    res = aggregate_author_info(authors, pubs)
+    years = range(*YEAR_RANGE)
+
+    for a, own in author_pubs(authors, pubs).items():
+        row = res.loc[a]
+        assert row['npubs'] == len(own)
+        assert row['ncites'] == own['ncites'].sum()
+        assert row['pcc'] == own['pcc'].sum()
+        assert row['lcc'] == own['lcc'].sum()
+        assert row['hindex'] == utils.hindex(list(own['ncites']))
+        coauthors = utils.set_union(own['authors'])
+        assert row['ncoauthors'] == len(coauthors) - 1
+        assert list(row['pubs_by_year']) == \
+            [int((own['year'] == y).sum()) for y in years]
+        if len(own) == 0:
+            assert np.isnan(row['first_pub']) and np.isnan(row['last_pub'])
+            assert np.isnan(row['ncoauthors_mean'])
+            assert row['cites_by_year'] == 0
+            continue
+        assert row['first_pub'] == own['year'].min()
+        assert row['last_pub'] == own['year'].max()
+        assert np.array_equal(row['cites_by_year'],
+                              np.sum(list(own['cites_by_year']), axis=0))
+        assert row['ncoauthors_mean'] == \
+            pytest.approx((own['authors'].map(len) - 1).mean())
+        acc = [len(utils.set_union(own['authors'][own['year'] <= y])) \
+                for y in years]
+        assert list(row['ncoauthors_acc']) == acc
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+def test_chunked_matches_in_memory(data, chunk_size):
+    authors, pubs = data
+    expected = aggregate_author_info(authors, pubs)
+
+    # Small chunks split the papers of most authors
+    chunks = (pubs.iloc[start:start+chunk_size] \
+                for start in range(0, len(pubs), chunk_size))
+    res = aggregate_author_info_chunked(authors, chunks, YEAR_RANGE)
+    assert_frames_equal(res, expected)
+
+def test_author_metrics_by_year(data):
+    authors, pubs = data
+    years = range(*YEAR_RANGE)
+    metrics = author_metrics_by_year(authors, pubs, years, chunk_size=50)
+
+    for idx, (a, own) in enumerate(author_pubs(authors, pubs).items()):
+        cites = own['pcc'].values[:, np.newaxis] + \
+                np.cumsum(np.stack(list(own['cites_by_year'])), axis=1) \
+                if len(own) > 0 else np.zeros((0, len(years)), dtype=int)
+        for col, year in enumerate(years):
+            published = (own['year'] <= year).values
+            assert metrics['npubs'][idx, col] == published.sum()
+            assert metrics['ncites'][idx, col] == cites[:, col].sum()
+            assert metrics['hindex'][idx, col] == \
+                utils.hindex(list(cites[published, col]))
+
+    res = aggregate_author_info(authors, pubs, time_resolved=True)
+    for col in ['ncites', 'npubs', 'hindex']:
+        assert np.array_equal(np.stack(res[col + '_acc']), metrics[col])
+
+def test_coauthor_graph_counts_joint_publications(data):
+    coauthors = pytest.importorskip('scopuscite.coauthors')
+    pubs = pd.DataFrame({'authors' : [['a', 'b', 'a'], ['a', 'b']],
+                         'year' : [2000, 2001]}, index=['p1', 'p2'])
+    graph = coauthors.build_coauthor_graph(pubs)
+    assert list(graph.neighbours('a').items()) == [('b', 2)]
+
+    _, pubs = data
+    degree = coauthors.build_coauthor_graph(pubs).degree(weighted=True)
+    for a in degree.index:
+        own = pubs[pubs['authors'].map(lambda x : a in x)]
+        assert degree.loc[a] == sum(len(set(x)) - 1 for x in own['authors'])
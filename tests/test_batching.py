@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from scopuscite.batching import AdaptiveSize, RequestCoalescer, FetchError
+
+def test_adaptive_size():
+    size = AdaptiveSize(10, maximum=25, step=5, target_latency=1.)
+    size.success(0.1)
+    assert size.value == 15
+    for _ in range(5):
+        size.success(0.1)
+    assert size.value == 25
+    size.success(2.)
+    assert size.value == 12
+    for _ in range(10):
+        size.failure()
+    assert size.value == 1
+
+class RecordingFetch(object):
+    """Fetch function recording its batches."""
+
+    def __init__(self, missing=(), release=None):
+        self.batches = []
+        self.missing = set(missing)
+        self.release = release
+        self.started = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self, ids):
+        with self.lock:
+            self.batches.append(list(ids))
+        self.started.set()
+        if self.release is not None:
+            self.release.wait()
+        return {i : 'r' + i for i in ids if i not in self.missing}
+
+def test_batches_and_results():
+    fetch = RecordingFetch(missing=['5'])
+    coalescer = RequestCoalescer(fetch, 25, max_wait=0.)
+    ids = [str(i) for i in range(60)]
+    res = coalescer.get(ids + ids[:3])
+    assert [len(b) for b in fetch.batches] == [25, 25, 10]
+    assert res['5'] is None
+    assert all(res[i] == 'r' + i for i in ids if i != '5')
+
+def test_concurrent_callers_share_batches():
+    release = threading.Event()
+    fetch = RecordingFetch(release=release)
+    coalescer = RequestCoalescer(fetch, 10, max_wait=0.01)
+    ids = [str(i) for i in range(10)]
+    results = {}
+
+    def get(name):
+        results[name] = coalescer.get(ids)
+
+    first = threading.Thread(target=get, args=('first',))
+    first.start()
+    assert fetch.started.wait(5.)
+
+    # The ids of the second caller are already being fetched
+    second = threading.Thread(target=get, args=('second',))
+    second.start()
+    deadline = time.monotonic() + 5.
+    while coalescer.num_deduplicated < len(ids) and \
+            time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    first.join()
+    second.join()
+
+    assert fetch.batches == [ids]
+    assert coalescer.num_deduplicated == len(ids)
+    assert results['first'] == results['second'] == \
+        {i : 'r' + i for i in ids}
+
+def test_many_threads():
+    fetch = RecordingFetch()
+    size = AdaptiveSize(7, maximum=10)
+    coalescer = RequestCoalescer(fetch, size, max_wait=0.01)
+    requests = [[str(i) for i in range(t, 200, 3)] for t in range(6)]
+    results = [None] * len(requests)
+
+    def get(idx):
+        results[idx] = coalescer.get(requests[idx])
+
+    threads = [threading.Thread(target=get, args=(idx,))
+               for idx in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for ids, res in zip(requests, results):
+        assert res == {i : 'r' + i for i in ids}
+    assert all(len(batch) <= 10 for batch in fetch.batches)
+    fetched = sum(len(batch) for batch in fetch.batches)
+    assert fetched + coalescer.num_deduplicated == \
+        sum(len(ids) for ids in requests)
+
+def test_fetch_error_is_raised_to_callers():
+    def fetch(ids):
+        raise FetchError('failed')
+
+    coalescer = RequestCoalescer(fetch, 5, max_wait=0.)
+    with pytest.raises(FetchError):
+        coalescer.get(['1', '2'])
+    # Failed ids can be requested again
+    with pytest.raises(FetchError):
+        coalescer.get(['1'])
@@ -0,0 +1,52 @@
+import multiprocessing
+import threading
+
+from scopuscite.cache import make_entry, entry_time, entry_value, \
+    load_cache, save_cache
+
+def test_save_merges_newer_entries(tmp_path):
+    filename = str(tmp_path / 'cache.pkl')
+    cache_a, stamp_a = load_cache(filename)
+    cache_b, stamp_b = load_cache(filename)
+
+    cache_a['x'] = make_entry('a', 1.)
+    cache_a['y'] = make_entry('a', 5.)
+    save_cache(filename, cache_a, stamp_a)
+
+    # b was loaded before a saved, so the file is merged in
+    cache_b['y'] = make_entry('b', 3.)
+    cache_b['z'] = make_entry('b', 3.)
+    save_cache(filename, cache_b, stamp_b)
+
+    cache, _ = load_cache(filename)
+    assert sorted(cache) == ['x', 'y', 'z']
+    assert entry_value(cache['y']) == 'a' and entry_time(cache['y']) == 5.
+    assert cache == cache_b
+
+def _add_entries(args):
+    filename, worker, num_keys = args
+    cache, stamp = load_cache(filename)
+    for idx in range(num_keys):
+        cache['{}_{}'.format(worker, idx)] = make_entry(idx)
+        if idx % 5 == 0:
+            stamp = save_cache(filename, cache, stamp)
+    save_cache(filename, cache, stamp)
+
+def test_concurrent_processes(tmp_path):
+    filename = str(tmp_path / 'cache.pkl')
+    context = multiprocessing.get_context('fork')
+    with context.Pool(4) as pool:
+        pool.map(_add_entries, [(filename, w, 30) for w in range(4)])
+    cache, _ = load_cache(filename)
+    assert len(cache) == 4 * 30
+
+def test_concurrent_threads(tmp_path):
+    filename = str(tmp_path / 'cache.pkl')
+    threads = [threading.Thread(target=_add_entries, args=((filename, w, 30),))
+               for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache, _ = load_cache(filename)
+    assert len(cache) == 4 * 30
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from scopuscite.dataset import Dataset, write_dataset
+
+def test_extension_dtypes(tmp_path):
+    index = pd.Index(['10', '11', '12'], name='scopus_id')
+    df = pd.DataFrame({
+        'title' : pd.array(['a', None, 'c'], dtype='string'),
+        'count' : pd.array([1, None, 3], dtype='Int64'),
+        'journal' : pd.Categorical(['x', 'y', 'x']),
+        'year' : [2000, 2001, 2002],
+        'authors' : [['1', '2'], ['3'], []]}, index=index)
+    write_dataset(str(tmp_path / 'pubs'), df)
+
+    res = Dataset(str(tmp_path / 'pubs')).to_frame()
+    assert list(res.index) == list(index)
+    assert list(res['title']) == ['a', '', 'c']
+    assert np.array_equal(res['count'], [1., np.nan, 3.], equal_nan=True)
+    assert list(res['journal']) == ['x', 'y', 'x']
+    assert list(res['year']) == [2000, 2001, 2002]
+    assert list(res['authors']) == [['1', '2'], ['3'], []]
@@ -0,0 +1,63 @@
+import os
+
+import pandas as pd
+import pytest
+
+from scopuscite.download_data import download_batch, \
+    download_journal_year_data
+from scopuscite.mock_server import MockScopusServer, SyntheticWorld
+
+@pytest.fixture
+def server():
+    with MockScopusServer(world=SyntheticWorld(200, 1000)) as server:
+        yield server
+
+@pytest.fixture
+def batch_params(tmp_path, monkeypatch, server):
+    # The api key is read from .config in the working directory
+    monkeypatch.chdir(tmp_path)
+    with open('.config', 'w') as fp:
+        fp.write('[Authentication]\nAPIKey = key\nInstToken = token\n')
+    return {'year_range' : (1960, 2020), 'cite_type' : 'all',
+            'cache_dir' : str(tmp_path / 'cache'),
+            'base_url' : server.url, 'operation_name' : 'merged'}
+
+def test_download_batch(tmp_path, batch_params):
+    jobs = [('Annals of Mathematics', '0003486X', 2016),
+            ('Nature Physics', '17452473', 2017, 'nphys')]
+    output_dir = str(tmp_path / 'output')
+    download_batch(jobs, output_dir, batch_params)
+
+    merged = pd.read_pickle(os.path.join(output_dir, 'merged_auth.pkl'))
+    pubs = pd.read_pickle(os.path.join(output_dir, 'merged_pubs.pkl'))
+    assert len(merged) > 0 and len(pubs) > 0
+    assert (merged['ncites'] == [pubs.loc[pubs['authors'].map(
+        lambda authors : a in authors), 'ncites'].sum()
+        for a in merged.index]).all()
+
+    for name in ['Annals of Mathematics_2016', 'nphys']:
+        job = pd.read_pickle(os.path.join(output_dir, name + '_auth.pkl'))
+        assert set(job.index) <= set(merged.index)
+        assert os.path.isfile(os.path.join(output_dir, name + '_export.csv'))
+
+@pytest.mark.parametrize('cite_type', ['exclude-self',
+                                       ['exclude-self', 'exclude-books']])
+def test_cite_type_without_all(tmp_path, server, batch_params, cite_type):
+    batch_params['cite_type'] = cite_type
+    output_dir = str(tmp_path / 'output')
+    with pytest.raises(ValueError):
+        download_batch([('Annals of Mathematics', '0003486X', 2016)],
+                       output_dir, batch_params)
+    with pytest.raises(ValueError):
+        download_journal_year_data(2016, 'Annals of Mathematics', '0003486X',
+                                   output_dir, batch_params)
+    assert server.num_requests == 0
+
+def test_download_cite_variants(tmp_path, batch_params):
+    batch_params['cite_type'] = ['all', 'exclude-self']
+    output_dir = str(tmp_path / 'output')
+    download_journal_year_data(2016, 'Annals of Mathematics', '0003486X',
+                               output_dir, batch_params)
+    pubs = pd.read_pickle(os.path.join(output_dir, 'merged_pubs.pkl'))
+    assert {'cites_by_year', 'cites_by_year_excl_self',
+            'ncites_excl_self'} <= set(pubs.columns)
@@ -0,0 +1,12 @@
+from scopuscite.metrics import Metrics, TIMING_BUCKETS
+
+def test_timing_quantiles():
+    metrics = Metrics()
+    for value in [1e-5] * 90 + [2e-4] * 10:
+        metrics.observe('decode_time', value, TIMING_BUCKETS)
+    with metrics.timer('load_time'):
+        pass
+    histograms = metrics.snapshot()['histograms']
+    h = histograms['decode_time']
+    assert h['p50'] == 1e-5 and h['p95'] == 2e-4 and h['max'] == 2e-4
+    assert histograms['load_time']['p50'] < 0.005
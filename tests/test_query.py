@@ -0,0 +1,39 @@
+import contextlib
+import io
+
+from scopuscite.cache import make_entry, entry_value, pack, unpack
+from scopuscite.mock_server import MockScopusServer, SyntheticWorld
+from scopuscite.query import QueryIndex, build_index
+from scopuscite.scopus import Scopus
+
+def test_incremental_rebuild(tmp_path):
+    with MockScopusServer(world=SyntheticWorld(50, 200)) as server:
+        scopus = Scopus('key', cache_dir=str(tmp_path),
+                        base_url=server.url)
+        scopus_ids = list(server.world.pubs)[:40]
+        with contextlib.redirect_stdout(io.StringIO()):
+            scopus.get_publication_info(scopus_ids, (1960, 2020))
+            index = QueryIndex(build_index(scopus))
+    pubs = index.publications(scopus_ids)
+    scopus_id = pubs.index[pubs['authors'].map(len) >= 2][0]
+    old_authors = pubs.loc[scopus_id, 'authors']
+    old_author, kept_author = old_authors[0], old_authors[1]
+    assert scopus_id in index.author_publications(old_author).index
+
+    # The publication is re-fetched with another author list
+    key = (scopus_id, (1960, 2020), 'all')
+    cite_info = unpack(entry_value(scopus.cache_pub_info[key]))
+    cite_info['author'] = [a for a in cite_info['author'] \
+                            if a['authid'] != old_author] + \
+                          [{'authid' : '7999999999'}]
+    scopus.cache_pub_info[key] = make_entry(pack(cite_info, scopus.codec))
+    with contextlib.redirect_stdout(io.StringIO()):
+        scopus.save_pub_info_cache()
+        build_index(scopus)
+
+    assert scopus_id not in index.author_publications(old_author).index
+    assert scopus_id in index.author_publications('7999999999').index
+    assert scopus_id in index.author_publications(kept_author).index
+    assert set(index.publication(scopus_id)['authors']) == \
+            set(old_authors) - {old_author} | {'7999999999'}
+    assert '7999999999' in index.coauthors(kept_author)
@@ -0,0 +1,85 @@
+import os
+import pickle
+
+from scopuscite import store as store_module
+from scopuscite.cache import make_entry, entry_value
+from scopuscite.mock_server import MockScopusServer, SyntheticWorld
+from scopuscite.scopus import Scopus
+from scopuscite.store import SharedStore
+
+class Clock(object):
+    """Replaces the time module of the store, one second per call."""
+
+    def __init__(self):
+        self.now = 1000.
+
+    def time(self):
+        self.now += 1.
+        return self.now
+
+def test_second_view_reuses_entries(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    with MockScopusServer(world=SyntheticWorld(50, 200)) as server:
+        def fetch(cache_name):
+            scopus = Scopus('key', cache_name=cache_name,
+                            cache_dir=str(tmp_path / 'cache'),
+                            store=SharedStore(store_dir, num_shards=4),
+                            base_url=server.url)
+            return scopus.get_publication_info(scopus_ids, (1960, 2020))
+
+        scopus_ids = list(server.world.pubs)[:30]
+        pubs_a = fetch('project_a')
+        num_requests = server.num_requests
+        pubs_b = fetch('project_b')
+        assert server.num_requests == num_requests
+        assert list(pubs_a['ncites']) == list(pubs_b['ncites'])
+
+    store = SharedStore(store_dir, num_shards=4)
+    keys = set(store.view('pub_info', 'project_a'))
+    assert len(keys) == 30
+    assert set(store.view('pub_info', 'project_b')) == keys
+
+def fill(store, cache_name, num_keys, monkeypatch):
+    monkeypatch.setattr(store_module, 'time', Clock())
+    view = store.view('pub_info', cache_name)
+    for idx in range(num_keys):
+        view['{:03d}'.format(idx)] = make_entry(os.urandom(1000))
+    return view
+
+def test_eviction_under_disk_budget(tmp_path, monkeypatch):
+    store = SharedStore(str(tmp_path), num_shards=4, disk_budget=50000)
+    view = fill(store, 'project', 100, monkeypatch)
+    store.flush()
+
+    assert store.disk_size() <= 0.9 * store.disk_budget
+    assert SharedStore(str(tmp_path), num_shards=4).disk_size() == \
+            store.disk_size()
+    # The least recently used entries are evicted first
+    kept = sorted(view)
+    assert 0 < len(kept) < 100
+    assert kept == ['{:03d}'.format(idx) for idx in range(100 - len(kept),
+                                                           100)]
+    assert all(len(entry_value(view[key])) == 1000 for key in kept)
+
+def test_eviction_updates_views(tmp_path, monkeypatch):
+    other = SharedStore(str(tmp_path), num_shards=4)
+    fill(other, 'unloaded', 20, monkeypatch)
+    other.flush()
+
+    store = SharedStore(str(tmp_path), num_shards=4)
+    # Reading a key adds it to the view
+    loaded = store.view('pub_info', 'loaded')
+    for idx in range(10, 20):
+        assert entry_value(loaded['{:03d}'.format(idx)]) is not None
+    store.evict(target=store.disk_size() // 2)
+
+    remaining = {key for key in ['{:03d}'.format(idx) for idx in range(20)]
+                 if store.contains('pub_info', key)}
+    assert 0 < len(remaining) < 20
+    assert set(loaded) == remaining & {'{:03d}'.format(idx) \
+                                        for idx in range(10, 20)}
+    with open(os.path.join(str(tmp_path), 'views',
+                           'unloaded_pub_info.pkl'), 'rb') as fp:
+        assert pickle.load(fp) == remaining
+    assert set(SharedStore(str(tmp_path), num_shards=4).view(
+        'pub_info', 'loaded')) == set(loaded)